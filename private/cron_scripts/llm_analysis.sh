@@ -3,4 +3,4 @@ set -e
 
 source /webapps/project_dir/env/bin/activate
 cd /webapps/project_dir/ai_policy_database/private/site/billscraper
-python manage.py llm_analysis
\ No newline at end of file
+python manage.py llm_analysis && python manage.py build_facets && python manage.py refresh_stats
\ No newline at end of file
@@ -3,4 +3,4 @@ set -e
 
 source /webapps/project_dir/env/bin/activate
 cd /webapps/project_dir/ai_policy_database/private/site/billscraper
-python manage.py populate_db
+python manage.py populate_db && python manage.py build_passages --missing --changed && python manage.py build_facets && python manage.py build_suggestions && python manage.py build_similar && python manage.py build_clusters && python manage.py refresh_stats
@@ -0,0 +1,17 @@
+#!/bin/bash
+set -e
+
+# rotates the search logs once they pass 10MB, keeping 5 old ones. The workers
+# reopen a log when it's moved away (see search/timing.py)
+cd /webapps/project_dir/ai_policy_database/private/site/billscraper/billscraper/logs
+for log in slow.log replay.log; do
+    if [ -f "$log" ] && [ "$(stat -c %s "$log")" -gt 10485760 ]; then
+        rm -f "$log.5"
+        for n in 4 3 2 1; do
+            if [ -f "$log.$n" ]; then
+                mv "$log.$n" "$log.$((n + 1))"
+            fi
+        done
+        mv "$log" "$log.1"
+    fi
+done
@@ -13,4 +13,7 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'billscraper.settings')
 
+#serves the results page with the async view (see ASYNC_RESULTS in the settings file)
+os.environ.setdefault('ASYNC_RESULTS', '1')
+
 application = get_asgi_application()
@@ -54,6 +54,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    #times searches by phase for the slow and replay logs (see search/timing.py)
+    'search.middleware.SearchTimingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -102,18 +104,132 @@ DATABASES = {
 #whoosh index configuration with haystack
 HAYSTACK_CONNECTIONS = {
     'default': {
-        'ENGINE': 'haystack.backends.whoosh_backend.WhooshEngine',
+        'ENGINE': 'search.backends.BillWhooshEngine',
         'PATH': os.path.join(os.path.dirname(__file__), 'whoosh_index'),
         'WHOOSH_ANALYZER': 'whoosh.analysis.StemmingAnalyzer',
         'WHOOSH_FRAGMENTER': 'whoosh.highlight.SentenceFragmenter(charlimit=300)',
         'EXTRA': {
             'scorer': scoring.BM25F(),  # Specify the BM25F scoring algorithm
-        }
+            #seconds a search runs before showing the results found so far, and
+            #most index terms a wildcard/prefix/fuzzy term expands to (see search/backends.py)
+            'time_limit': 5,
+            'max_expansions': 500,
+        },
+        'EXCLUDED_INDEXES': ['search.search_indexes.BillPassageIndex'],
+    },
+    #sections of long documents, searched separately when PASSAGE_SEARCH is on
+    #(built with python manage.py build_passages)
+    'passages': {
+        'ENGINE': 'search.backends.BillWhooshEngine',
+        'PATH': os.path.join(os.path.dirname(__file__), 'whoosh_passages_index'),
+        'WHOOSH_ANALYZER': 'whoosh.analysis.StemmingAnalyzer',
+        'EXTRA': {
+            'scorer': scoring.BM25F(),
+            'time_limit': 5,
+            'max_expansions': 500,
+        },
+        'EXCLUDED_INDEXES': ['search.search_indexes.BillIndex'],
     },
 }
 
+#column store of bill metadata used for the sidebar's counts (rebuilt with
+#python manage.py build_facets)
+FACETS_PATH = os.path.join(os.path.dirname(__file__), 'facets')
+
+#prefix index behind the search box's suggestions (rebuilt with python
+#manage.py build_suggestions)
+SUGGEST_PATH = os.path.join(os.path.dirname(__file__), 'suggestions')
+
+#hashed word vectors of every bill behind /search/similar (rebuilt with python
+#manage.py build_similar)
+SIMILAR_PATH = os.path.join(os.path.dirname(__file__), 'similar')
+
+#minhash signatures of every bill used to group near-identical ones (rebuilt
+#with python manage.py build_clusters). With COLLAPSE_CLUSTERS on, only the
+#first bill of a group is shown in the results, with the others listed under it
+#(see search/clusters.py)
+CLUSTERS_PATH = os.path.join(os.path.dirname(__file__), 'clusters')
+COLLAPSE_CLUSTERS = True
+
+#lock files that let one worker run a search while the others running the
+#same search at the same time wait for its result (see search/coalesce.py)
+COALESCE_PATH = os.path.join(os.path.dirname(__file__), 'coalesce')
+
+#sqlite copy of the database for offline use (rebuilt nightly with python
+#manage.py build_snapshot)
+SNAPSHOT_PATH = os.path.join(os.path.dirname(__file__), 'snapshot', 'ai_policy_database.sqlite3')
+
 #updates index automatically when content is added
-HAYSTACK_SIGNAL_PROCESSOR = 'haystack.signals.RealtimeSignalProcessor'
+HAYSTACK_SIGNAL_PROCESSOR = 'search.signals.BillSignalProcessor'
+
+#llm score (1-5) needed to assign a category/sector, per field (default 3, see
+#search/labels.py). Run python manage.py update_labels after changing these
+LABEL_THRESHOLDS = {}
+
+#answer requests without a text query (filters and sorting only) from postgres
+#instead of the whoosh index
+DATABASE_FILTER_QUERIES = True
+
+#engine that answers text queries: 'whoosh' (the haystack index) or 'postgres'
+#(the search_vector column, compare them with python manage.py benchmark_search)
+SEARCH_ENGINE = 'whoosh'
+
+#searches sorted by relevance match sections of each document instead of the
+#whole text, ranking each item by its best section and linking to it (needs
+#python manage.py build_passages, only used with the whoosh engine)
+PASSAGE_SEARCH = False
+
+#how much each signal raises a bill's text relevance (see search/scoring.py).
+#All 0 is plain BM25F. Only the category boost ranks the labeled queries in
+#search/fixtures better (see ranking_evaluation.txt there), recency and keywords
+#made them worse, so only change these after evaluate_ranking shows an improvement
+RELEVANCE_WEIGHTS = {
+    'recency': 0,
+    'recency_half_life': 365,
+    'keywords': 0,
+    'category': 1,
+}
+
+#rendered result cards are kept in each worker's memory, keyed by the bill's
+#id and when it was last saved (see results.html), so a results page is mostly
+#cache lookups. Compare with python manage.py benchmark_render.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'result_cards': {
+        'BACKEND': 'search.timing.TimedLocMemCache',
+        'LOCATION': 'result_cards',
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 2000},
+    },
+}
+
+#searches slower than this (in milliseconds) are written to the slow log with
+#how long each phase took, and this fraction of all searches is written to the
+#replay log for python manage.py load_test (both files in SEARCH_LOG_PATH, rotated
+#by private/cron_scripts/rotate_search_logs.sh)
+SEARCH_LOG_PATH = os.path.join(os.path.dirname(__file__), 'logs')
+SLOW_SEARCH_MS = 1000
+SEARCH_REPLAY_SAMPLE = 0.1
+
+#sends how long each phase of the results and home pages took in a
+#Server-Timing header to staff (shown in the browser's developer tools). Staff
+#can also add ?_explain=1 to a results url for a json breakdown of the search
+SERVER_TIMING = False
+
+#whether the results page is served by the async view, which runs the count,
+#page, highlights, bill loading and sidebar counts of a search at the same time
+#in a pool of SEARCH_THREADS threads per worker. On when running under ASGI
+#(asgi.py sets ASYNC_RESULTS=1, e.g. gunicorn -k uvicorn.workers.UvicornWorker
+#billscraper.asgi), off under WSGI
+ASYNC_RESULTS = os.environ.get('ASYNC_RESULTS') == '1'
+SEARCH_THREADS = 8
+
+#most milliseconds a new worker may spend importing the site, and answering
+#its first request when forked from a preloaded master (see gunicorn.conf.py),
+#checked by python manage.py check_startup
+STARTUP_BUDGET_MS = {'imports': 1000, 'first_request': 500}
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
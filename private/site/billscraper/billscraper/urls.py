@@ -20,10 +20,18 @@ import haystack
 from django.views.generic.base import RedirectView
 from django.contrib.staticfiles.storage import staticfiles_storage
 
+from search import api
+
 urlpatterns = [
     path("search/", include("search.urls")),
     path("admin/", admin.site.urls),
 
+    #json api for scripts (see search/api.py)
+    path("api/v1/bills", api.bills, name="api_bills"),
+    path("api/v1/bills/export", api.export, name="api_export"),
+    path("api/v1/stats", api.stats, name="api_stats"),
+    path("api/v1/metrics", api.metrics, name="api_metrics"),
+
     #make the default page redirect to search/home
     path('', RedirectView.as_view(url='https://aipolicydatabase.com/search/home', permanent=True)),
 
@@ -0,0 +1,20 @@
+#gunicorn settings, read automatically when gunicorn is started from this
+#directory (gunicorn billscraper.wsgi, or billscraper.asgi with
+#-k uvicorn.workers.UvicornWorker)
+
+import gc
+
+#the app is imported once in the master process before the workers are forked,
+#instead of by every worker when it starts
+preload_app = True
+
+#opens the indexes and loads the caches in the master as well (see
+#search/warmup.py), then moves everything loaded so far out of the garbage
+#collector's reach so collections in the workers don't write to (and copy) the
+#pages they share with the master
+def when_ready(server):
+    from search.warmup import warm_up
+
+    timings = warm_up()
+    gc.freeze()
+    server.log.info('Warmed up before forking workers: ' + ', '.join(f'{name} {ms}ms' for name, ms in timings.items()))
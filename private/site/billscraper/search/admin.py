@@ -3,12 +3,18 @@
 from django.contrib import admin
 
 # Register your models here.
-from .models import Bill
+from .models import Bill, BillContent
+
+#text and keywords in context, edited on the bill's page
+class BillContentInline(admin.StackedInline):
+    model = BillContent
+    can_delete = False
 
 @admin.register(Bill)
 class BillAdmin(admin.ModelAdmin):
+    inlines = [BillContentInline]
     list_display = ('title', 'state', 'status_date')
     ordering = ('status_date',)
-    search_fields = ('title', 'description', 'text')
+    search_fields = ('title', 'description', 'content__text')
     list_filter = ('status_date', 'state', 'content_collection', 'source')
 
@@ -0,0 +1,184 @@
+#json api for scripts that need every matching item (/api/v1/bills): the same
+#filters as the results page, the fields asked for, and pages that continue from
+#an opaque cursor so a deep page costs the same as the first one
+
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_GET
+from haystack import connections
+from whoosh.qparser import QueryParserError
+
+from search.models import Bill
+from search.export import CONTENT_FIELDS, FORMATS, export_stream, serialize
+from search.filters import get_filters
+from search.facets import get_store
+from search.labels import CATEGORIES, SECTORS, get_thresholds
+from search.pagination import KeysetPaginator, decode_cursor
+from search.pgsearch import use_postgres, search_bills
+from search.planner import ORDERINGS, bill_queryset
+from search.stats import STATS_TTL, get_stats, stats_refreshed_at
+from search.conditional import page_etag
+from search import coalesce
+from search.timing import phase, record
+
+#fields that can be asked for with ?fields=, text and keyword_instances come
+#from the item's content and categories/sectors are the labels it has (see labels.py)
+MODEL_FIELDS = [field.name for field in Bill._meta.concrete_fields]
+API_FIELDS = [*MODEL_FIELDS, 'categories', 'sectors', *CONTENT_FIELDS]
+
+#fields returned when none are asked for
+DEFAULT_FIELDS = ['id', 'title', 'bill_number', 'state', 'status', 'status_date', 'content_collection', 'url']
+
+#items per page
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+def error(message):
+    return JsonResponse({'error': message}, status=400)
+
+#fields to return from ?fields=a,b,c (None if any of them don't exist)
+def get_fields(params):
+    fields = [field.strip() for field in params.get('fields', '').split(',') if field.strip()]
+    if not fields:
+        return DEFAULT_FIELDS
+    if any(field not in API_FIELDS for field in fields):
+        return None
+    return fields
+
+#bills matching the filters and text query, only loading the columns needed
+#for the fields and the ordering, and whether the text search was cut short by
+#the index's limits (see backends.py). after and limit are the sort values the
+#page starts after and its number of rows, when only one page is read
+def api_queryset(filters, ordering, searched, fields, after=None, limit=None):
+    columns = {'id', *(field.lstrip('-') for field in ORDERINGS[ordering])}
+    columns.update(field for field in fields if field in MODEL_FIELDS)
+    if 'categories' in fields:
+        columns.update(CATEGORIES)
+    if 'sectors' in fields:
+        columns.update(SECTORS)
+
+    bills = bill_queryset(filters, ordering)
+    content_fields = [field for field in fields if field in CONTENT_FIELDS]
+    if content_fields:
+        bills = bills.select_related('content')
+        columns.update(f'content__{field}' for field in content_fields)
+    bills = bills.only(*columns)
+
+    #text queries only narrow down the items, they keep the requested ordering
+    partial = False
+    if searched and use_postgres():
+        bills = search_bills(bills, searched)
+    elif searched:
+        backend = connections['default'].get_backend()
+        ids = backend.search_ids(searched)
+        partial = backend.partial
+
+        #the matches are filtered and sorted in the facet store, so only the
+        #page's ids are sent to postgres (bills ingested since the store was
+        #built show up after the next build_facets)
+        store = get_store()
+        if store is not None and limit is not None:
+            ids = store.ordered_ids(filters, ordering, ORDERINGS[ordering], ids, after, limit)
+        bills = bills.filter(id__in=ids)
+
+    return bills, partial
+
+#number of items by jurisdiction, collection, status, month (of the status
+#date), category and sector, as of the last ingestion (see stats.py)
+@require_GET
+def stats(request):
+    response = JsonResponse({'refreshed_at': stats_refreshed_at(), 'stats': get_stats()})
+    patch_cache_control(response, public=True, max_age=STATS_TTL)
+    return response
+
+#counters of the worker that answers, like how often identical searches
+#shared one run of the search (see coalesce.py)
+@require_GET
+def metrics(request):
+    response = JsonResponse({'coalescing': coalesce.metrics()})
+    patch_cache_control(response, no_cache=True)
+    return response
+
+#a page of items: ?q= text query, sidebar filters (collection, jurisdiction,
+#status, category, sector, start_date, end_date), ?sort= one of the results
+#page's orderings, ?fields=, ?limit= and ?cursor= from the previous page's next_cursor.
+#partial is true when the text query took too long and only some matches were kept.
+#Clients polling with If-None-Match get a 304 until the index changes
+@require_GET
+@condition(etag_func=page_etag)
+def bills(request):
+    params = request.GET
+
+    ordering = params.get('sort', 'newest')
+    if ordering not in ORDERINGS:
+        return error(f"sort must be one of {', '.join(ORDERINGS)}")
+
+    fields = get_fields(params)
+    if fields is None:
+        return error(f"fields must be from {', '.join(API_FIELDS)}")
+
+    try:
+        limit = int(params.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        return error('limit must be a number')
+    limit = min(max(limit, 1), MAX_LIMIT)
+
+    cursor = params.get('cursor')
+    after = decode_cursor(cursor, Bill, ORDERINGS[ordering])
+    if cursor and after is None:
+        return error('cursor is invalid for this sort')
+
+    #the paginator reads one more row to know whether there's a next page
+    try:
+        bills, partial = api_queryset(get_filters(params), ordering, params.get('q', '').strip(), fields, after, limit + 1)
+    except QueryParserError:
+        return error('q could not be parsed')
+
+    thresholds = get_thresholds()
+    paginator = KeysetPaginator(bills, ORDERINGS[ordering], per_page=limit, wrap=lambda bill: serialize(bill, fields, thresholds))
+    with phase('db'):
+        results, next_cursor = paginator.rows_after(cursor)
+    record('results', len(results))
+
+    next_url = None
+    if next_cursor:
+        next_params = params.copy()
+        next_params['cursor'] = next_cursor
+        next_url = request.build_absolute_uri('?' + next_params.urlencode())
+
+    return JsonResponse({'results': results, 'next_cursor': next_cursor, 'next': next_url, 'partial': partial})
+
+#every matching item as a file: the same parameters as bills plus ?format=
+#(ndjson or csv) and ?gzip=1, without limit or cursor
+@require_GET
+def export(request):
+    params = request.GET
+
+    ordering = params.get('sort', 'newest')
+    if ordering not in ORDERINGS:
+        return error(f"sort must be one of {', '.join(ORDERINGS)}")
+
+    fields = get_fields(params)
+    if fields is None:
+        return error(f"fields must be from {', '.join(API_FIELDS)}")
+
+    file_format = params.get('format', 'ndjson')
+    if file_format not in FORMATS:
+        return error(f"format must be one of {', '.join(FORMATS)}")
+    compress = params.get('gzip') in ('1', 'true')
+
+    try:
+        bills, partial = api_queryset(get_filters(params), ordering, params.get('q', '').strip(), fields)
+    except QueryParserError:
+        return error('q could not be parsed')
+    bills = bills.order_by(*ORDERINGS[ordering])
+
+    stream = export_stream(bills, fields, file_format, compress)
+    content_type, extension = FORMATS[file_format]
+    filename = f"bills.{extension}{'.gz' if compress else ''}"
+    response = StreamingHttpResponse(stream, content_type='application/gzip' if compress else content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    #the file is streamed, so a text query cut short is only flagged in a header
+    if partial:
+        response['X-Partial-Results'] = 'true'
+    return response
@@ -0,0 +1,489 @@
+#whoosh backend used by haystack, extended with what the site needs beyond
+#haystack's defaults (configured as the ENGINE in HAYSTACK_CONNECTIONS)
+
+import itertools
+
+from haystack.backends.whoosh_backend import WhooshEngine, WhooshSearchBackend, WhooshSearchQuery
+from haystack.constants import DJANGO_ID
+
+from whoosh.collectors import CollapseCollector, FilterCollector, TimeLimit, TimeLimitCollector, UnsortedCollector
+from whoosh.fields import ID as WHOOSH_ID, NUMERIC, STORED, TEXT
+from whoosh.index import FileIndex
+from whoosh.qparser import FuzzyTermPlugin, QueryParser
+from whoosh.query import ExpandingTerm, NullQuery, NumericRange, Or, PatternQuery, Term
+from whoosh.searching import Searcher
+from whoosh.writing import AsyncWriter
+
+from search.highlighting import best_passages, passage_snippets
+from search.scoring import SignalWeighting
+from search.timing import phase
+
+#most query terms (after expanding wildcards) looked up when highlighting
+MAX_HIGHLIGHT_TERMS = 50
+
+#defaults for the 'time_limit' (seconds a search collects matches for) and
+#'max_expansions' (index terms a wildcard, prefix or fuzzy term can match) in
+#the connection's EXTRA settings
+DEFAULT_TIME_LIMIT = 5
+DEFAULT_MAX_EXPANSIONS = 500
+
+
+#replaces each wildcard, prefix and fuzzy term with the first max_expansions
+#terms it matches in the index. Returns the new query and whether any were cut short
+def limit_expansions(query, reader, max_expansions):
+    cut_short = False
+
+    def limit(node):
+        nonlocal cut_short
+        if not isinstance(node, (PatternQuery, ExpandingTerm)):
+            return node
+        if node.fieldname not in reader.schema:
+            return NullQuery
+
+        field = reader.schema[node.fieldname]
+        texts = list(itertools.islice(node._btexts(reader), max_expansions + 1))
+        if len(texts) > max_expansions:
+            cut_short = True
+            texts = texts[:max_expansions]
+        return Or([Term(node.fieldname, field.from_bytes(text)) for text in texts], boost=node.boost)
+
+    return query.accept(limit), cut_short
+
+
+class MatchTimeLimitCollector(TimeLimitCollector):
+    #also checks the time for each match collected, since a collector that
+    #collapses matches collects them itself without going through
+    #collect_matches (where TimeLimitCollector checks it)
+    def collect(self, sub_docnum):
+        if self.timedout:
+            raise TimeLimit
+        self.child.collect(sub_docnum)
+
+
+class MatchFilterCollector(FilterCollector):
+    #filters the matches themselves, so a collapsing collector around it only
+    #sees the allowed documents (whoosh filters around the collapsing instead,
+    #which then never sees the matches). Also keeps every match from before
+    #filtering in unfiltered, when the collector below sees them all (one that
+    #skips blocks by score doesn't)
+    def prepare(self, top_searcher, q, context):
+        super().prepare(top_searcher, q, context)
+        self.unfiltered = []
+
+    def matches(self):
+        _allow = self._allow
+        _restrict = self._restrict
+        if not self.child.computes_count():
+            self.unfiltered = None
+        for sub_docnum in self.child.matches():
+            global_docnum = self.offset + sub_docnum
+            if self.unfiltered is not None:
+                self.unfiltered.append(global_docnum)
+            if (_allow is not None and global_docnum not in _allow) or (_restrict is not None and global_docnum in _restrict):
+                continue
+            yield sub_docnum
+
+    def collect_matches(self):
+        for sub_docnum in self.matches():
+            self.collect(sub_docnum)
+
+    def computes_count(self):
+        return False
+
+    #the hits are counted through this collector, which knows which were filtered
+    def results(self):
+        results = self.child.results()
+        results.collector = self
+        return results
+
+
+class ColumnCollapseCollector(CollapseCollector):
+    #collapses on an integer column (see build_schema), also when counting and
+    #listing every match (whoosh only collapses the documents it collects, and
+    #can't list them through a wrapped collector)
+    def __init__(self, child, fieldname, **kwargs):
+        super().__init__(child, fieldname, **kwargs)
+        self.fieldname = fieldname
+
+    def all_ids(self):
+        keys = self.top_searcher.reader().column_reader(self.fieldname)
+        seen = set()
+        for docnum in sorted(self.child.all_ids()):
+            if keys[docnum] not in seen:
+                seen.add(keys[docnum])
+                yield docnum
+
+    def count(self):
+        return sum(1 for _ in self.all_ids())
+
+
+#the matches a MatchFilterCollector in a chain of collectors kept from before
+#filtering, None if there isn't one or it didn't see them all
+def unfiltered_matches(collector):
+    while collector is not None:
+        if isinstance(collector, MatchFilterCollector):
+            return collector.unfiltered
+        collector = getattr(collector, 'child', None)
+    return None
+
+
+class TimedQueryParser(QueryParser):
+    #query parser whose time is counted as the parse phase (see timing.py)
+    def parse(self, text, **kwargs):
+        with phase('parse'):
+            return super().parse(text, **kwargs)
+
+
+class LimitedSearcher(Searcher):
+    #searcher that stops collecting matches after time_limit seconds (keeping
+    #what it found) and limits how far wildcards expand, calling on_limit when
+    #either cuts a search short. Set by WeightedIndex after it's created since
+    #whoosh also creates one per segment
+    time_limit = None
+    max_expansions = None
+    on_limit = None
+
+    #(query, docnums) of the last docs_for_query
+    matched = None
+
+    #integer column whose value matches are collapsed on (one result per value)
+    collapse = None
+
+    #only pages are collapsed: haystack also searches for the documents its
+    #results are narrowed to, which must all be kept
+    def search_page(self, query, pagenum, pagelen=10, **kwargs):
+        if self.collapse:
+            kwargs.setdefault('collapse', self.collapse)
+        return super().search_page(query, pagenum, pagelen, **kwargs)
+
+    #filters inside the collapsing (see MatchFilterCollector)
+    def collector(self, collapse=None, collapse_limit=1, collapse_order=None, filter=None, mask=None, **kwargs):
+        collector = super().collector(**kwargs)
+        if filter or mask:
+            collector = MatchFilterCollector(collector, filter, mask)
+        if collapse:
+            collector = ColumnCollapseCollector(collector, collapse, limit=collapse_limit, order=collapse_order)
+        return collector
+
+    def search(self, q, **kwargs):
+        collector = self.collector(**kwargs)
+        self.search_with_collector(q, collector)
+        results = collector.results()
+        #whoosh counts the results (and lists every matching document) with the
+        #innermost collector, which doesn't know which were collapsed
+        if isinstance(collector, ColumnCollapseCollector):
+            results.collector = collector
+        return results
+
+    def search_with_collector(self, q, collector, context=None):
+        if self.max_expansions:
+            q, cut_short = limit_expansions(q, self.reader(), self.max_expansions)
+            if cut_short:
+                self.limit_reached()
+
+        if self.time_limit:
+            #checks the time between matches instead of using a signal, which
+            #only works in the main thread. A collapsing collector is kept on
+            #the outside so it still decides which matches are kept
+            if isinstance(collector, CollapseCollector):
+                collector.child = MatchTimeLimitCollector(collector.child, self.time_limit, use_alarm=False)
+            else:
+                collector = MatchTimeLimitCollector(collector, self.time_limit, use_alarm=False)
+
+        with phase('whoosh'):
+            try:
+                super().search_with_collector(q, collector, context)
+            except TimeLimit:
+                self.limit_reached()
+            finally:
+                #the query's matches were all seen while filtering them, so
+                #docs_for_query doesn't have to run it again
+                unfiltered = unfiltered_matches(collector)
+                if unfiltered is not None:
+                    self.matched = (q, unfiltered)
+
+    def limit_reached(self):
+        if self.on_limit:
+            self.on_limit()
+
+    #keeps the documents matching the last query, so counting a page's hits and
+    #reading every matching id (see BillWhooshSearchBackend.collect_ids) only
+    #runs the query once (or not at all when they were kept while filtering)
+    def docs_for_query(self, q, for_deletion=False):
+        if self.matched is not None and self.matched[0] is q:
+            return iter(self.matched[1])
+        docnums = list(super().docs_for_query(q, for_deletion))
+        self.matched = (q, docnums)
+        return iter(docnums)
+
+
+class WeightedIndex(FileIndex):
+    #index whose searchers score with the given weighting model (haystack opens
+    #searchers without one, which is always plain BM25F) and have the backend's
+    #limits (see LimitedSearcher)
+    def __init__(self, storage, schema, indexname, weighting, time_limit=None, max_expansions=None, on_limit=None):
+        super().__init__(storage, schema, indexname)
+        self.weighting = weighting
+        self.time_limit = time_limit
+        self.max_expansions = max_expansions
+        self.on_limit = on_limit
+        #set by the backend for the search it's running
+        self.collapse = None
+
+    def searcher(self, **kwargs):
+        kwargs.setdefault('weighting', self.weighting)
+        searcher = LimitedSearcher(self.reader(), fromindex=self, **kwargs)
+        searcher.time_limit = self.time_limit
+        searcher.max_expansions = self.max_expansions
+        searcher.on_limit = self.on_limit
+        searcher.collapse = self.collapse
+        return searcher
+
+
+class BillWhooshSearchBackend(WhooshSearchBackend):
+
+    #the 'scorer' in the connection's EXTRA settings is used for the text,
+    #combined with each bill's signals (see scoring.py), and searches are
+    #limited by its 'time_limit' and 'max_expansions' (see LimitedSearcher)
+    def __init__(self, connection_alias, **connection_options):
+        super().__init__(connection_alias, **connection_options)
+        extra = connection_options.get('EXTRA', {})
+        self.scorer = extra.get('scorer')
+        self.time_limit = extra.get('time_limit', DEFAULT_TIME_LIMIT)
+        self.max_expansions = extra.get('max_expansions', DEFAULT_MAX_EXPANSIONS)
+
+        #whether the last search was cut short by a limit (backends aren't
+        #shared between threads)
+        self.partial = False
+
+        #with collect_ids set, searches also keep the database ids of every
+        #document they matched in matching_ids (see BillWhooshSearchQuery)
+        self.collect_ids = False
+        self.matching_ids = None
+
+        #integer field searches keep one match per value of (see BillWhooshSearchQuery)
+        self.collapse = None
+
+    def setup(self):
+        super().setup()
+        self.parser = TimedQueryParser(self.content_field_name, schema=self.schema)
+        self.parser.add_plugins([FuzzyTermPlugin])
+        self.index = WeightedIndex(self.storage, self.schema, self.index.indexname, self.weighting(),
+            self.time_limit, self.max_expansions, self.limit_reached)
+
+    def limit_reached(self):
+        self.partial = True
+
+    def search(self, query_string, **kwargs):
+        if not self.setup_complete:
+            self.setup()
+        self.partial = False
+        self.matching_ids = None
+        self.index.collapse = self.collapse
+        try:
+            return super().search(query_string, **kwargs)
+        finally:
+            self.index.collapse = None
+
+    def weighting(self, weights=None):
+        return SignalWeighting(self.scorer, weights, self.content_field_name)
+
+    def build_schema(self, fields):
+        content_field_name, schema = super().build_schema(fields)
+
+        #keep the database id in a column so matching ids can be read without
+        #loading each document's stored fields
+        schema.remove(DJANGO_ID)
+        schema.add(DJANGO_ID, WHOOSH_ID(stored=True, sortable=True))
+
+        #the full document text is only searched, results are loaded from the
+        #database and highlighted from passages of their text (see highlighting.py)
+        content = schema[content_field_name]
+        schema.remove(content_field_name)
+        schema.add(content_field_name, TEXT(analyzer=content.analyzer, field_boost=content.format.field_boost, spelling=True))
+
+        for field_name, field_class in fields.items():
+            #fields marked indexed=False are only kept for display
+            if not field_class.indexed and not field_class.is_multivalued:
+                schema.remove(field_class.index_fieldname)
+                schema.add(field_class.index_fieldname, STORED())
+
+            #integers are also kept in columns so they can be sorted and grouped
+            #on without loading stored fields
+            elif field_class.field_type == 'integer':
+                schema.remove(field_class.index_fieldname)
+                schema.add(field_class.index_fieldname, NUMERIC(stored=field_class.stored, numtype=int, field_boost=field_class.boost, sortable=True))
+
+        return (content_field_name, schema)
+
+    #returns the database ids of every document matching a raw whoosh query
+    #(no scoring or sorting, used to intersect text searches with other filters).
+    #Limited like other searches, partial says whether it was cut short
+    def search_ids(self, query_string):
+        if not self.setup_complete:
+            self.setup()
+        self.partial = False
+
+        parsed_query = self.parser.parse(query_string)
+        if parsed_query is None:
+            return []
+
+        self.index = self.index.refresh()
+        with self.index.searcher() as searcher:
+            #keeps what it collected when the time limit stops it
+            collector = UnsortedCollector()
+            searcher.search_with_collector(parsed_query, collector)
+            ids = searcher.reader().column_reader(DJANGO_ID)
+            with phase('whoosh'):
+                return [int(ids[docnum]) for _, docnum in collector.items]
+
+    #database ids of the best matches of a raw whoosh query, scored with the
+    #given weights instead of the ones in settings (used to compare rankings)
+    def ranked_ids(self, query_string, limit=10, weights=None):
+        if not self.setup_complete:
+            self.setup()
+
+        parsed_query = self.parser.parse(query_string)
+        if parsed_query is None:
+            return []
+
+        with self.index.searcher(weighting=self.weighting(weights)) as searcher:
+            results = searcher.search(parsed_query, limit=limit)
+            ids = searcher.reader().column_reader(DJANGO_ID)
+            return [int(ids[hit.docnum]) for hit in results]
+
+    #removes every document whose integer field has one of the given values
+    def remove_by(self, field, values):
+        if not self.setup_complete:
+            self.setup()
+
+        self.index = self.index.refresh()
+        writer = AsyncWriter(self.index)
+        for value in values:
+            writer.delete_by_query(NumericRange(field, value, value))
+        writer.commit()
+
+    #(database id, collapse_field value) of the documents matching a raw whoosh
+    #query, best match first, keeping only the best document for each value of
+    #collapse_field (an integer field)
+    def search_collapsed(self, query_string, collapse_field):
+        if not self.setup_complete:
+            self.setup()
+        self.partial = False
+
+        parsed_query = self.parser.parse(query_string)
+        if parsed_query is None:
+            return []
+
+        self.index = self.index.refresh()
+        with self.index.searcher() as searcher:
+            results = searcher.search(parsed_query, limit=None, collapse=collapse_field)
+            ids = searcher.reader().column_reader(DJANGO_ID)
+            keys = searcher.reader().column_reader(collapse_field)
+            return [(int(ids[docnum]), keys[docnum]) for docnum in (results.docnum(n) for n in range(results.scored_length()))]
+
+    #positions of the query's words in each of the given documents, as
+    #{docnum: [positions of each word]}. Words that match several terms (like
+    #wildcards) are expanded to the terms in the index
+    def term_positions(self, searcher, query, docnums):
+        terms = sorted(query.existing_terms(searcher.reader(), expand=True, fieldname=self.content_field_name))[:MAX_HIGHLIGHT_TERMS]
+        positions = {docnum: [] for docnum in docnums}
+
+        for fieldname, text in terms:
+            matcher = searcher.postings(fieldname, text)
+            for docnum in sorted(docnums):
+                if matcher.is_active() and matcher.id() < docnum:
+                    matcher.skip_to(docnum)
+                if not matcher.is_active():
+                    break
+                if matcher.id() == docnum:
+                    positions[docnum].append(matcher.value_as('positions'))
+
+        return [text.decode() for _, text in terms], positions
+
+    #text samples from the best passages of each bill ({bill id: stored passages})
+    #given the documents ({bill id: docnum}) the query matched
+    def snippets(self, searcher, query, docnums, passages):
+        terms, positions = self.term_positions(searcher, query, list(docnums.values()))
+        spans = {bill_id: best_passages(value, positions.get(docnums.get(bill_id), [])) for bill_id, value in passages.items()}
+        return passage_snippets(spans, terms)
+
+    #highlights each result from its best passages instead of the stored text
+    def _process_results(self, raw_page, highlight=False, query_string='', spelling_query=None, result_class=None, facet_types=None):
+        results = super()._process_results(raw_page, highlight=False, query_string=query_string,
+            spelling_query=spelling_query, result_class=result_class, facet_types=facet_types)
+
+        #every match of the query before it was narrowed, not only the page's
+        #(whoosh found them all to filter and count the hits)
+        if self.collect_ids:
+            with phase('whoosh'):
+                searched = raw_page.results
+                ids = searched.searcher.reader().column_reader(DJANGO_ID)
+                docnums = searched.searcher.docs_for_query(searched.q)
+                self.matching_ids = [int(ids[docnum]) for docnum in docnums]
+
+        if highlight and results['results']:
+            with phase('highlight'):
+                searcher = raw_page.results.searcher
+                ids = searcher.reader().column_reader(DJANGO_ID)
+                docnums = {int(ids[docnum]): docnum for docnum in (raw_page.docnum(n) for n in range(raw_page.pagelen))}
+                passages = {int(result.pk): getattr(result, 'passages', '') for result in results['results']}
+                snippets = self.snippets(searcher, raw_page.results.q, docnums, passages)
+
+                for result in results['results']:
+                    result.highlighted = {self.content_field_name: [snippets.get(int(result.pk), '')]}
+
+        return results
+
+    #highlights of the given bills for a raw whoosh query, the same as a search
+    #with highlighting gives them (for pages whose hits were found without it,
+    #see planner.index_page_async)
+    def highlights(self, query_string, bill_ids):
+        if not self.setup_complete:
+            self.setup()
+
+        parsed_query = self.parser.parse(query_string)
+        if parsed_query is None or not bill_ids:
+            return {}
+
+        with self.index.searcher() as searcher, phase('highlight'):
+            parsed_query, _ = limit_expansions(parsed_query, searcher.reader(), self.max_expansions)
+            docnums, passages = {}, {}
+            for bill_id in bill_ids:
+                docnum = searcher.document_number(**{DJANGO_ID: str(bill_id)})
+                if docnum is not None:
+                    docnums[bill_id] = docnum
+                    passages[bill_id] = searcher.stored_fields(docnum).get('passages', '')
+            snippets = self.snippets(searcher, parsed_query, docnums, passages)
+
+        return {bill_id: {self.content_field_name: [snippets.get(bill_id, '')]} for bill_id in docnums}
+
+class BillWhooshSearchQuery(WhooshSearchQuery):
+    #whether any search run by this query was cut short by the backend's limits
+    #(shown as a notice with the results it found)
+    partial = False
+
+    #with collect_ids set, the database ids of every match of the first search
+    #run (haystack searches again for each slice, the later ones don't need them)
+    collect_ids = False
+    matching_ids = None
+
+    #integer field the results keep one match per value of (like the cluster
+    #of near-identical bills, see clusters.py)
+    collapse = None
+
+    def run(self, spelling_query=None, **kwargs):
+        self.backend.collect_ids = self.collect_ids and self.matching_ids is None
+        self.backend.collapse = self.collapse
+        try:
+            super().run(spelling_query, **kwargs)
+        finally:
+            self.backend.collect_ids = False
+            self.backend.collapse = None
+        self.partial = self.partial or self.backend.partial
+        if self.backend.matching_ids is not None:
+            self.matching_ids = self.backend.matching_ids
+
+class BillWhooshEngine(WhooshEngine):
+    backend = BillWhooshSearchBackend
+    query = BillWhooshSearchQuery
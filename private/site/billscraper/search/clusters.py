@@ -0,0 +1,327 @@
+#groups of near-identical bills: many state bills are copies of the same model
+#legislation. Each text is split into overlapping SHINGLE_WORDS-word shingles
+#and summarized by a MinHash signature (a whole batch of bills at once with
+#numpy, hashing every shingle only once), bills whose signatures collide in an
+#LSH band are compared, and the ones agreeing on at least SIMILARITY of their
+#signature are grouped. Signatures are kept between builds so only the bills
+#added or changed since are read again (python manage.py build_clusters). The
+#group is stored on each bill (and in the whoosh index) as cluster_id and used
+#to show one bill per group in results, found by each engine before paging
+
+import os
+import json
+import datetime
+from collections import defaultdict
+
+import numpy as np
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from haystack import connections
+
+from search.models import Bill
+from search.facets import new_build, publish_build, current_build
+from search.pagination import keyset_filter, parse_ordering, reverse_ordering
+
+#bills read from the database and hashed at once
+READ_BATCH = 200
+
+#bills updated per query
+UPDATE_BATCH = 1000
+
+#characters of each text shingled
+MAX_TEXT_CHARS = 100000
+
+#words per shingle, and shingles a text needs to be grouped (shorter texts are
+#mostly placeholders like "text not available" that would all look alike)
+SHINGLE_WORDS = 5
+MIN_SHINGLES = 50
+
+#values in a signature, split into BANDS bands of equal size. Two bills become
+#candidates when all the values of one band are the same, which happens for
+#most pairs above about (1 / BANDS) ** (BANDS / SIGNATURE_SIZE) = 0.71 similarity
+SIGNATURE_SIZE = 128
+BANDS = 16
+
+#share of the signature two bills must agree on to be grouped (estimates the
+#share of shingles they have in common)
+SIMILARITY = 0.8
+
+#signature value of a bin no shingle fell in
+EMPTY = np.uint32(0xFFFFFFFF)
+
+#random constants of the hash functions, fixed so signatures from different
+#builds can be compared
+_random = np.random.default_rng(20241019)
+WORD_BASE = np.uint64(_random.integers(2 ** 62, dtype=np.uint64) | 1)
+WORD_BASE_INVERSE = np.uint64(pow(int(WORD_BASE), -1, 2 ** 64))
+SHINGLE_MULTIPLIERS = _random.integers(2 ** 62, size=SHINGLE_WORDS, dtype=np.uint64) | np.uint64(1)
+BAND_MULTIPLIERS = _random.integers(2 ** 62, size=SIGNATURE_SIZE // BANDS, dtype=np.uint64) | np.uint64(1)
+DENSIFY_OFFSET = np.uint32(_random.integers(2 ** 31, dtype=np.uint32) | 1)
+
+#number of low bits a shingle hash is shifted by to get the bin it falls in
+BIN_SHIFT = np.uint64(64 - int(np.log2(SIGNATURE_SIZE)))
+
+def clusters_path():
+    return settings.CLUSTERS_PATH
+
+#(hash of every word, position of the text it's in) of a list of texts. Words
+#are runs of letters and digits, hashed as polynomials of their characters from
+#prefix sums over the whole batch (everything modulo 2^64, WORD_BASE is odd so
+#its powers can be divided by)
+def word_hashes(texts):
+    encoded = [(text or '')[:MAX_TEXT_CHARS].lower().encode('ascii', 'ignore') for text in texts]
+    chars = np.frombuffer(b' '.join(encoded), dtype=np.uint8)
+    text_starts = np.cumsum([0] + [len(text) + 1 for text in encoded[:-1]])
+
+    alnum = ((chars >= ord('a')) & (chars <= ord('z'))) | ((chars >= ord('0')) & (chars <= ord('9')))
+    edges = np.diff(alnum.astype(np.int8), prepend=np.int8(0), append=np.int8(0))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+    powers = np.ones(len(chars) + 1, dtype=np.uint64)
+    np.cumprod(np.full(len(chars), WORD_BASE), out=powers[1:])
+    inverse_powers = np.ones(len(chars) + 1, dtype=np.uint64)
+    np.cumprod(np.full(len(chars), WORD_BASE_INVERSE), out=inverse_powers[1:])
+    prefix = np.zeros(len(chars) + 1, dtype=np.uint64)
+    np.cumsum(chars * powers[:-1], out=prefix[1:])
+
+    hashes = (prefix[ends] - prefix[starts]) * inverse_powers[starts]
+    return hashes, np.searchsorted(text_starts, starts, side='right') - 1
+
+#mixes the bits of 64-bit hashes (the splitmix64 finalizer)
+def mix(hashes):
+    hashes = hashes ^ (hashes >> np.uint64(30))
+    hashes = hashes * np.uint64(0xBF58476D1CE4E5B9)
+    hashes = hashes ^ (hashes >> np.uint64(27))
+    hashes = hashes * np.uint64(0x94D049BB133111EB)
+    return hashes ^ (hashes >> np.uint64(31))
+
+#(hash of every shingle, position of the text it's in) of a list of texts
+def shingle_hashes(texts):
+    words, positions = word_hashes(texts)
+    count = max(len(words) - SHINGLE_WORDS + 1, 0)
+
+    hashes = np.zeros(count, dtype=np.uint64)
+    for offset in range(SHINGLE_WORDS):
+        hashes += words[offset:offset + count] * SHINGLE_MULTIPLIERS[offset]
+
+    #leaves out the shingles spanning two texts
+    within = positions[:count] == positions[SHINGLE_WORDS - 1:SHINGLE_WORDS - 1 + count]
+    return mix(hashes[within]), positions[:count][within]
+
+#MinHash signatures of a list of texts (one row each, all EMPTY for texts with
+#fewer than MIN_SHINGLES shingles). Uses one permutation: every shingle is
+#hashed once, its top bits pick one of SIGNATURE_SIZE bins and the bin keeps
+#the lowest of the other bits. Empty bins then borrow from the next bin that
+#isn't (see densify)
+def signatures(texts):
+    hashes, positions = shingle_hashes(texts)
+
+    result = np.full((len(texts), SIGNATURE_SIZE), EMPTY, dtype=np.uint32)
+    bins = (hashes >> BIN_SHIFT).astype(np.int64)
+    values = (hashes & np.uint64(0xFFFFFFFE)).astype(np.uint32)
+    np.minimum.at(result, (positions, bins), values)
+
+    short = np.bincount(positions, minlength=len(texts)) < MIN_SHINGLES
+    result[short] = EMPTY
+    return densify(result)
+
+#fills the empty bins of signatures with the value of the next bin to the right
+#that isn't (wrapping around) plus DENSIFY_OFFSET for each bin skipped, so two
+#texts with the same shingles in that bin still agree on it
+def densify(signatures):
+    filled = signatures != EMPTY
+    rows = np.flatnonzero(filled.any(axis=1) & ~filled.all(axis=1))
+    if not len(rows):
+        return signatures
+
+    #for every bin, the first filled bin at or after it in the row repeated twice
+    doubled = np.concatenate([filled[rows], filled[rows]], axis=1)
+    positions = np.where(doubled, np.arange(2 * SIGNATURE_SIZE), 2 * SIGNATURE_SIZE)
+    following = np.minimum.accumulate(positions[:, ::-1], axis=1)[:, ::-1][:, :SIGNATURE_SIZE]
+
+    skipped = (following - np.arange(SIGNATURE_SIZE)).astype(np.uint32)
+    borrowed = np.take_along_axis(signatures[rows], following % SIGNATURE_SIZE, axis=1)
+    signatures[rows] = borrowed + skipped * DENSIFY_OFFSET
+    return signatures
+
+#(first, second) positions of the signatures that share a band: every member
+#of a bucket is paired with the first one, which is enough to connect them
+def candidate_pairs(signatures):
+    rows = SIGNATURE_SIZE // BANDS
+    pairs = []
+    for band in range(BANDS):
+        keys = (signatures[:, band * rows:(band + 1) * rows].astype(np.uint64) * BAND_MULTIPLIERS).sum(axis=1)
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        first = np.flatnonzero(np.concatenate([[True], sorted_keys[1:] != sorted_keys[:-1]]))
+        bucket_first = order[np.repeat(first, np.diff(np.append(first, len(order))))]
+        others = bucket_first != order
+        pairs.append(np.stack([bucket_first[others], order[others]], axis=1))
+
+    pairs = np.concatenate(pairs) if pairs else np.zeros((0, 2), dtype=np.int64)
+    return np.unique(pairs, axis=0)
+
+#position of the first member of each one's group, given the pairs of
+#positions that belong together (repeatedly gives both sides of every pair the
+#lower label of the two, then follows labels to their own labels)
+def components(count, pairs):
+    labels = np.arange(count)
+    while len(pairs):
+        lower = np.minimum(labels[pairs[:, 0]], labels[pairs[:, 1]])
+        before = labels.copy()
+        np.minimum.at(labels, pairs[:, 0], lower)
+        np.minimum.at(labels, pairs[:, 1], lower)
+        labels = labels[labels]
+        if np.array_equal(labels, before):
+            break
+    return labels
+
+#{bill id: cluster id} of every bill in a group of near duplicates, given the
+#signatures of the bills in order of id
+def find_clusters(ids, signatures):
+    usable = np.flatnonzero((signatures != EMPTY).any(axis=1))
+    usable_signatures = signatures[usable]
+
+    pairs = candidate_pairs(usable_signatures)
+    agreement = np.zeros(len(pairs))
+    for start in range(0, len(pairs), 100000):
+        batch = pairs[start:start + 100000]
+        agreement[start:start + 100000] = (usable_signatures[batch[:, 0]] == usable_signatures[batch[:, 1]]).mean(axis=1)
+    pairs = pairs[agreement >= SIMILARITY]
+
+    #groups are named after their lowest id (the ids are sorted, so the first member)
+    labels = components(len(usable), pairs)
+    sizes = np.bincount(labels, minlength=len(usable))
+    grouped = sizes[labels] > 1
+    return dict(zip(ids[usable[grouped]].tolist(), ids[usable[labels[grouped]]].tolist()))
+
+#(ids, signatures, built_at) of the current build, None if there isn't one
+def load_build(path):
+    build = current_build(path)
+    if build is None:
+        return None
+
+    build_path = os.path.join(path, build)
+    with open(os.path.join(build_path, 'meta.json'), 'r') as file:
+        meta = json.load(file)
+    return (np.load(os.path.join(build_path, 'ids.npy')), np.load(os.path.join(build_path, 'signatures.npy')),
+        datetime.datetime.fromisoformat(meta['built_at']))
+
+#computes the signatures of the bills added or changed since the last build
+#(every bill if full is set), writes them as a new build, then regroups every
+#bill and saves the cluster_ids that changed. Returns (bills in a group,
+#groups, bills read, bills updated)
+def build_clusters(path=None, full=False):
+    path = path or clusters_path()
+    built_at = timezone.now()
+
+    ids = np.array(sorted(Bill.objects.values_list('id', flat=True)), dtype=np.int64)
+
+    #signatures of the previous build for the bills that haven't changed
+    kept = np.zeros(0, dtype=np.int64)
+    kept_signatures = np.zeros((0, SIGNATURE_SIZE), dtype=np.uint32)
+    previous = None if full else load_build(path)
+    if previous is not None:
+        previous_ids, previous_signatures, previous_built_at = previous
+        changed = Bill.objects.filter(Q(updated_at__gt=previous_built_at) | Q(content__updated_at__gt=previous_built_at)).values_list('id', flat=True)
+        positions = np.flatnonzero(np.isin(previous_ids, ids) & ~np.isin(previous_ids, list(changed)))
+        kept, kept_signatures = previous_ids[positions], previous_signatures[positions]
+
+    #signatures of every other bill
+    to_read = ids[~np.isin(ids, kept)].tolist()
+    read_ids, read_signatures = [], []
+    for batch in range(0, len(to_read), READ_BATCH):
+        rows = Bill.objects.filter(id__in=to_read[batch:batch + READ_BATCH]).values_list('id', 'content__text')
+        batch_ids, texts = zip(*rows) if rows else ((), ())
+        read_ids.extend(batch_ids)
+        read_signatures.append(signatures(texts))
+
+    all_ids = np.concatenate([kept, np.array(read_ids, dtype=np.int64)])
+    all_signatures = np.concatenate([kept_signatures, *read_signatures])
+    order = np.argsort(all_ids, kind='stable')
+    all_ids, all_signatures = all_ids[order], all_signatures[order]
+
+    build, build_path = new_build(path)
+    np.save(os.path.join(build_path, 'ids.npy'), all_ids)
+    np.save(os.path.join(build_path, 'signatures.npy'), all_signatures)
+    with open(os.path.join(build_path, 'meta.json'), 'w') as file:
+        json.dump({'built_at': built_at.isoformat()}, file)
+    publish_build(path, build)
+
+    #only saves the bills whose group changed (updated_at too, so the snapshot
+    #copies them again)
+    clusters = find_clusters(all_ids, all_signatures)
+    current = dict(Bill.objects.exclude(cluster_id=None).values_list('id', 'cluster_id'))
+    changed_ids = [bill_id for bill_id in set(clusters) | set(current) if clusters.get(bill_id) != current.get(bill_id)]
+    updated_at = timezone.now()
+    Bill.objects.bulk_update([Bill(id=bill_id, cluster_id=clusters.get(bill_id), updated_at=updated_at) for bill_id in changed_ids],
+        ['cluster_id', 'updated_at'], batch_size=UPDATE_BATCH)
+
+    #bulk_update skips the signals, so the index is updated here (results are
+    #grouped by the cluster kept in it)
+    backend = connections['default'].get_backend()
+    index = connections['default'].get_unified_index().get_index(Bill)
+    for batch in range(0, len(changed_ids), UPDATE_BATCH):
+        backend.update(index, index.index_queryset().filter(id__in=changed_ids[batch:batch + UPDATE_BATCH]))
+
+    return len(clusters), len(set(clusters.values())), len(read_ids), len(changed_ids)
+
+#field of the whoosh index searches are collapsed on (see BillIndex)
+CLUSTER_FIELD = 'cluster'
+
+#whether results show one bill per group (COLLAPSE_CLUSTERS)
+def collapsing():
+    return getattr(settings, 'COLLAPSE_CLUSTERS', True)
+
+#key bills are grouped by in the whoosh index (see BillIndex.prepare_cluster):
+#the group's cluster_id, or the bill's own id when it isn't in one
+def cluster_key(bill_id, cluster_id):
+    return cluster_id or bill_id
+
+#bills of a filtered queryset that come first in their group in the given
+#ordering (like ('-status_date', '-id')) among the bills of the same queryset,
+#plus every bill that isn't in a group. The others are left out before paging,
+#so every page is full and a group is shown once
+def first_in_cluster(bills, ordering):
+    fields = parse_ordering(ordering)
+    earlier = bills.filter(cluster_id=OuterRef('cluster_id')).filter(
+        keyset_filter(reverse_ordering(ordering), [OuterRef(field) for field, _ in fields]))
+    return bills.filter(Q(cluster_id__isnull=True) | ~Exists(earlier.values('pk')))
+
+#keeps the first of each group in a list of (bill id, cluster_id, ...) matches,
+#best first
+def first_matches(matches):
+    seen = set()
+    kept = []
+    for match in matches:
+        key = cluster_key(match[0], match[1])
+        if key not in seen:
+            seen.add(key)
+            kept.append(match)
+    return kept
+
+#gives each grouped bill of a results page (already one per group) the others
+#of its group (result.similar_bills, with result.other_states set when none
+#of them are from its jurisdiction) to list under it. Does nothing when
+#COLLAPSE_CLUSTERS is off
+def add_cluster_members(page):
+    if not collapsing():
+        return page
+
+    results = list(page.object_list)
+    cluster_ids = {result.object.cluster_id for result in results if result.object.cluster_id is not None}
+    if not cluster_ids:
+        return page
+
+    members = defaultdict(list)
+    for bill in Bill.objects.filter(cluster_id__in=cluster_ids).only('id', 'title', 'url', 'state', 'bill_number', 'cluster_id').order_by('state', 'id'):
+        members[bill.cluster_id].append(bill)
+
+    for result in results:
+        cluster_id = result.object.cluster_id
+        if cluster_id is not None:
+            result.similar_bills = [bill for bill in members[cluster_id] if bill.pk != result.object.pk]
+            result.other_states = all(bill.state != result.object.state for bill in result.similar_bills)
+    return page
@@ -0,0 +1,187 @@
+#single-flight for index searches: when the same search arrives several times at
+#once (like a results link shared in a newsletter), only one request runs it and
+#the others wait for its result. Within a worker the others wait on the first
+#one, across workers (gunicorn's sync workers serve one request each) a lock file
+#in COALESCE_PATH lets one worker run it while the others wait for the lock and
+#read the result it hands off. Nothing is kept for requests that arrive after a
+#search finished, so a result is never reused after the search it came from
+
+import os
+import time
+import json
+import pickle
+import hashlib
+import threading
+
+from django.conf import settings
+
+from search.timing import phase
+
+#file locks aren't available on windows, where only searches within a worker are shared
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+#seconds a request waits for another one's result before running the search itself
+WAIT_TIMEOUT = 10
+
+#seconds between checks of the lock file while waiting for another worker
+POLL_INTERVAL = 0.01
+
+#searches are spread over this many lock files (a fixed number, so the
+#directory doesn't grow). Different searches sharing one only wait on each other
+#when they run at the same moment
+LOCK_SLOTS = 1024
+
+#how often searches were run or shared since the worker started:
+#executed: searches this worker ran
+#joined: requests that waited for a search running in this worker
+#shared: requests that used a result another worker handed off
+#timeouts: requests that gave up waiting and ran the search themselves
+_metrics = {'executed': 0, 'joined': 0, 'shared': 0, 'timeouts': 0}
+_started_at = time.time()
+
+
+class Flight:
+    #a search running in this worker, which other threads can wait for
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_flights = {}
+_lock = threading.Lock()
+
+def count(metric):
+    with _lock:
+        _metrics[metric] += 1
+
+def execute(run):
+    count('executed')
+    return run()
+
+#counts for this worker (see _metrics)
+def metrics():
+    with _lock:
+        return {**_metrics, 'started_at': _started_at}
+
+#directory of the lock files (None if settings don't have one)
+def coalesce_path():
+    return getattr(settings, 'COALESCE_PATH', None)
+
+#key for a search from its kind and arguments (lists, dicts and dates are fine)
+def search_key(kind, *args):
+    return f"search:{kind}:{hashlib.sha1(json.dumps(args, sort_keys=True, default=str).encode()).hexdigest()}"
+
+#result of run() for the key, running it only if no identical search is
+#already running in this worker or another one
+def single_flight(key, run):
+    with _lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = Flight()
+        else:
+            _metrics['joined'] += 1
+
+    if not leader:
+        if flight.done.wait(WAIT_TIMEOUT):
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        count('timeouts')
+        return execute(run)
+
+    try:
+        flight.result = shared_flight(key, run)
+        return flight.result
+    except Exception as error:
+        flight.error = error
+        raise
+    finally:
+        with _lock:
+            del _flights[key]
+        flight.done.set()
+
+#(lock, waiting, result) files of the slot a key is locked with
+def slot_paths(key):
+    path = coalesce_path()
+    os.makedirs(path, exist_ok=True)
+    slot = os.path.join(path, str(int(key.rsplit(':', 1)[-1][:8], 16) % LOCK_SLOTS))
+    return slot + '.lock', slot + '.waiting', slot + '.result'
+
+#takes an exclusive lock on an open file, giving up after timeout seconds
+def wait_for_lock(file, timeout):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(POLL_INTERVAL)
+
+#whether a worker holds the slot's waiting file (only checked by the worker
+#holding the lock, so nothing else takes it exclusively)
+def has_waiters(waiting):
+    try:
+        fcntl.flock(waiting, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    fcntl.flock(waiting, fcntl.LOCK_UN)
+    return False
+
+#result of a search for key that finished after since, None if there isn't one
+def read_result(path, key, since):
+    try:
+        with open(path, 'rb') as file:
+            result_key, finished_at, result = pickle.load(file)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    if result_key != key or finished_at < since:
+        return None
+    return (result,)
+
+def write_result(path, key, result):
+    temp_path = f'{path}.{os.getpid()}'
+    with open(temp_path, 'wb') as file:
+        pickle.dump((key, time.time(), result), file, pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, path)
+
+#runs the search unless another worker is already running it, in which case
+#this one waits for its lock and reads the result it handed off. The worker
+#holding the lock only writes its result when another one is waiting for it
+def shared_flight(key, run):
+    if fcntl is None or coalesce_path() is None:
+        return execute(run)
+
+    lock_path, waiting_path, result_path = slot_paths(key)
+    with open(lock_path, 'a') as lock, open(waiting_path, 'a') as waiting:
+        arrived = time.time()
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            #another worker is running a search in this slot
+            fcntl.flock(waiting, fcntl.LOCK_SH)
+            with phase('cache'):
+                locked = wait_for_lock(lock, WAIT_TIMEOUT)
+            fcntl.flock(waiting, fcntl.LOCK_UN)
+            if not locked:
+                count('timeouts')
+                return execute(run)
+
+            with phase('cache'):
+                shared = read_result(result_path, key, arrived)
+            if shared is not None:
+                count('shared')
+                return shared[0]
+
+        #the lock is released when the file is closed
+        result = execute(run)
+        if has_waiters(waiting):
+            with phase('cache'):
+                write_result(result_path, key, result)
+        return result
@@ -0,0 +1,91 @@
+#validators for conditional GETs: pages and api responses only change when the
+#index does (every time an item is added, changed or removed) or one of the
+#stores built after each ingestion is rebuilt, so a client that sends back the
+#ETag or Last-Modified it got gets a 304 before anything is searched or rendered
+
+import json
+import hashlib
+import datetime
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.views.decorators.http import condition
+from haystack import connections
+
+from search.stats import stats_refreshed_at
+from search.facets import current_build, facets_path
+from search.clusters import clusters_path
+from search.timing import phase
+from search import parallel
+
+#settings that change what a page shows for the same url
+PAGE_SETTINGS = ['SEARCH_ENGINE', 'PASSAGE_SEARCH', 'RELEVANCE_WEIGHTS', 'LABEL_THRESHOLDS', 'DATABASE_FILTER_QUERIES', 'COLLAPSE_CLUSTERS']
+
+#query parameters that don't change the page
+IGNORED_PARAMS = ['csrfmiddlewaretoken']
+
+def index_backend(using='default'):
+    backend = connections[using].get_backend()
+    if not backend.setup_complete:
+        backend.setup()
+    return backend
+
+def index_generation(using='default'):
+    return index_backend(using).index.latest_generation()
+
+#when the index was last written to
+def index_modified(using='default'):
+    index = index_backend(using).index
+    toc = f'_{index.indexname}_{index.latest_generation()}.toc'
+    return datetime.datetime.fromtimestamp(index.storage.file_modified(toc), datetime.timezone.utc)
+
+#the request's parameters in a fixed order without blanks, so urls that only
+#differ in parameter order or empty filters share an ETag
+def canonical_query(params):
+    pairs = sorted(
+        (key, value) for key in params for value in params.getlist(key)
+        if value and key not in IGNORED_PARAMS
+    )
+    return urlencode(pairs)
+
+#connections of the whoosh indexes pages are searched in
+def page_indexes():
+    return ['default', 'passages'] if getattr(settings, 'PASSAGE_SEARCH', False) else ['default']
+
+#builds of the stores pages also read (the sidebar counts and the groups of
+#near-identical bills), named after when they were built. None if never built
+def store_builds():
+    return [current_build(facets_path()), current_build(clusters_path())]
+
+def settings_fingerprint():
+    return json.dumps([getattr(settings, name, None) for name in PAGE_SETTINGS], sort_keys=True, default=str)
+
+def page_etag(request):
+    with phase('cache'):
+        versions = [*(index_generation(using) for using in page_indexes()), *store_builds()]
+        page = hashlib.sha1(f'{request.path}?{canonical_query(request.GET)}|{settings_fingerprint()}|{versions}'.encode()).hexdigest()[:16]
+        return f'{versions[0]}-{page}'
+
+#the end of the last ingestion (when the stats were refreshed, or an index was
+#written to or a store rebuilt if that was later, like when an item is edited
+#in the admin)
+def last_ingestion(request):
+    with phase('cache'):
+        builds = [datetime.datetime.fromtimestamp(int(build) / 1e9, datetime.timezone.utc) for build in store_builds() if build]
+        return max(filter(None, [stats_refreshed_at(), *(index_modified(using) for using in page_indexes()), *builds]), default=None)
+
+#answers GETs for pages with a 304 when the client's copy is still current
+conditional_page = condition(etag_func=page_etag, last_modified_func=last_ingestion)
+
+#conditional_page for async views: the validators are looked up in a search
+#thread first (see parallel.py), since they can query the database
+def async_conditional_page(view):
+    conditional = condition(etag_func=lambda request, *args, **kwargs: request.page_etag,
+        last_modified_func=lambda request, *args, **kwargs: request.last_ingestion)(view)
+
+    @wraps(view)
+    async def inner(request, *args, **kwargs):
+        request.page_etag, request.last_ingestion = await parallel.run(lambda: (page_etag(request), last_ingestion(request)))
+        return await conditional(request, *args, **kwargs)
+    return inner
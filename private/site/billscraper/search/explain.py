@@ -0,0 +1,92 @@
+#?_explain=1 on the results page (for staff): the search that ran, how many
+#items are left after each filter and how long each phase took, as json instead
+#of the page
+
+from django.http import JsonResponse, QueryDict
+from django.utils.cache import patch_cache_control
+from haystack import connections
+
+from search import timing
+from search.backends import limit_expansions
+from search.filters import get_filters
+from search.passages import search_passages
+from search.pgsearch import search_bills
+from search.planner import bill_queryset, get_engine, index_results
+
+#filters in the order they're applied when counting hits per stage
+FILTER_STAGES = ['collection', 'jurisdiction', 'status', 'category', 'sector', 'start_date', 'end_date']
+
+#whether a request asked for an explanation and may have one
+def wants_explain(request):
+    return bool(request.GET.get('_explain')) and request.user.is_staff
+
+#number of items matching the text query and filters with the given engine
+def stage_count(engine, filters, ordering, searched):
+    if engine == 'index':
+        return index_results(filters, ordering, searched).count()
+
+    bills = bill_queryset(filters, ordering)
+    if engine == 'passages':
+        matches, _ = search_passages(searched)
+        return bills.filter(id__in=[bill_id for bill_id, _ in matches]).count()
+    if searched:
+        bills = search_bills(bills, searched)
+    return bills.count()
+
+#hits with no filters, then after adding each filter that's set, in FILTER_STAGES order
+def stage_counts(engine, filters, ordering, searched):
+    applied = get_filters(QueryDict())
+    stages = [{'stage': 'text' if searched else 'all', 'hits': stage_count(engine, applied, ordering, searched)}]
+    for name in FILTER_STAGES:
+        if not filters[name]:
+            continue
+        applied[name] = filters[name]
+        stages.append({'stage': name, 'value': filters[name], 'hits': stage_count(engine, applied, ordering, searched)})
+    return stages
+
+#what each engine ran: the query string haystack sent to whoosh (with the
+#queries narrowing its matches) and the query whoosh searched with (after
+#expanding wildcards), or the sql sent to postgres
+def executed_query(engine, filters, ordering, searched):
+    if engine == 'database':
+        bills = bill_queryset(filters, ordering)
+        if searched:
+            bills = search_bills(bills, searched)
+        return {'sql': str(bills.query)}
+
+    backend = connections['passages' if engine == 'passages' else 'default'].get_backend()
+    if not backend.setup_complete:
+        backend.setup()
+    if engine == 'passages':
+        query_string, narrow_queries = searched, []
+    else:
+        query = index_results(filters, ordering, searched).query
+        query_string, narrow_queries = query.build_query(), sorted(query.narrow_queries)
+    parsed = backend.parser.parse(query_string)
+    if parsed is not None:
+        with backend.index.searcher() as searcher:
+            parsed, _ = limit_expansions(parsed, searcher.reader(), backend.max_expansions)
+    return {'query_string': query_string, 'narrow_queries': narrow_queries, 'whoosh_query': str(parsed)}
+
+#the explanation of a results page that was just computed (its timings are
+#taken before anything is counted here)
+def explain_response(request, filters, ordering, searched, page):
+    timings = timing.current()
+    timings_ms = timings.milliseconds() if timings else {}
+    total_ms = round(timings.elapsed() * 1000, 2) if timings else None
+
+    engine = get_engine(searched, ordering)
+    response = JsonResponse({
+        'query': request.GET.urlencode(),
+        'searched': searched,
+        'ordering': ordering,
+        'engine': engine,
+        'results': page.paginator.count,
+        'partial': getattr(page, 'partial', False),
+        'timings_ms': timings_ms,
+        'total_ms': total_ms,
+        'executed': executed_query(engine, filters, ordering, searched),
+        'stages': stage_counts(engine, filters, ordering, searched),
+    }, json_dumps_params={'indent': 2})
+    patch_cache_control(response, private=True, no_store=True)
+    return response
@@ -0,0 +1,95 @@
+#bulk export of every item matching a search as ndjson or csv. Rows are read
+#from a server-side cursor a chunk at a time and written out as they're read,
+#so memory stays the same for 10 items or the whole database (used by
+#/api/v1/bills/export and python manage.py export_bills)
+
+import io
+import csv
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from search.labels import CATEGORIES, SECTORS, get_labels, get_thresholds
+
+#content type and file extension of each format
+FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+}
+
+#fields read from an item's content instead of the item itself
+CONTENT_FIELDS = ['text', 'keyword_instances']
+
+#rows fetched from the cursor at a time
+CHUNK_ROWS = 2000
+
+#bytes collected before a piece of the file is sent
+BUFFER_BYTES = 64 * 1024
+
+#dictionary of the given fields of a bill (see api.API_FIELDS)
+def serialize(bill, fields, thresholds):
+    row = {}
+    for field in fields:
+        if field in CONTENT_FIELDS:
+            row[field] = getattr(bill.get_content(), field)
+        elif field == 'categories':
+            row[field] = get_labels(bill, CATEGORIES, thresholds)
+        elif field == 'sectors':
+            row[field] = get_labels(bill, SECTORS, thresholds)
+        else:
+            row[field] = getattr(bill, field)
+    return row
+
+def export_rows(bills, fields):
+    thresholds = get_thresholds()
+    for bill in bills.iterator(chunk_size=CHUNK_ROWS):
+        yield serialize(bill, fields, thresholds)
+
+def encode_ndjson(rows, fields):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder).encode() + b'\n'
+
+#one header row then a row per item, lists (labels, keywords in context) are
+#written as json
+def encode_csv(rows, fields):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(fields)
+    for row in rows:
+        writer.writerow([json.dumps(value) if isinstance(value, list) else value for value in row.values()])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+#joins small pieces into pieces of about BUFFER_BYTES
+def buffered(pieces):
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= BUFFER_BYTES:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+def gzipped(pieces):
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for piece in pieces:
+        compressed = compressor.compress(piece)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+#pieces of the export file for an ordered queryset of bills
+def export_stream(bills, fields, file_format='ndjson', compress=False):
+    encode = encode_csv if file_format == 'csv' else encode_ndjson
+    stream = buffered(encode(export_rows(bills, fields), fields))
+    return gzipped(stream) if compress else stream
@@ -0,0 +1,327 @@
+#compact column store of bill metadata used to count the options in the sidebar
+#(rebuilt after each ingestion with python manage.py build_facets, then
+#memory-mapped so every gunicorn worker shares the same pages)
+
+import os
+import json
+import time
+import itertools
+import shutil
+import datetime
+
+import numpy as np
+
+from django.conf import settings
+from haystack import connections
+from whoosh.qparser import QueryParserError
+
+from search.models import Bill
+from search.labels import CATEGORIES, SECTORS, get_thresholds
+from search import pgsearch
+from search import passages
+from search.coalesce import search_key, single_flight
+from search.pagination import parse_ordering
+
+#categorical columns (coded as integers) and the sidebar filter each one backs
+CODED_COLUMNS = {
+    'collection': 'content_collection',
+    'jurisdiction': 'state',
+    'status': 'status',
+}
+
+#score columns in the order they're stored
+SCORE_FIELDS = [*CATEGORIES, *SECTORS]
+
+EPOCH = datetime.date(1970, 1, 1)
+
+#seconds between checks for a newly built store
+RELOAD_INTERVAL = 30
+
+#number of previous builds kept around for workers that still have them mapped
+KEEP_BUILDS = 2
+
+def facets_path():
+    return settings.FACETS_PATH
+
+#converts a date (or yyyy-mm-dd string) to days since 1970, None if invalid
+def to_days(value):
+    if isinstance(value, str):
+        try:
+            value = datetime.date.fromisoformat(value)
+        except ValueError:
+            return None
+    return (value - EPOCH).days
+
+#writes a new build of the store and makes it the current one
+def build_store(path=None):
+    path = path or facets_path()
+
+    fields = ['id', 'status_date', 'last_action_date', 'total_keywords', *CODED_COLUMNS.values(), *SCORE_FIELDS]
+    size = Bill.objects.count()
+    arrays = {
+        'ids': np.zeros(size, dtype=np.int64),
+        'status_date': np.zeros(size, dtype=np.int32),
+        'last_action_date': np.zeros(size, dtype=np.int32),
+        'total_keywords': np.zeros(size, dtype=np.int32),
+        'scores': np.zeros((size, len(SCORE_FIELDS)), dtype=np.uint8),
+        **{name: np.zeros(size, dtype=np.int16) for name in CODED_COLUMNS},
+    }
+
+    #each distinct value of a coded column gets a code when it's first seen
+    codes = {name: {} for name in CODED_COLUMNS}
+
+    #rows are written into the arrays as they're read instead of being kept in
+    #memory (bills added after counting are left for the next build)
+    rows = Bill.objects.order_by('id').values_list(*fields).iterator(chunk_size=5000)
+    num_bills = 0
+    for row in itertools.islice(rows, size):
+        bill_id, status_date, last_action_date, total_keywords, *values = row
+        arrays['ids'][num_bills] = bill_id
+        arrays['status_date'][num_bills] = to_days(status_date)
+        arrays['last_action_date'][num_bills] = to_days(last_action_date)
+        arrays['total_keywords'][num_bills] = total_keywords
+        for name, value in zip(CODED_COLUMNS, values):
+            arrays[name][num_bills] = codes[name].setdefault(value, len(codes[name]))
+        arrays['scores'][num_bills] = values[len(CODED_COLUMNS):]
+        num_bills += 1
+
+    #bills deleted after counting leave rows at the end
+    arrays = {name: array[:num_bills] for name, array in arrays.items()}
+
+    #store each distinct value once, in sorted order, and code every bill with its position
+    vocab = {}
+    for name in CODED_COLUMNS:
+        vocab[name] = sorted(codes[name])
+        positions = np.zeros(len(codes[name]), dtype=np.int16)
+        for position, value in enumerate(vocab[name]):
+            positions[codes[name][value]] = position
+        arrays[name] = positions[arrays[name]]
+    vocab['scores'] = SCORE_FIELDS
+
+    build, build_path = new_build(path)
+    for name, array in arrays.items():
+        np.save(os.path.join(build_path, name + '.npy'), array)
+    with open(os.path.join(build_path, 'vocab.json'), 'w') as file:
+        json.dump(vocab, file)
+    publish_build(path, build)
+
+    return num_bills
+
+#name and directory of a new build under path (written to a new directory so
+#workers never see a half-written build)
+def new_build(path):
+    build = str(time.time_ns())
+    build_path = os.path.join(path, build)
+    os.makedirs(build_path)
+    return build, build_path
+
+#makes a finished build the current one
+def publish_build(path, build):
+    with open(os.path.join(path, 'CURRENT.tmp'), 'w') as file:
+        file.write(build)
+    os.replace(os.path.join(path, 'CURRENT.tmp'), os.path.join(path, 'CURRENT'))
+
+    #remove old builds (workers with them mapped keep their pages until they reload)
+    builds = sorted(name for name in os.listdir(path) if name.isdigit())
+    for old_build in builds[:-KEEP_BUILDS]:
+        shutil.rmtree(os.path.join(path, old_build), ignore_errors=True)
+
+#name of the current build under path, None if nothing has been built
+def current_build(path):
+    try:
+        with open(os.path.join(path, 'CURRENT'), 'r') as file:
+            return file.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+class FacetStore:
+
+    def __init__(self, path):
+        self.ids = np.load(os.path.join(path, 'ids.npy'), mmap_mode='r')
+        self.status_date = np.load(os.path.join(path, 'status_date.npy'), mmap_mode='r')
+        self.last_action_date = np.load(os.path.join(path, 'last_action_date.npy'), mmap_mode='r')
+        self.total_keywords = np.load(os.path.join(path, 'total_keywords.npy'), mmap_mode='r')
+        self.scores = np.load(os.path.join(path, 'scores.npy'), mmap_mode='r')
+        self.coded = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in CODED_COLUMNS}
+
+        with open(os.path.join(path, 'vocab.json'), 'r') as file:
+            self.vocab = json.load(file)
+        self.codes = {name: {value: code for code, value in enumerate(self.vocab[name])} for name in CODED_COLUMNS}
+
+    def __len__(self):
+        return len(self.ids)
+
+    #boolean mask of the bills whose database id is in ids
+    def id_mask(self, ids):
+        mask = np.zeros(len(self), dtype=bool)
+        ids = np.asarray(ids, dtype=np.int64)
+        positions = np.searchsorted(self.ids, ids)
+        found = positions < len(self)
+        positions = positions[found]
+        mask[positions[self.ids[positions] == ids[found]]] = True
+        return mask
+
+    #boolean mask of the bills with a coded value in values
+    def coded_mask(self, name, values):
+        codes = [self.codes[name][value] for value in values if value in self.codes[name]]
+        return np.isin(self.coded[name], codes)
+
+    #boolean mask of the bills labeled with any of the given category/sector fields
+    def label_mask(self, fields, thresholds):
+        columns = [SCORE_FIELDS.index(field) for field in fields if field in SCORE_FIELDS]
+        if not columns:
+            return np.zeros(len(self), dtype=bool)
+        limits = np.array([thresholds[SCORE_FIELDS[column]] for column in columns])
+        return (self.scores[:, columns] >= limits).any(axis=1)
+
+    #masks for each sidebar filter that is set, plus 'base' for filters
+    #that aren't shown with counts (dates, sort restrictions, text query)
+    def filter_masks(self, filters, ordering=None, ids=None, thresholds=None):
+        thresholds = thresholds or get_thresholds()
+        today = to_days(datetime.date.today())
+        base = np.ones(len(self), dtype=bool)
+
+        start_date = to_days(filters['start_date']) if filters['start_date'] else None
+        if start_date is not None:
+            base &= self.status_date >= start_date
+
+        end_date = to_days(filters['end_date']) if filters['end_date'] else None
+        base &= self.status_date <= (end_date if end_date is not None else today)
+
+        #sorting by action only shows legislation
+        if ordering in ('oldest_action', 'newest_action'):
+            base &= self.coded_mask('collection', ['Legislation'])
+        if ordering == 'newest_action':
+            base &= self.last_action_date <= today
+
+        if ids is not None:
+            base &= self.id_mask(ids)
+
+        masks = {'base': base}
+        for name in CODED_COLUMNS:
+            if filters[name]:
+                masks[name] = self.coded_mask(name, filters[name])
+        if filters['category']:
+            masks['category'] = self.label_mask(filters['category'], thresholds)
+        if filters['sector']:
+            masks['sector'] = self.label_mask(filters['sector'], thresholds)
+
+        return masks
+
+    #combines the filter masks, leaving out the one for skip
+    def combine(self, masks, skip=None):
+        mask = masks['base'].copy()
+        for name, filter_mask in masks.items():
+            if name not in ('base', skip):
+                mask &= filter_mask
+        return mask
+
+    #database ids of the bills matching every filter
+    def matching_ids(self, filters, ordering=None, ids=None):
+        return self.ids[self.combine(self.filter_masks(filters, ordering, ids))]
+
+    #database ids of the bills matching every filter, sorted by a keyset
+    #ordering like ('-status_date', '-id') and starting after the sort values in
+    #after (see pagination.py). At most limit of them
+    def ordered_ids(self, filters, ordering, keyset, ids=None, after=None, limit=None):
+        mask = self.combine(self.filter_masks(filters, ordering, ids))
+        columns = {'id': self.ids, 'status_date': self.status_date, 'last_action_date': self.last_action_date, 'total_keywords': self.total_keywords}
+
+        #descending fields are negated so every key sorts ascending
+        fields = parse_ordering(keyset)
+        keys = [columns[field][mask].astype(np.int64) * (-1 if descending else 1) for field, descending in fields]
+
+        #rows after the cursor, compared field by field like keyset_filter
+        rows = np.ones(len(keys[0]), dtype=bool)
+        if after is not None:
+            rows[:] = False
+            equal = np.ones(len(keys[0]), dtype=bool)
+            for key, value, (field, descending) in zip(keys, after, fields):
+                value = to_days(value) if isinstance(value, datetime.date) else int(value)
+                value = -value if descending else value
+                rows |= equal & (key > value)
+                equal &= key == value
+
+        keys = [key[rows] for key in keys]
+        order = np.lexsort(keys[::-1])[:limit]
+        return self.ids[mask][rows][order].tolist()
+
+    #number of matching bills for each option in the sidebar. Each filter is
+    #counted against the other filters only, so the counts show what checking
+    #another box in the same section would add
+    def facet_counts(self, filters, ordering=None, ids=None):
+        thresholds = get_thresholds()
+        masks = self.filter_masks(filters, ordering, ids, thresholds)
+        counts = {}
+
+        for name in CODED_COLUMNS:
+            mask = self.combine(masks, skip=name)
+            totals = np.bincount(self.coded[name][mask], minlength=len(self.vocab[name]))
+            counts[name] = dict(zip(self.vocab[name], totals.tolist()))
+
+        for name, fields in (('category', CATEGORIES), ('sector', SECTORS)):
+            mask = self.combine(masks, skip=name)
+            columns = [SCORE_FIELDS.index(field) for field in fields]
+            limits = np.array([thresholds[field] for field in fields])
+            totals = (self.scores[mask][:, columns] >= limits).sum(axis=0)
+            counts[name] = dict(zip(fields, totals.tolist()))
+
+        counts['total'] = int(self.combine(masks).sum())
+        return counts
+
+
+_store = None
+_store_build = None
+_checked_at = None
+
+#returns the current store (None if it hasn't been built), checking for a new
+#build at most every RELOAD_INTERVAL seconds
+def get_store():
+    global _store, _store_build, _checked_at
+
+    now = time.monotonic()
+    if _checked_at is not None and now - _checked_at < RELOAD_INTERVAL:
+        return _store
+    _checked_at = now
+
+    build = current_build(facets_path())
+    if build is not None and build != _store_build:
+        _store = FacetStore(os.path.join(facets_path(), build))
+        _store_build = build
+
+    return _store
+
+#database ids of the bills matching a text query, and whether the search was
+#cut short by the index's limits (see backends.py). Identical searches
+#arriving at the same time share one run (see coalesce.py)
+def text_ids(searched, ordering=None):
+    if pgsearch.use_postgres():
+        return single_flight(search_key('text_ids', 'postgres', searched), lambda: pgsearch.search_ids(searched)), False
+    if passages.use_passages(searched, ordering):
+        matches, partial = single_flight(search_key('passages', searched), lambda: passages.search_passages(searched))
+        return [bill_id for bill_id, _ in matches], partial
+
+    def search():
+        backend = connections['default'].get_backend()
+        return backend.search_ids(searched), backend.partial
+
+    try:
+        return single_flight(search_key('text_ids', 'index', searched), search)
+    except QueryParserError:
+        return [], False
+
+#counts for the sidebar given the request's filters and text query ({} if
+#the store hasn't been built yet). ids are the bills the text query matched,
+#from the page's search when it found them (the whoosh and passage indexes
+#do, see planner.index_hits), otherwise the query is searched again
+def get_facet_counts(filters, ordering=None, searched=None, ids=None):
+    store = get_store()
+    if store is None:
+        return {}
+
+    #text queries are intersected with the store through the matching ids
+    if searched and ids is None:
+        ids, _ = text_ids(searched, ordering)
+
+    return store.facet_counts(filters, ordering, ids)
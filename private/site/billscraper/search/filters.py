@@ -0,0 +1,97 @@
+#reads the sidebar filters from a request and applies them to a search
+
+import datetime
+
+from django.db.models import Q
+
+from search.labels import CATEGORIES, SECTORS, get_thresholds
+
+#returns the date string if it's a valid yyyy-mm-dd date, None otherwise
+def clean_date(value):
+    try:
+        datetime.date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    return value
+
+#gets the filters selected in the sidebar from the request's query parameters
+def get_filters(params):
+    return {
+        'start_date': clean_date(params.get('start_date')),
+        'end_date': clean_date(params.get('end_date')),
+        'jurisdiction': params.getlist('jurisdiction'),
+        'status': params.getlist('status'),
+        'collection': params.getlist('collection'),
+        'category': params.getlist('category'),
+        'sector': params.getlist('sector'),
+    }
+
+#narrows down a haystack SearchQuerySet with the given filters
+def filter_search(results, filters):
+
+    #filter start and end dates based on input
+    if filters['start_date']:
+        results = results.filter(status_date__gte=filters['start_date'])
+
+    if filters['end_date']:
+        results = results.filter(status_date__lte=filters['end_date'])
+    else:
+        #this makes queries with sort but no filters 10x faster for some reason
+        results = results.filter(status_date__lte=datetime.date.today())
+
+    #filter jurisdiction if selected
+    selected_states = filters['jurisdiction']
+    if selected_states:
+        results = results.filter(state__exact__in=selected_states)
+        #selecting virginia was also displaying west virginia
+        if (not 'West Virginia' in selected_states):
+            results = results.exclude(state='West Virginia')
+
+    #filter status if selected
+    if filters['status']:
+        results = results.filter(status__in=filters['status'])
+
+    #filter collections if selected
+    if filters['collection']:
+        results = results.filter(content_collection__in=filters['collection'])
+
+    #categories/sectors are precomputed in the index (see search_indexes.py)
+    if filters['category']:
+        results = results.filter(categories__in=filters['category'])
+
+    if filters['sector']:
+        results = results.filter(sectors__in=filters['sector'])
+
+    return results
+
+#narrows down a Bill queryset with the given filters (same meaning as filter_search)
+def filter_bills(bills, filters):
+
+    if filters['start_date']:
+        bills = bills.filter(status_date__gte=filters['start_date'])
+
+    if filters['end_date']:
+        bills = bills.filter(status_date__lte=filters['end_date'])
+    else:
+        bills = bills.filter(status_date__lte=datetime.date.today())
+
+    if filters['jurisdiction']:
+        bills = bills.filter(state__in=filters['jurisdiction'])
+
+    if filters['status']:
+        bills = bills.filter(status__in=filters['status'])
+
+    if filters['collection']:
+        bills = bills.filter(content_collection__in=filters['collection'])
+
+    #a bill has a category/sector when its score meets the threshold
+    thresholds = get_thresholds()
+    for name, fields in (('category', CATEGORIES), ('sector', SECTORS)):
+        if filters[name]:
+            labeled = Q()
+            for field in filters[name]:
+                if field in fields:
+                    labeled |= Q(**{f"{field}__gte": thresholds[field]})
+            bills = bills.filter(labeled) if labeled else bills.none()
+
+    return bills
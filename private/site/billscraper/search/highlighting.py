@@ -0,0 +1,109 @@
+#text samples shown under each search result. Each document is split into
+#passages when it's indexed, and a result is highlighted from its best matching
+#passages only (fetched from the database by offset), so highlighting costs the
+#same for any length of document and finds matches anywhere in the text
+
+from bisect import bisect_right
+
+from django.db import connection
+from haystack.backends.whoosh_backend import WhooshHtmlFormatter
+from whoosh.analysis import StemmingAnalyzer
+from whoosh.highlight import ContextFragmenter, DEFAULT_CHARLIMIT
+from whoosh.highlight import highlight as whoosh_highlight
+
+from search.models import BillContent
+
+#most characters looked at when highlighting a whole text at once (used for
+#postgres headlines, whoosh's highlighter stops at the same point)
+SNIPPET_CHARS = DEFAULT_CHARLIMIT
+
+#approximate length of a passage, they start at the first word after this many
+#characters so they never split a word
+PASSAGE_CHARS = 1000
+
+#number of passages shown for each result (one highlighted fragment from each)
+MAX_PASSAGES = 3
+
+#analyzer the document field is indexed with (haystack's default), passages must
+#number words the same way the index does
+analyzer = StemmingAnalyzer()
+
+#splits the text of a document into passages, returned as "position:offset"
+#pairs: the index position of the passage's first word, and where the passage
+#starts in the text. document is the whole indexed field, which ends with text
+def get_passages(document, text):
+    text_start = document.rfind(text) if text else -1
+    if text_start < 0:
+        return ''
+
+    passages = []
+    next_start = text_start
+    for token in analyzer(document, positions=True, chars=True):
+        if token.startchar >= next_start:
+            passages.append(f'{token.pos}:{token.startchar - text_start}')
+            next_start = token.startchar + PASSAGE_CHARS
+
+    return ' '.join(passages)
+
+#(positions, offsets) lists from a value made by get_passages
+def parse_passages(value):
+    positions, offsets = [], []
+    for passage in (value or '').split():
+        position, offset = passage.split(':')
+        positions.append(int(position))
+        offsets.append(int(offset))
+    return positions, offsets
+
+#(start, length) of the best passages given the positions of each matched term
+#in the document. Passages with more distinct terms win, then more matches
+def best_passages(value, term_positions):
+    positions, offsets = parse_passages(value)
+    if not positions:
+        return []
+
+    matches = {}
+    for term, term_position_list in enumerate(term_positions):
+        for term_position in term_position_list:
+            passage = bisect_right(positions, term_position) - 1
+            if passage >= 0:
+                terms, count = matches.get(passage, (set(), 0))
+                terms.add(term)
+                matches[passage] = (terms, count + 1)
+
+    best = sorted(matches, key=lambda passage: (len(matches[passage][0]), matches[passage][1]), reverse=True)[:MAX_PASSAGES]
+
+    spans = []
+    for passage in sorted(best):
+        #the last passage runs to the end of the text (at most two passages long)
+        end = offsets[passage + 1] if passage + 1 < len(offsets) else offsets[passage] + 2 * PASSAGE_CHARS
+        spans.append((offsets[passage], min(end - offsets[passage], 2 * PASSAGE_CHARS)))
+    return spans
+
+#text of the given (bill id, start, length) spans in one query, keyed the same way
+def fetch_passages(spans):
+    if not spans:
+        return {}
+
+    values = ', '.join(['(%s, %s, %s)'] * len(spans))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT v.bill_id, v.start, substr(c.text, v.start::integer + 1, v.length::integer) '
+            f'FROM {BillContent._meta.db_table} c JOIN (VALUES {values}) AS v(bill_id, start, length) ON c.bill_id = v.bill_id',
+            [value for span in spans for value in span],
+        )
+        return {(bill_id, start): passage for bill_id, start, passage in cursor.fetchall()}
+
+#text sample with the given (analyzed) terms wrapped in <em> tags
+def highlight(text, terms, top=3):
+    return whoosh_highlight(text or '', terms, analyzer, ContextFragmenter(), WhooshHtmlFormatter('em'), top=top)
+
+#text samples for several bills from their best passages ({bill id: [(start,
+#length)]}), in the same format as whoosh's highlighting
+def passage_snippets(passages, terms):
+    texts = fetch_passages([(bill_id, start, length) for bill_id, spans in passages.items() for start, length in spans])
+
+    snippets = {}
+    for bill_id, spans in passages.items():
+        fragments = [highlight(texts.get((bill_id, start)), terms, top=1) for start, _ in spans]
+        snippets[bill_id] = '...'.join(fragment for fragment in fragments if fragment)
+    return snippets
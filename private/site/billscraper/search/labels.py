@@ -0,0 +1,42 @@
+#category and sector labels derived from the llm's 1-5 relevance scores
+#(a bill is labeled with a category/sector when its score meets the threshold)
+
+from django.conf import settings
+
+#score fields for each category and how they're displayed on the site
+CATEGORIES = {
+    'societal_impact': 'Societal Impact',
+    'data_governance': 'Data Governance',
+    'system_integrity': 'System Integrity',
+    'robustness': 'Data Robustness',
+}
+
+#score fields for each sector and how they're displayed on the site
+SECTORS = {
+    'politics_elections': 'Politics and Elections',
+    'government_public': 'Government Agencies and Public Services',
+    'judicial': 'Judicial system',
+    'healthcare': 'Healthcare',
+    'private': 'Private Enterprises, Labor, and Employment',
+    'academic': 'Academic and Research Institutions',
+    'international': 'International Cooperation and Standards',
+    'nonprofits': 'Nonprofits and NGOs',
+    'other_sector': 'Hybrid, Emerging, and Unclassified',
+}
+
+#score a bill needs for a label to be assigned, overridden per field with
+#LABEL_THRESHOLDS in settings
+DEFAULT_THRESHOLD = 3
+
+#returns the threshold for every category and sector field
+def get_thresholds():
+    thresholds = {field: DEFAULT_THRESHOLD for field in [*CATEGORIES, *SECTORS]}
+    thresholds.update(getattr(settings, 'LABEL_THRESHOLDS', {}))
+    return thresholds
+
+#returns the fields (from CATEGORIES or SECTORS) whose score meets its threshold
+def get_labels(bill, fields, thresholds=None):
+    if thresholds is None:
+        thresholds = get_thresholds()
+
+    return [field for field in fields if getattr(bill, field) >= thresholds[field]]
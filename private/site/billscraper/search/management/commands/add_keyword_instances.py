@@ -4,7 +4,7 @@ import re
 from tqdm import tqdm
 
 from django.core.management.base import BaseCommand, CommandError
-from search.models import Bill
+from search.models import BillContent
 
 #list of keywords, need to change here if modified
 KEYWORDS = [
@@ -27,14 +27,14 @@ KEYWORDS = [
 #adds counts and total
 def add_keyword_contexts():
 
-    all_bills = Bill.objects.all()
+    all_content = BillContent.objects.defer('search_vector')
 
-    for bill in tqdm(all_bills):
+    for content in tqdm(all_content):
         #check to see if instances have already been added
-        if (not bill.keyword_instances):
+        if (not content.keyword_instances):
 
             contexts = []
-            text = bill.text
+            text = content.text
 
             for keyword in KEYWORDS:
                 # Use regular expressions to find keyword occurrences
@@ -54,10 +54,10 @@ def add_keyword_contexts():
                 
                     contexts.append(context)
 
-            bill.keyword_instances = contexts
-            bill.save()
+            content.keyword_instances = contexts
+            content.save()
         
-    items_updated = all_bills.count()
+    items_updated = all_content.count()
     return items_updated
 
 
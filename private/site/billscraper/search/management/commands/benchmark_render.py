@@ -0,0 +1,76 @@
+# measures how long results.html takes to render a page of results, with every
+# result card rendered from scratch (empty card cache) and with the cards cached
+# (python manage.py benchmark_render, --query "q=deepfake&sort=newest" to pick pages)
+
+import time
+import statistics
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.http import QueryDict
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+from django.urls import reverse
+
+from search.filters import get_filters
+from search.planner import get_page, load_contents
+
+#pages rendered when none are given
+DEFAULT_QUERIES = ['sort=newest', 'collection=Legislation&sort=newest', 'q=artificial intelligence']
+
+#loads a page of results the way the results view does, before rendering starts
+def load_page(query):
+    params = QueryDict(query)
+    searched = params.get('q', '')
+    ordering = params.get('sort') or ('relevance' if searched else 'newest')
+    page = get_page(get_filters(params), ordering, params, searched)
+    for result in page:
+        result.object, result.highlighted
+    #the cold renders read every card's content
+    load_contents([result.object for result in page])
+
+    context = {
+        'searched': searched,
+        'shown_bills': page,
+        'num_results': page.paginator.count,
+        'sort': ordering,
+        'sidebar_search': searched,
+        'no_search': False,
+        'query_string': params.urlencode(),
+    }
+    return context, RequestFactory().get(reverse('results'), params)
+
+#milliseconds to render the page, clearing the card cache first when cold
+def render_time(context, request, cold):
+    if cold:
+        caches['result_cards'].clear()
+    start = time.perf_counter()
+    render_to_string('search/results.html', context, request)
+    return (time.perf_counter() - start) * 1000
+
+
+#actual command itself (called with python manage.py benchmark_render)
+class Command(BaseCommand):
+    help = "Times the rendering of results pages with and without cached result cards"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--query', action='append', help='results page parameters, e.g. "q=deepfake&collection=Legislation" (default a few common pages)')
+        parser.add_argument('--repeat', type=int, default=20, help='times each page is rendered')
+
+    def handle(self, *args, **options):
+        for query in options['query'] or DEFAULT_QUERIES:
+            context, request = load_page(query)
+
+            #first render loads templates and fills the cache
+            render_time(context, request, cold=False)
+
+            uncached = [render_time(context, request, cold=True) for _ in range(options['repeat'])]
+            render_time(context, request, cold=False)
+            cached = [render_time(context, request, cold=False) for _ in range(options['repeat'])]
+
+            self.stdout.write(
+                f"{query} ({len(context['shown_bills'])} results): "
+                f"uncached {statistics.median(uncached):.1f} ms, cached {statistics.median(cached):.1f} ms"
+            )
+
+        self.stdout.write(self.style.SUCCESS('Render benchmark complete'))
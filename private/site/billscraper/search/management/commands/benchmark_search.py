@@ -0,0 +1,82 @@
+# compares the whoosh index and postgres on the same text queries: latency of a
+# single query and throughput with several queries running at once
+# (python manage.py benchmark_search queries.txt, one query per line)
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.http import QueryDict
+
+from search.filters import get_filters
+from search.planner import database_page, index_page
+
+#page functions for each engine (see planner.py)
+ENGINES = {
+    'whoosh': index_page,
+    'postgres': database_page,
+}
+
+def read_queries(path):
+    try:
+        with open(path, 'r') as file:
+            return [line.strip() for line in file if line.strip() and not line.startswith('#')]
+    except FileNotFoundError:
+        raise CommandError(f'Query log {path} not found')
+
+#runs a query the way the results page does (count, first page of bills and
+#their text samples) and returns how long it took in seconds
+def run_query(engine, searched):
+    params = QueryDict()
+    start = time.perf_counter()
+    page = ENGINES[engine](get_filters(params), 'relevance', params, searched=searched)
+    page.paginator.count
+    for result in page:
+        result.object, result.highlighted
+    return time.perf_counter() - start
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+#actual command itself (called with python manage.py benchmark_search)
+class Command(BaseCommand):
+    help = "Compares the latency and throughput of the whoosh and postgres search engines"
+
+    def add_arguments(self, parser):
+        parser.add_argument('query_log', help='file with one search query per line')
+        parser.add_argument('--engine', choices=list(ENGINES), action='append', help='engine to test (default both)')
+        parser.add_argument('--repeat', type=int, default=3, help='times each query is run')
+        parser.add_argument('--concurrency', type=int, default=4, help='queries run at once for the throughput test')
+
+    def handle(self, *args, **options):
+        queries = read_queries(options['query_log'])
+        if not queries:
+            raise CommandError('No queries to run')
+
+        for engine in options['engine'] or list(ENGINES):
+            #first run warms up caches (index files, database pages)
+            for searched in queries:
+                run_query(engine, searched)
+
+            #latency, one query at a time
+            latencies = [run_query(engine, searched) for _ in range(options['repeat']) for searched in queries]
+
+            #throughput, several queries at a time
+            workload = queries * options['repeat']
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+                list(executor.map(lambda searched: run_query(engine, searched), workload))
+            elapsed = time.perf_counter() - start
+
+            self.stdout.write(
+                f"{engine}: {len(latencies)} queries, "
+                f"mean {1000 * sum(latencies) / len(latencies):.1f}ms, "
+                f"p50 {1000 * percentile(latencies, 0.5):.1f}ms, "
+                f"p95 {1000 * percentile(latencies, 0.95):.1f}ms, "
+                f"max {1000 * max(latencies):.1f}ms, "
+                f"{len(workload) / elapsed:.1f} queries/s with {options['concurrency']} at once"
+            )
+
+        self.stdout.write(self.style.SUCCESS(f'Benchmark finished ({len(queries)} queries)'))
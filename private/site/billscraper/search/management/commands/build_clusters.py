@@ -0,0 +1,19 @@
+# groups near-identical bills and saves their cluster_id (run after adding content)
+
+from django.core.management.base import BaseCommand
+
+from search.clusters import build_clusters
+
+
+#actual command itself (called with python manage.py build_clusters)
+class Command(BaseCommand):
+    help = "Groups near-identical bills (copies of the same model bill) and saves their cluster_id"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='read every bill again instead of only the ones added or changed since the last build')
+
+    def handle(self, *args, **options):
+
+        num_grouped, num_clusters, num_read, num_updated = build_clusters(full=options['full'])
+
+        self.stdout.write(self.style.SUCCESS(f'Clusters rebuilt successfully ({num_grouped} items in {num_clusters} groups, {num_read} read from the database, {num_updated} updated)'))
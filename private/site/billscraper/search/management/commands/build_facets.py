@@ -0,0 +1,16 @@
+# rebuilds the column store used for the sidebar's counts (run after adding content)
+
+from django.core.management.base import BaseCommand
+
+from search.facets import build_store, facets_path
+
+
+#actual command itself (called with python manage.py build_facets)
+class Command(BaseCommand):
+    help = "Rebuilds the column store used to count sidebar options"
+
+    def handle(self, *args, **options):
+
+        num_bills = build_store()
+
+        self.stdout.write(self.style.SUCCESS(f'Facet store rebuilt successfully ({num_bills} items written to {facets_path()})'))
@@ -0,0 +1,41 @@
+# splits documents into sections and indexes them in the passage index (see
+# search/passages.py, used when PASSAGE_SEARCH is on)
+
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+
+from search.models import Bill
+from search.passages import build_passages
+
+
+#actual command itself (called with python manage.py build_passages)
+class Command(BaseCommand):
+    help = "Splits documents into sections and rebuilds the passage index"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing', action='store_true', help='only add items that have no passages yet')
+        parser.add_argument('--changed', action='store_true', help='only rebuild items whose text was saved after their passages were built')
+        parser.add_argument('--collection', action='append', help='only rebuild items in this collection (can be repeated)')
+
+    def handle(self, *args, **options):
+        bills = Bill.objects.all()
+
+        #--missing and --changed together pick up everything ingested or edited
+        #since the last build (what the cron scripts run)
+        stale = Q()
+        if options['missing']:
+            stale |= Q(billpassage__isnull=True)
+        if options['changed']:
+            stale |= Q(billpassage__built_at__lt=F('content__updated_at'))
+        if stale:
+            bills = bills.filter(stale).distinct()
+        if options['collection']:
+            bills = bills.filter(content_collection__in=options['collection'])
+
+        num_bills = bills.count()
+
+        #a full rebuild clears everything first instead of replacing item by item
+        clear = not stale and not options['collection']
+        num_passages = build_passages(bills, clear=clear)
+
+        self.stdout.write(self.style.SUCCESS(f'Passage index built successfully ({num_passages} passages from {num_bills} items)'))
@@ -0,0 +1,19 @@
+# rebuilds the word vectors behind /search/similar (run after adding content)
+
+from django.core.management.base import BaseCommand
+
+from search.similar import build_similar, similar_path
+
+
+#actual command itself (called with python manage.py build_similar)
+class Command(BaseCommand):
+    help = "Updates the word vectors used to find similar bills"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='read every bill again instead of only the ones added or changed since the last build')
+
+    def handle(self, *args, **options):
+
+        num_bills, num_read = build_similar(full=options['full'])
+
+        self.stdout.write(self.style.SUCCESS(f'Similar bills rebuilt successfully ({num_bills} items written to {similar_path()}, {num_read} read from the database)'))
@@ -0,0 +1,21 @@
+# writes the sqlite snapshot of the database for offline use (see
+# search/snapshot.py), only copying the items changed since the last snapshot
+
+from django.core.management.base import BaseCommand
+
+from search.snapshot import build_snapshot, snapshot_path
+
+
+#actual command itself (called with python manage.py build_snapshot)
+class Command(BaseCommand):
+    help = "Updates the sqlite snapshot of the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='rebuild the snapshot from scratch')
+
+    def handle(self, *args, **options):
+
+        written, removed, full = build_snapshot(full=options['full'])
+
+        kind = 'rebuilt' if full else 'updated'
+        self.stdout.write(self.style.SUCCESS(f'Snapshot {kind} successfully ({written} items written, {removed} items removed in {snapshot_path()})'))
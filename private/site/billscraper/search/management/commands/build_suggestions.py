@@ -0,0 +1,17 @@
+# rebuilds the prefix index behind the search box's suggestions (run after
+# adding content and rebuilding the search index)
+
+from django.core.management.base import BaseCommand
+
+from search.suggest import build_suggestions, suggest_path
+
+
+#actual command itself (called with python manage.py build_suggestions)
+class Command(BaseCommand):
+    help = "Rebuilds the prefix index used to suggest searches"
+
+    def handle(self, *args, **options):
+
+        num_suggestions, num_keys = build_suggestions()
+
+        self.stdout.write(self.style.SUCCESS(f'Suggestions rebuilt successfully ({num_suggestions} suggestions under {num_keys} prefixes written to {suggest_path()})'))
@@ -0,0 +1,116 @@
+# measures how long a worker takes to start: the imports needed to serve the
+# site (profiled with python -X importtime), and the first requests of a worker
+# started from scratch and of one forked from a preloaded master (see
+# gunicorn.conf.py). Fails if they're over STARTUP_BUDGET_MS
+# (python manage.py check_startup)
+
+import os
+import sys
+import json
+import subprocess
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+#pages requested by each worker, in order
+DEFAULT_PATHS = ['/search/home', '/search/results?q=artificial+intelligence']
+
+#defaults for STARTUP_BUDGET_MS: milliseconds of imports, and of the first
+#request of a preloaded worker
+DEFAULT_BUDGET = {'imports': 1000, 'first_request': 500}
+
+#run in a new python: sets django up and imports every view, warms up if
+#preloading (see search/warmup.py), then times the requests. Writes a marker to
+#stderr once the imports are done and prints the timings as json
+PROBE = '''
+import sys, json, time
+started = time.perf_counter()
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+imported = time.perf_counter()
+sys.stderr.write('--- imported\\n')
+
+warm = {}
+if sys.argv[1] == 'preloaded':
+    from search.warmup import warm_up
+    warm = warm_up()
+
+from django.conf import settings
+from django.test import Client
+settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, '127.0.0.1']
+client = Client(HTTP_HOST='127.0.0.1')
+requests = []
+for path in sys.argv[2:]:
+    request_started = time.perf_counter()
+    status = client.get(path).status_code
+    requests.append({'path': path, 'status': status, 'ms': round((time.perf_counter() - request_started) * 1000, 2)})
+
+print(json.dumps({'imports_ms': round((imported - started) * 1000, 2), 'warm_up_ms': warm, 'requests': requests}))
+'''
+
+#{module: (self microseconds, cumulative microseconds)} from -X importtime output
+def parse_importtime(output):
+    modules = {}
+    for line in output.splitlines():
+        if line.startswith('--- imported'):
+            break
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(own), int(cumulative))
+    return modules
+
+#microseconds spent importing each top-level package, most first
+def package_times(modules):
+    packages = defaultdict(int)
+    for name, (own, _) in modules.items():
+        packages[name.split('.')[0]] += own
+    return sorted(packages.items(), key=lambda item: -item[1])
+
+
+#actual command itself (called with python manage.py check_startup)
+class Command(BaseCommand):
+    help = "Profiles the imports and first requests of a new worker and checks them against STARTUP_BUDGET_MS"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', action='append', help='page to request, can be given several times (default the home page and a search)')
+        parser.add_argument('--top', type=int, default=15, help='number of packages listed by import time (default 15)')
+
+    def handle(self, *args, **options):
+        paths = options['path'] or DEFAULT_PATHS
+        budget = {**DEFAULT_BUDGET, **getattr(settings, 'STARTUP_BUDGET_MS', {})}
+
+        cold, modules = self.probe('cold', paths)
+        preloaded, _ = self.probe('preloaded', paths)
+
+        self.stdout.write(f"Imports: {cold['imports_ms']}ms ({len(modules)} modules)")
+        for package, own in package_times(modules)[:options['top']]:
+            self.stdout.write(f'  {package}: {own / 1000:.1f}ms')
+
+        self.stdout.write('Warm up before forking: ' + ', '.join(f'{name} {ms}ms' for name, ms in preloaded['warm_up_ms'].items()))
+        for label, run in (('new worker', cold), ('preloaded worker', preloaded)):
+            self.stdout.write(f'Requests of a {label}: ' + ', '.join(f"{request['path']} {request['ms']}ms ({request['status']})" for request in run['requests']))
+
+        over = []
+        if cold['imports_ms'] > budget['imports']:
+            over.append(f"imports took {cold['imports_ms']}ms (budget {budget['imports']}ms)")
+        first_request = preloaded['requests'][0]['ms']
+        if first_request > budget['first_request']:
+            over.append(f"the first request of a preloaded worker took {first_request}ms (budget {budget['first_request']}ms)")
+        if over:
+            raise CommandError('Startup is over budget: ' + '; '.join(over))
+
+        self.stdout.write(self.style.SUCCESS('Startup is within budget'))
+
+    #runs the probe in a new python with the same settings and path, returns
+    #its timings and the modules it imported
+    def probe(self, mode, paths):
+        env = {**os.environ, 'PYTHONPATH': os.pathsep.join(path for path in sys.path if path)}
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE, mode, *paths],
+            capture_output=True, text=True, env=env, cwd=settings.BASE_DIR)
+        if result.returncode != 0:
+            raise CommandError(f'Starting a new worker failed:\n{result.stderr[-2000:]}')
+        return json.loads(result.stdout.strip().splitlines()[-1]), parse_importtime(result.stderr)
@@ -0,0 +1,85 @@
+# compares text relevance with and without the signals in search/scoring.py on
+# a labeled set of queries (python manage.py evaluate_ranking labels.csv). Each
+# line of the csv is query,bill id,grade with grades from 0 (not relevant) to 3
+# (exactly what the query is looking for), unlabeled bills count as 0
+
+import csv
+import math
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from haystack import connections
+
+from search.scoring import get_weights
+
+def read_labels(path):
+    labels = defaultdict(dict)
+    try:
+        with open(path, 'r', newline='') as file:
+            for row in csv.reader(file):
+                if len(row) < 3 or row[0].startswith('#'):
+                    continue
+                try:
+                    labels[row[0].strip()][int(row[1])] = float(row[2])
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        raise CommandError(f'Labels file {path} not found')
+    return labels
+
+#normalized discounted cumulative gain of the first k results
+def ndcg(ranked, grades, k):
+    dcg = sum((2 ** grades.get(bill, 0) - 1) / math.log2(i + 2) for i, bill in enumerate(ranked[:k]))
+    ideal = sum((2 ** grade - 1) / math.log2(i + 2) for i, grade in enumerate(sorted(grades.values(), reverse=True)[:k]))
+    return dcg / ideal if ideal else 0
+
+#1 / rank of the first relevant result
+def reciprocal_rank(ranked, grades):
+    for i, bill in enumerate(ranked):
+        if grades.get(bill, 0) > 0:
+            return 1 / (i + 1)
+    return 0
+
+def parse_weights(value):
+    try:
+        return {name: float(weight) for name, weight in (pair.split('=') for pair in value.split(','))}
+    except ValueError:
+        raise CommandError(f'Weights should look like recency=0.5,keywords=0.2, not {value}')
+
+
+#actual command itself (called with python manage.py evaluate_ranking)
+class Command(BaseCommand):
+    help = "Compares plain BM25F relevance with signal-aware relevance on labeled queries"
+
+    def add_arguments(self, parser):
+        parser.add_argument('labels', help='csv file of query,bill id,grade')
+        parser.add_argument('--weights', action='append', type=parse_weights, help='other weights to try, like recency=1,category=0 (can be repeated)')
+        parser.add_argument('--top', type=int, default=10, help='number of results evaluated')
+
+    def handle(self, *args, **options):
+        labels = read_labels(options['labels'])
+        if not labels:
+            raise CommandError('No labeled queries')
+
+        backend = connections['default'].get_backend()
+        top = options['top']
+
+        #plain BM25F, the weights in settings and any given on the command line
+        variants = {'bm25f': {'recency': 0, 'keywords': 0, 'category': 0}, 'settings': {}}
+        for weights in options['weights'] or []:
+            variants[','.join(f'{name}={weight:g}' for name, weight in weights.items())] = weights
+
+        for name, weights in variants.items():
+            ndcgs, rrs = [], []
+            for searched, grades in labels.items():
+                ranked = backend.ranked_ids(searched, limit=top, weights=weights)
+                ndcgs.append(ndcg(ranked, grades, top))
+                rrs.append(reciprocal_rank(ranked, grades))
+
+            used = get_weights(weights)
+            self.stdout.write(
+                f"{name}: nDCG@{top} {sum(ndcgs) / len(ndcgs):.3f}, MRR {sum(rrs) / len(rrs):.3f} "
+                f"(recency {used['recency']:g}, half life {used['recency_half_life']:g} days, keywords {used['keywords']:g}, category {used['category']:g})"
+            )
+
+        self.stdout.write(self.style.SUCCESS(f'Evaluated {len(labels)} queries'))
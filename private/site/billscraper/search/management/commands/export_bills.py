@@ -0,0 +1,60 @@
+# writes every item matching a search to a file as ndjson or csv, a chunk at a
+# time (python manage.py export_bills bills.ndjson --query "collection=Legislation&q=deepfake")
+
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.http import QueryDict
+from whoosh.qparser import QueryParserError
+
+from search.api import API_FIELDS, DEFAULT_FIELDS, api_queryset
+from search.export import FORMATS, export_stream
+from search.filters import get_filters
+from search.planner import ORDERINGS
+
+
+#actual command itself (called with python manage.py export_bills)
+class Command(BaseCommand):
+    help = "Exports the items matching a search as ndjson or csv"
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='file to write (- for stdout)')
+        parser.add_argument('--query', default='', help='the same parameters as the results page or api, like "q=deepfake&collection=Legislation"')
+        parser.add_argument('--format', choices=list(FORMATS), default='ndjson', help='file format (default ndjson)')
+        parser.add_argument('--fields', default=','.join(DEFAULT_FIELDS), help='comma separated fields, including text and keyword_instances')
+        parser.add_argument('--gzip', action='store_true', help='compress the file with gzip')
+
+    def handle(self, *args, **options):
+        params = QueryDict(options['query'])
+
+        ordering = params.get('sort', 'newest')
+        if ordering not in ORDERINGS:
+            raise CommandError(f"sort must be one of {', '.join(ORDERINGS)}")
+
+        fields = [field.strip() for field in options['fields'].split(',') if field.strip()]
+        unknown = [field for field in fields if field not in API_FIELDS]
+        if unknown or not fields:
+            raise CommandError(f"Unknown fields {', '.join(unknown)} (fields must be from {', '.join(API_FIELDS)})")
+
+        try:
+            bills, partial = api_queryset(get_filters(params), ordering, params.get('q', '').strip(), fields)
+        except QueryParserError:
+            raise CommandError('q could not be parsed')
+        bills = bills.order_by(*ORDERINGS[ordering])
+
+        #the text query hit the search time limit (see backends.py)
+        if partial:
+            self.stderr.write(self.style.WARNING('The text query took too long, only the matches found so far are exported'))
+
+        size = 0
+        output = sys.stdout.buffer if options['output'] == '-' else open(options['output'], 'wb')
+        try:
+            for piece in export_stream(bills, fields, options['format'], options['gzip']):
+                output.write(piece)
+                size += len(piece)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+
+        if options['output'] != '-':
+            self.stdout.write(self.style.SUCCESS(f"Export written successfully ({size} bytes written to {options['output']})"))
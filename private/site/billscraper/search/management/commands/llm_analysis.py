@@ -155,11 +155,13 @@ def analyze_all_items():
     return items_classified
 
 def gpt_analysis(bill):
-    #feed title, description, and first 20,000 chars of text
+    #feed title, description, and first 20,000 chars of text (only loaded here,
+    #for bills that haven't been analyzed yet)
+    text = bill.get_content().text
     if bill.description != "N/A":
-        bill_content = f"Title: {bill.title}\n Description: {bill.description}\n Text: {bill.text[:20000]}"
+        bill_content = f"Title: {bill.title}\n Description: {bill.description}\n Text: {text[:20000]}"
     else:
-        bill_content = f"Title: {bill.title}\n Text: {bill.text[:20000]}"
+        bill_content = f"Title: {bill.title}\n Text: {text[:20000]}"
 
     response = client.chat.completions.create(
     model="gpt-4o-mini",
@@ -0,0 +1,251 @@
+# load test of the search pages: replays a query file (the replay log written by
+# the timing middleware, or one query string per line) against a local server at
+# a fixed concurrency or request rate, and reports latency percentiles,
+# throughput and errors for each kind of query
+# (python manage.py load_test replay.log --concurrency 8 --output run.json)
+
+import json
+import time
+import random
+import threading
+import statistics
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler, get_internal_wsgi_application
+from django.http import QueryDict
+from django.utils import timezone
+
+from search.planner import ORDERINGS
+from search.stats import get_stats
+from search.suggest import index_terms
+
+#page queries are sent to when a line of the file doesn't name one
+DEFAULT_PATH = '/search/results'
+
+#parameters counted as facets (sidebar filters) when classifying a query
+FACET_PARAMS = ['jurisdiction', 'status', 'collection', 'category', 'sector', 'start_date', 'end_date']
+
+#seconds before a request counts as an error
+REQUEST_TIMEOUT = 30
+
+#most requests waiting on the server at once when sending at a fixed rate
+MAX_OUTSTANDING = 200
+
+#(path, query string) of each line of a query file, either json from the
+#replay log or a plain query string
+def read_queries(path):
+    queries = []
+    try:
+        with open(path, 'r') as file:
+            for line in file:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                if line.startswith('{'):
+                    entry = json.loads(line)
+                    queries.append((entry.get('path', DEFAULT_PATH), entry.get('query', '')))
+                else:
+                    queries.append((DEFAULT_PATH, line.lstrip('?')))
+    except FileNotFoundError:
+        raise CommandError(f'Query file {path} not found')
+    return queries
+
+#random queries built from the most common words in the index and the filter
+#values in the corpus stats (see stats.py)
+def generate_queries(count, seed=0):
+    rng = random.Random(seed)
+    words = [text for text, _ in index_terms()[:500]]
+    stats = get_stats()
+    values = {facet: list(stats.get(dimension, {})) for facet, dimension in
+        (('jurisdiction', 'jurisdiction'), ('collection', 'collection'), ('status', 'status'), ('category', 'category'), ('sector', 'sector'))}
+    values = {facet: options for facet, options in values.items() if options}
+    if not words and not values:
+        raise CommandError('Nothing to generate queries from (build the index and run refresh_stats first)')
+
+    queries = []
+    for _ in range(count):
+        params = []
+        if words and rng.random() < 0.7:
+            params.append(('q', ' '.join(rng.sample(words, min(len(words), rng.choice([1, 1, 2, 3]))))))
+        for facet in rng.sample(list(values), min(len(values), rng.choice([0, 0, 1, 1, 2, 3]))):
+            params.append((facet, rng.choice(values[facet])))
+        if rng.random() < 0.3:
+            params.append(('sort', rng.choice(list(ORDERINGS))))
+        if not params:
+            params.append(('sort', 'newest'))
+        queries.append((DEFAULT_PATH, urlencode(params)))
+    return queries
+
+#kind of query, results are reported for each: whether it searches text, how
+#it's sorted and how many filters it has
+def query_class(path, query):
+    params = QueryDict(query)
+    text = 'text' if params.get('q') else 'no-text'
+    sort = params.get('sort') or ('relevance' if params.get('q') else 'newest')
+    facets = sum(1 for key, value in parse_qsl(query) if key in FACET_PARAMS and value)
+    return f'{path} {text} sort={sort} facets={facets}'
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+#latency percentiles (ms), throughput and error rate of a list of (seconds, ok)
+def summarize(samples, elapsed):
+    latencies = [seconds * 1000 for seconds, _ in samples]
+    errors = sum(1 for _, ok in samples if not ok)
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'error_rate': round(errors / len(samples), 4),
+        'throughput': round(len(samples) / elapsed, 2),
+        'mean_ms': round(statistics.mean(latencies), 2),
+        'p50_ms': round(percentile(latencies, 0.5), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+    }
+
+
+class LocalServer:
+    #the site served from a thread of this process, on a free port
+    def __init__(self):
+        settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, '127.0.0.1']
+        self.server = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler, allow_reuse_address=False)
+        self.server.set_app(get_internal_wsgi_application())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    #doesn't print a line for every request
+    def log_message(self, format, *args):
+        pass
+
+
+#actual command itself (called with python manage.py load_test)
+class Command(BaseCommand):
+    help = "Replays search queries against the site and reports latency, throughput and errors per kind of query"
+
+    def add_arguments(self, parser):
+        parser.add_argument('query_file', nargs='?', help='replay log or file with one query string per line')
+        parser.add_argument('--generate', type=int, help='generate this many queries from the index instead of reading a file')
+        parser.add_argument('--url', help='server to test, e.g. http://127.0.0.1:8000 (default a server started in this process)')
+        parser.add_argument('--index', help='whoosh index directory the local server searches (e.g. a copy of the production index)')
+        parser.add_argument('--concurrency', type=int, default=4, help='requests sent at once (default 4)')
+        parser.add_argument('--rate', type=float, help='send this many requests per second instead of a fixed number at once')
+        parser.add_argument('--requests', type=int, help='requests to send, cycling through the queries (default each query once)')
+        parser.add_argument('--warmup', type=int, default=10, help='requests sent first and not counted (default 10)')
+        parser.add_argument('--output', help='file to save the results to as json')
+        parser.add_argument('--compare', help='results of an earlier run (json) to compare with')
+
+    def handle(self, *args, **options):
+        if options['index']:
+            if options['url']:
+                raise CommandError('--index only applies to the local server')
+            settings.HAYSTACK_CONNECTIONS['default']['PATH'] = options['index']
+
+        if options['generate']:
+            queries = generate_queries(options['generate'])
+        elif options['query_file']:
+            queries = read_queries(options['query_file'])
+        else:
+            raise CommandError('Give a query file or --generate')
+        if not queries:
+            raise CommandError('No queries to run')
+
+        total = options['requests'] or len(queries)
+        workload = [queries[n % len(queries)] for n in range(total)]
+
+        if options['url']:
+            results = self.run(options['url'].rstrip('/'), workload, options)
+        else:
+            with LocalServer() as url:
+                results = self.run(url, workload, options)
+
+        self.report(results, options)
+
+    #sends the workload and returns the results of the run
+    def run(self, url, workload, options):
+
+        #latency of a request (from when it was due to be sent at a fixed rate)
+        def send(path, query, due=None):
+            start = due if due is not None else time.perf_counter()
+            try:
+                with urllib.request.urlopen(f'{url}{path}?{query}', timeout=REQUEST_TIMEOUT) as response:
+                    response.read()
+                    ok = response.status < 400
+            except (urllib.error.URLError, OSError):
+                ok = False
+            return time.perf_counter() - start, ok
+
+        for path, query in workload[:options['warmup']]:
+            send(path, query)
+
+        start = time.perf_counter()
+        if options['rate']:
+            #requests are sent on schedule even if earlier ones haven't finished,
+            #so a slow server shows up as latency instead of a slower rate
+            interval = 1 / options['rate']
+            with ThreadPoolExecutor(max_workers=MAX_OUTSTANDING) as executor:
+                futures = []
+                for n, (path, query) in enumerate(workload):
+                    due = start + n * interval
+                    time.sleep(max(0, due - time.perf_counter()))
+                    futures.append(executor.submit(send, path, query, due))
+                samples = [future.result() for future in futures]
+        else:
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+                samples = list(executor.map(lambda item: send(*item), workload))
+        elapsed = time.perf_counter() - start
+
+        by_class = defaultdict(list)
+        for (path, query), sample in zip(workload, samples):
+            by_class[query_class(path, query)].append(sample)
+
+        return {
+            'started_at': timezone.now().isoformat(),
+            'url': options['url'] or 'local',
+            'index': options['index'],
+            'mode': f"{options['rate']} requests/s" if options['rate'] else f"{options['concurrency']} at once",
+            'seconds': round(elapsed, 2),
+            'overall': summarize(samples, elapsed),
+            'classes': {name: summarize(class_samples, elapsed) for name, class_samples in sorted(by_class.items())},
+        }
+
+    def report(self, results, options):
+        previous = {}
+        if options['compare']:
+            try:
+                with open(options['compare'], 'r') as file:
+                    previous = json.load(file)
+            except FileNotFoundError:
+                raise CommandError(f"Results file {options['compare']} not found")
+
+        rows = [('overall', results['overall'], previous.get('overall'))]
+        rows += [(name, stats, previous.get('classes', {}).get(name)) for name, stats in results['classes'].items()]
+        for name, stats, before in rows:
+            line = (f"{name}: {stats['requests']} requests, {stats['error_rate']:.1%} errors, "
+                f"p50 {stats['p50_ms']:.1f}ms, p95 {stats['p95_ms']:.1f}ms, p99 {stats['p99_ms']:.1f}ms, "
+                f"{stats['throughput']:.1f} requests/s")
+            if before:
+                line += f" (p95 was {before['p95_ms']:.1f}ms, {stats['p95_ms'] - before['p95_ms']:+.1f}ms)"
+            self.stdout.write(line)
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(results, file, indent=4)
+            self.stdout.write(f"Results saved to {options['output']}")
+
+        self.stdout.write(self.style.SUCCESS(f"Load test finished ({results['overall']['requests']} requests in {results['seconds']}s, {results['mode']})"))
@@ -7,8 +7,8 @@ import re
 
 from django.core.management.base import BaseCommand, CommandError
 from psycopg.errors import UniqueViolation
-from django.db import IntegrityError
-from search.models import Bill
+from django.db import IntegrityError, transaction
+from search.models import Bill, BillContent
 
 from tqdm import tqdm
 
@@ -325,7 +325,6 @@ def add_federal_documents():
                     status = 'Issued',
                     state = 'Federal',
                     url = bill_url,
-                    text = bill_text,
                     content_collection = COLLECTION_CODES[type_code],
                     source = item['governmentAuthor'][-1],
 
@@ -343,12 +342,14 @@ def add_federal_documents():
                     keyword_recommendation_system = keyword_counts['recommendation system'],
                     keyword_autonomous_vehicle = keyword_counts['autonomous vehicle'],
                     total_keywords = keyword_total,
-                    keyword_instances = get_keyword_instances(bill_text)
                 )
                 
                 #try to add bill, catch DataErrors (one item had a null error so this avoids that)
+                #(the bill and its content are saved together, or neither is)
                 try:
-                    b.save()
+                    with transaction.atomic():
+                        b.save()
+                        BillContent.objects.create(bill=b, text=bill_text, keyword_instances=get_keyword_instances(bill_text))
                     items_added += 1
                 except DataError:
                     pass
@@ -432,7 +433,6 @@ def add_bill(data):
             bill_type = data.get('bill', {}).get('bill_type_id'),
             total_sponsors = num_sponsors,
             primary_sponsor = main_sponsor,
-            text = bill_text,
             content_collection = "Legislation",
             last_action = action,
             last_action_date = action_date,
@@ -451,10 +451,12 @@ def add_bill(data):
             keyword_recommendation_system = keyword_counts['recommendation system'],
             keyword_autonomous_vehicle = keyword_counts['autonomous vehicle'],
             total_keywords = keyword_total,
-            keyword_instances = get_keyword_instances(bill_text)
         )
 
-        b.save()
+        #the bill and its content are saved together, or neither is
+        with transaction.atomic():
+            b.save()
+            BillContent.objects.create(bill=b, text=bill_text, keyword_instances=get_keyword_instances(bill_text))
         #return true if the bill was added, false if not
         return True
     else:
@@ -0,0 +1,17 @@
+# recounts the items by jurisdiction, collection, status, month, category and
+# sector for the home page and stats api (run after adding content)
+
+from django.core.management.base import BaseCommand
+
+from search.stats import refresh_stats
+
+
+#actual command itself (called with python manage.py refresh_stats)
+class Command(BaseCommand):
+    help = "Recounts the items shown on the home page and stats api"
+
+    def handle(self, *args, **options):
+
+        num_stats = refresh_stats()
+
+        self.stdout.write(self.style.SUCCESS(f'Stats refreshed successfully ({num_stats} counts written)'))
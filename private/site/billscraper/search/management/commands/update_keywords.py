@@ -41,10 +41,10 @@ def count_keywords(text):
 #adds counts and total
 def add_keywords():
 
-    all_bills = Bill.objects.all()
+    all_bills = Bill.objects.select_related('content').defer('content__search_vector')
 
     for bill in tqdm(all_bills):
-        keyword_counts, total_keywords = count_keywords(bill.text)
+        keyword_counts, total_keywords = count_keywords(bill.get_content().text)
         bill.keyword_artificial_intelligence = keyword_counts['artificial intelligence']
         bill.keyword_machine_learning = keyword_counts['machine learning']
         bill.keyword_algorithm = keyword_counts['algorithm']
@@ -0,0 +1,98 @@
+# reindexes the category/sector labels of items affected by a change to LABEL_THRESHOLDS
+# (only bills with a score between the old and new threshold need to be updated),
+# and updates the labels stored on them for the results page
+
+import os
+import json
+
+from tqdm import tqdm
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+from haystack import connections
+
+from search.models import Bill
+from search.labels import get_thresholds
+
+#number of bills sent to the index at once
+BATCH_SIZE = 100
+
+#thresholds the index was last built with are kept next to the index
+def thresholds_path(using='default'):
+    return os.path.join(settings.HAYSTACK_CONNECTIONS[using]['PATH'], 'label_thresholds.json')
+
+def load_indexed_thresholds(using='default'):
+    try:
+        with open(thresholds_path(using), 'r') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+def save_indexed_thresholds(thresholds, using='default'):
+    os.makedirs(os.path.dirname(thresholds_path(using)), exist_ok=True)
+    with open(thresholds_path(using), 'w') as file:
+        json.dump(thresholds, file, indent=4)
+
+#bills whose label for some field differs between the old and new thresholds
+def affected_bills(old_thresholds, new_thresholds):
+    changed = Q()
+    for field, new in new_thresholds.items():
+        old = old_thresholds.get(field, new)
+        if old != new:
+            changed |= Q(**{f"{field}__gte": min(old, new), f"{field}__lt": max(old, new)})
+
+    if not changed:
+        return Bill.objects.none()
+
+    return Bill.objects.filter(changed)
+
+#stores the new labels (a new updated_at also replaces the bills' cached result
+#cards) and reindexes them
+def save_batch(batch, backend, index):
+    Bill.objects.bulk_update(batch, ['category_labels', 'sector_labels', 'updated_at'])
+    backend.update(index, batch)
+
+#updates the affected bills and returns the number updated
+def update_labels(old_thresholds, new_thresholds, using='default'):
+    backend = connections[using].get_backend()
+    index = connections[using].get_unified_index().get_index(Bill)
+
+    bills = affected_bills(old_thresholds, new_thresholds).order_by('id')
+    items_updated = bills.count()
+
+    batch = []
+    for bill in tqdm(bills.iterator(), total=items_updated):
+        bill.set_labels(new_thresholds)
+        bill.updated_at = timezone.now()
+        batch.append(bill)
+        if len(batch) == BATCH_SIZE:
+            save_batch(batch, backend, index)
+            batch = []
+    if batch:
+        save_batch(batch, backend, index)
+
+    return items_updated
+
+
+#actual command itself (called with python manage.py update_labels)
+class Command(BaseCommand):
+    help = "Reindexes the categories/sectors of items affected by a change to LABEL_THRESHOLDS"
+
+    def handle(self, *args, **options):
+
+        new_thresholds = get_thresholds()
+        old_thresholds = load_indexed_thresholds()
+
+        #nothing recorded yet, assume the index was built with the current thresholds
+        #(run rebuild_index first if it wasn't)
+        if old_thresholds is None:
+            save_indexed_thresholds(new_thresholds)
+            self.stdout.write(f'Recorded current label thresholds in {thresholds_path()}')
+            return
+
+        items_updated = update_labels(old_thresholds, new_thresholds)
+        save_indexed_thresholds(new_thresholds)
+
+        self.stdout.write(self.style.SUCCESS(f'Index labels updated successfully ({items_updated} items updated)'))
@@ -7,8 +7,8 @@ import re
 
 from django.core.management.base import BaseCommand, CommandError
 from psycopg.errors import UniqueViolation
-from django.db import IntegrityError
-from search.models import Bill
+from django.db import IntegrityError, transaction
+from search.models import Bill, BillContent
 
 from tqdm import tqdm
 
@@ -252,7 +252,6 @@ def add_bill(data):
             bill_type = data.get('bill', {}).get('bill_type_id'),
             total_sponsors = num_sponsors,
             primary_sponsor = main_sponsor,
-            text = bill_text,
             content_collection = "Legislation",
             last_action = action,
             last_action_date = action_date,
@@ -271,10 +270,12 @@ def add_bill(data):
             keyword_recommendation_system = keyword_counts['recommendation system'],
             keyword_autonomous_vehicle = keyword_counts['autonomous vehicle'],
             total_keywords = keyword_total,
-            keyword_instances = get_keyword_instances(bill_text)
         )
 
-        b.save()
+        #the bill and its content are saved together, or neither is
+        with transaction.atomic():
+            b.save()
+            BillContent.objects.create(bill=b, text=bill_text, keyword_instances=get_keyword_instances(bill_text))
         #return true if the bill was added, false if not
         return True
     else:
@@ -377,7 +378,7 @@ def update_legislation():
                     
                     #want to add a check here to see if the bill text has changed or stayed the same
 
-                    current_text = copies[0].text
+                    current_text = copies[0].get_content().text
 
                     new_text = get_bill_text(data)
 
@@ -0,0 +1,89 @@
+#times search requests by phase (see timing.py)
+
+import functools
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.urls import reverse
+
+from search import timing
+from search.conditional import canonical_query
+
+#views whose requests are timed (with a Server-Timing header when SERVER_TIMING
+#is on), and the ones that are searches written to the slow and replay logs
+TIMED_VIEWS = ['results', 'home', 'api_bills']
+LOGGED_VIEWS = ['results', 'api_bills']
+
+#the search's parameters in a fixed order, with a text query sent by POST
+#moved into q so the request can be replayed as a GET
+def search_query(request):
+    params = request.GET.copy()
+    if request.method == 'POST' and request.POST.get('searched'):
+        params['q'] = request.POST['searched']
+    return canonical_query(params)
+
+#path of each timed view ({path: view name}), so requests are matched with a
+#dictionary lookup instead of resolving every url
+@functools.cache
+def timed_paths():
+    return {reverse(view): view for view in TIMED_VIEWS}
+
+#whether the Server-Timing header is sent for a user: only to staff, since the
+#phases show how the site answers a search
+def sends_header(user):
+    return getattr(settings, 'SERVER_TIMING', False) and user is not None and user.is_staff
+
+
+class SearchTimingMiddleware:
+    #works in both sync and async stacks, so the async results view under ASGI
+    #doesn't get pushed back onto a thread
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    #name of the view if the request should be timed, else None
+    def timed_view(self, request):
+        view = timed_paths().get(request.path)
+        header = getattr(settings, 'SERVER_TIMING', False)
+        return view if view in (TIMED_VIEWS if header else LOGGED_VIEWS) else None
+
+    #user is who made the request (set by the authentication middleware further
+    #in, None if the request didn't get that far)
+    def finish(self, request, view, response, timings, user):
+        if sends_header(user):
+            response['Server-Timing'] = timings.server_timing()
+        if view in LOGGED_VIEWS:
+            timing.log_request(request.path, search_query(request), response.status_code, timings)
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        view = self.timed_view(request)
+        if view is None:
+            return self.get_response(request)
+
+        timings, token = timing.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            timing.stop(token)
+        return self.finish(request, view, response, timings, getattr(request, 'user', None))
+
+    async def __acall__(self, request):
+        view = self.timed_view(request)
+        if view is None:
+            return await self.get_response(request)
+
+        timings, token = timing.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            timing.stop(token)
+        user = await request.auser() if getattr(settings, 'SERVER_TIMING', False) and hasattr(request, 'auser') else None
+        return self.finish(request, view, response, timings, user)
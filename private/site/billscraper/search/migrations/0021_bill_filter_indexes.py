@@ -0,0 +1,37 @@
+# Generated by Django 5.0.7 on 2026-10-19 00:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0020_alter_bill_keyword_instances'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(fields=['status_date', 'id'], name='bill_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(fields=['state', 'status_date', 'id'], name='bill_state_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(fields=['status', 'status_date', 'id'], name='bill_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(fields=['content_collection', 'status_date', 'id'], name='bill_collection_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(fields=['content_collection', 'last_action_date', 'id'], name='bill_collection_action_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(fields=['total_keywords', 'id'], name='bill_total_keywords_idx'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.0.7 on 2026-10-19 00:29
+
+import django.contrib.postgres.fields
+import django.db.models.deletion
+from django.db import migrations, models, transaction
+
+#bills copied per transaction
+BATCH_SIZE = 1000
+
+
+#runs a statement over bills in id ranges, committing after each range so the
+#copy doesn't hold one huge transaction over every bill's text
+def run_in_batches(apps, schema_editor, sql):
+    Bill = apps.get_model('search', 'Bill')
+    connection = schema_editor.connection
+    ids = Bill.objects.order_by('id').values_list('id', flat=True)
+    last_id = 0
+    while True:
+        batch = list(ids.filter(id__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            break
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(sql, [batch[0], batch[-1]])
+        last_id = batch[-1]
+
+
+def copy_content(apps, schema_editor):
+    run_in_batches(apps, schema_editor, """
+        INSERT INTO search_billcontent (bill_id, text, keyword_instances)
+        SELECT id, text, keyword_instances FROM search_bill
+        WHERE id BETWEEN %s AND %s
+        ON CONFLICT (bill_id) DO NOTHING
+    """)
+
+
+def copy_content_back(apps, schema_editor):
+    run_in_batches(apps, schema_editor, """
+        UPDATE search_bill SET text = c.text, keyword_instances = c.keyword_instances
+        FROM search_billcontent c
+        WHERE c.bill_id = search_bill.id AND search_bill.id BETWEEN %s AND %s
+    """)
+
+
+class Migration(migrations.Migration):
+
+    #each batch of the copy commits on its own
+    atomic = False
+
+    dependencies = [
+        ('search', '0021_bill_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillContent',
+            fields=[
+                ('bill', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='content', serialize=False, to='search.bill')),
+                ('text', models.CharField(default='N/A')),
+                ('keyword_instances', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(), blank=True, default=list, size=None)),
+            ],
+        ),
+        migrations.RunPython(copy_content, copy_content_back),
+    ]
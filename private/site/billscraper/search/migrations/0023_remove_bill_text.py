@@ -0,0 +1,21 @@
+# Generated by Django 5.0.7 on 2026-10-19 00:29
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0022_billcontent'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='bill',
+            name='keyword_instances',
+        ),
+        migrations.RemoveField(
+            model_name='bill',
+            name='text',
+        ),
+    ]
@@ -0,0 +1,112 @@
+# Generated by Django 5.0.7 on 2026-10-19 00:52
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, transaction
+
+#bills updated per transaction when filling in the vectors
+BATCH_SIZE = 500
+
+#keeps search_billcontent.search_vector in sync with the bill's title, sponsor
+#and description and the content's text. A generated column can't read another
+#table, so the content row recomputes it on insert/update and the bill sets it
+#to null (which recomputes it) when one of its weighted fields changes
+CREATE_TRIGGERS = """
+CREATE FUNCTION search_bill_vector(bill_id bigint, body text) RETURNS tsvector AS $$
+DECLARE
+    header tsvector;
+    words tsvector;
+BEGIN
+    SELECT setweight(to_tsvector('english', coalesce(b.title, '')), 'A') ||
+           setweight(to_tsvector('english', coalesce(b.primary_sponsor, '')), 'B') ||
+           setweight(to_tsvector('english', coalesce(b.description, '')), 'C')
+    INTO header FROM search_bill b WHERE b.id = bill_id;
+
+    BEGIN
+        words := to_tsvector('english', coalesce(body, ''));
+    EXCEPTION WHEN program_limit_exceeded THEN
+        --tsvectors are limited to 1MB, very long documents are indexed from their start
+        words := to_tsvector('english', left(body, 200000));
+    END;
+
+    RETURN coalesce(header, ''::tsvector) || setweight(words, 'D');
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION search_billcontent_vector_trigger() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := search_bill_vector(NEW.bill_id, NEW.text);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER search_billcontent_vector
+    BEFORE INSERT OR UPDATE OF text, search_vector ON search_billcontent
+    FOR EACH ROW EXECUTE FUNCTION search_billcontent_vector_trigger();
+
+CREATE FUNCTION search_bill_vector_trigger() RETURNS trigger AS $$
+BEGIN
+    UPDATE search_billcontent SET search_vector = NULL WHERE bill_id = NEW.id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER search_bill_vector
+    AFTER UPDATE OF title, primary_sponsor, description ON search_bill
+    FOR EACH ROW
+    WHEN (OLD.title IS DISTINCT FROM NEW.title
+          OR OLD.primary_sponsor IS DISTINCT FROM NEW.primary_sponsor
+          OR OLD.description IS DISTINCT FROM NEW.description)
+    EXECUTE FUNCTION search_bill_vector_trigger();
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER IF EXISTS search_bill_vector ON search_bill;
+DROP FUNCTION IF EXISTS search_bill_vector_trigger();
+DROP TRIGGER IF EXISTS search_billcontent_vector ON search_billcontent;
+DROP FUNCTION IF EXISTS search_billcontent_vector_trigger();
+DROP FUNCTION IF EXISTS search_bill_vector(bigint, text);
+"""
+
+
+#fills in the vectors of existing content in id ranges, committing after each
+def fill_search_vectors(apps, schema_editor):
+    BillContent = apps.get_model('search', 'BillContent')
+    connection = schema_editor.connection
+    ids = BillContent.objects.order_by('bill_id').values_list('bill_id', flat=True)
+    last_id = 0
+    while True:
+        batch = list(ids.filter(bill_id__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            break
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(
+                'UPDATE search_billcontent SET search_vector = NULL WHERE bill_id BETWEEN %s AND %s',
+                [batch[0], batch[-1]],
+            )
+        last_id = batch[-1]
+
+
+class Migration(migrations.Migration):
+
+    #each batch of the backfill commits on its own
+    atomic = False
+
+    dependencies = [
+        ('search', '0023_remove_bill_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='billcontent',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+        #built after the backfill, which is much faster than updating the index row by row
+        migrations.AddIndex(
+            model_name='billcontent',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='billcontent_search_idx'),
+        ),
+    ]
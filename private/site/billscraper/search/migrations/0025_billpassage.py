@@ -0,0 +1,23 @@
+# Generated by Django 5.0.7 on 2026-10-19 00:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0024_billcontent_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillPassage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.IntegerField()),
+                ('end', models.IntegerField()),
+                ('bill', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='search.bill')),
+            ],
+        ),
+    ]
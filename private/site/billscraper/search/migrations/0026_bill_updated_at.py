@@ -0,0 +1,23 @@
+# Generated by Django 5.0.7 on 2026-10-19 00:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0025_billpassage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bill',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='billcontent',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.7 on 2026-10-19 00:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0026_bill_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CorpusStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField()),
+                ('key', models.CharField()),
+                ('count', models.IntegerField(default=0)),
+                ('refreshed_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='corpusstat',
+            constraint=models.UniqueConstraint(fields=('dimension', 'key'), name='corpusstat_dimension_key'),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.0.7 on 2026-10-19 00:50
+
+import django.contrib.postgres.fields
+from django.conf import settings
+from django.db import migrations, models
+
+#copy of the labels in search/labels.py when this migration was written, so
+#later changes there don't change what it does
+CATEGORIES = {
+    'societal_impact': 'Societal Impact',
+    'data_governance': 'Data Governance',
+    'system_integrity': 'System Integrity',
+    'robustness': 'Data Robustness',
+}
+SECTORS = {
+    'politics_elections': 'Politics and Elections',
+    'government_public': 'Government Agencies and Public Services',
+    'judicial': 'Judicial system',
+    'healthcare': 'Healthcare',
+    'private': 'Private Enterprises, Labor, and Employment',
+    'academic': 'Academic and Research Institutions',
+    'international': 'International Cooperation and Standards',
+    'nonprofits': 'Nonprofits and NGOs',
+    'other_sector': 'Hybrid, Emerging, and Unclassified',
+}
+DEFAULT_THRESHOLD = 3
+
+#bills updated per query
+BATCH_SIZE = 1000
+
+
+#display names of the fields whose score meets its threshold (LABEL_THRESHOLDS
+#in settings, DEFAULT_THRESHOLD otherwise)
+def get_labels(bill, fields, thresholds):
+    return [name for field, name in fields.items() if getattr(bill, field) >= thresholds.get(field, DEFAULT_THRESHOLD)]
+
+#fills in the labels of existing bills (new ones get them when saved)
+def fill_labels(apps, schema_editor):
+    Bill = apps.get_model('search', 'Bill')
+    thresholds = getattr(settings, 'LABEL_THRESHOLDS', {})
+    bills = Bill.objects.only('id', *CATEGORIES, *SECTORS).order_by('id')
+
+    batch = []
+    for bill in bills.iterator(chunk_size=BATCH_SIZE):
+        bill.category_labels = get_labels(bill, CATEGORIES, thresholds)
+        bill.sector_labels = get_labels(bill, SECTORS, thresholds)
+        batch.append(bill)
+        if len(batch) == BATCH_SIZE:
+            Bill.objects.bulk_update(batch, ['category_labels', 'sector_labels'])
+            batch = []
+    if batch:
+        Bill.objects.bulk_update(batch, ['category_labels', 'sector_labels'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0027_corpusstat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bill',
+            name='category_labels',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(), blank=True, default=list, size=None),
+        ),
+        migrations.AddField(
+            model_name='bill',
+            name='sector_labels',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(), blank=True, default=list, size=None),
+        ),
+        migrations.RunPython(fill_labels, migrations.RunPython.noop),
+    ]
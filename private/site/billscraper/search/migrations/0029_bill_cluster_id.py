@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-19 01:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0028_bill_labels'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bill',
+            name='cluster_id',
+            field=models.IntegerField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.0.7 on 2026-10-19 12:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0029_bill_cluster_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='billpassage',
+            name='built_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
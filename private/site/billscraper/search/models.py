@@ -9,11 +9,12 @@ from django.contrib.postgres.indexes import GinIndex
 from django.contrib.postgres.search import SearchVector
 import django.contrib.postgres.search as pg_search
 
+from search.labels import CATEGORIES, SECTORS, get_labels
+
 # Create your models here.
 class Bill(models.Model):
     title = models.CharField(default="N/A")
     description = models.CharField(default="N/A")
-    text = models.CharField(default="N/A")
 
     #link to item in its source database
     url = models.CharField(default="legiscan.com")
@@ -87,9 +88,118 @@ class Bill(models.Model):
     keyword_algorithm = models.IntegerField(default=0)
     keyword_autonomous_vehicle = models.IntegerField(default=0)
 
-    #list of keywords in context
-    keyword_instances = ArrayField(models.CharField(max_length=None), blank=True, default=list)
+    #display names of the categories/sectors the bill is labeled with, filled in
+    #on save so the results page doesn't compare every score (see labels.py)
+    category_labels = ArrayField(models.CharField(max_length=None), blank=True, default=list)
+    sector_labels = ArrayField(models.CharField(max_length=None), blank=True, default=list)
+
+    #group of near-identical bills it belongs to (copies of the same model bill
+    #in different states), named after the lowest id in the group. None if it
+    #has no near duplicates (set by python manage.py build_clusters, see clusters.py)
+    cluster_id = models.IntegerField(null=True, blank=True, db_index=True)
+
+    #last time the bill or its content was saved (lets snapshots only copy what
+    #changed, and versions the cached result cards)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    #indexes backing the filter-only queries sent to postgres (see planner.py),
+    #id is included so keyset pagination can walk each ordering
+    class Meta:
+        indexes = [
+            models.Index(fields=['status_date', 'id'], name='bill_status_date_idx'),
+            models.Index(fields=['state', 'status_date', 'id'], name='bill_state_date_idx'),
+            models.Index(fields=['status', 'status_date', 'id'], name='bill_status_idx'),
+            models.Index(fields=['content_collection', 'status_date', 'id'], name='bill_collection_date_idx'),
+            models.Index(fields=['content_collection', 'last_action_date', 'id'], name='bill_collection_action_idx'),
+            models.Index(fields=['total_keywords', 'id'], name='bill_total_keywords_idx'),
+        ]
 
     #display for the admin page
     def __str__(self):
         return self.title
+
+    def save(self, *args, **kwargs):
+        self.set_labels()
+        super().save(*args, **kwargs)
+
+    #recomputes category_labels and sector_labels from the scores
+    def set_labels(self, thresholds=None):
+        self.category_labels = [CATEGORIES[field] for field in get_labels(self, CATEGORIES, thresholds)]
+        self.sector_labels = [SECTORS[field] for field in get_labels(self, SECTORS, thresholds)]
+
+    #full text and keywords in context (empty if the bill has no content row)
+    def get_content(self):
+        try:
+            return self.content
+        except BillContent.DoesNotExist:
+            return BillContent(bill=self)
+
+
+#large fields of a bill, kept in their own table so queries on the bill's
+#metadata don't read them (access with bill.content, loaded when first used)
+class BillContent(models.Model):
+    bill = models.OneToOneField(Bill, on_delete=models.CASCADE, primary_key=True, related_name='content')
+    text = models.CharField(default="N/A")
+
+    #list of keywords in context
+    keyword_instances = ArrayField(models.CharField(max_length=None), blank=True, default=list)
+
+    #weighted title (A), sponsor (B), description (C) and text (D) used when
+    #SEARCH_ENGINE is 'postgres'. Filled in by database triggers (see migration
+    #0024) since it combines columns from both tables
+    search_vector = pg_search.SearchVectorField(null=True, editable=False)
+
+    #last time the text or keywords were saved
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='billcontent_search_idx'),
+        ]
+
+    def __str__(self):
+        return self.bill.title
+
+    #the bill counts as saved too, so what's kept per bill (like its cached
+    #result card) is replaced
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        Bill.objects.filter(pk=self.bill_id).update(updated_at=self.updated_at)
+
+
+#section (or fixed size window) of a bill's text, indexed on its own when
+#PASSAGE_SEARCH is on so long documents are matched passage by passage (built
+#with python manage.py build_passages, see passages.py)
+class BillPassage(models.Model):
+    bill = models.ForeignKey(Bill, on_delete=models.CASCADE)
+
+    #where the passage is in the bill's text
+    start = models.IntegerField()
+    end = models.IntegerField()
+
+    #when it was split from the text (passages of texts saved since are rebuilt
+    #by python manage.py build_passages --changed). A text with no passages
+    #gets an empty one (start and end 0) so the time is still recorded
+    built_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f'{self.bill.title} ({self.start}-{self.end})'
+
+
+#precomputed number of bills for each value of a dimension (jurisdiction,
+#collection, month, ...) so the home page and stats api don't count bills on
+#every request (refreshed after each ingestion with python manage.py
+#refresh_stats, see stats.py)
+class CorpusStat(models.Model):
+    dimension = models.CharField()
+    key = models.CharField()
+    count = models.IntegerField(default=0)
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'key'], name='corpusstat_dimension_key'),
+        ]
+
+    def __str__(self):
+        return f'{self.dimension} {self.key}: {self.count}'
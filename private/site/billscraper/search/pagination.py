@@ -0,0 +1,156 @@
+#keyset pagination for database queries: each page continues from the sort
+#values of the last row shown instead of counting past every earlier row
+
+import json
+import math
+import base64
+import binascii
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+#turns an ordering like ('-status_date', '-id') into [(field, descending)]
+def parse_ordering(ordering):
+    return [(field.lstrip('-'), field.startswith('-')) for field in ordering]
+
+def reverse_ordering(ordering):
+    return [field[1:] if field.startswith('-') else '-' + field for field in ordering]
+
+#opaque cursor holding the sort values of a row
+def encode_cursor(obj, ordering):
+    values = [getattr(obj, field) for field, _ in parse_ordering(ordering)]
+    values = [value.isoformat() if hasattr(value, 'isoformat') else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+#sort values from a cursor (None if it's missing or malformed)
+def decode_cursor(cursor, model, ordering):
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        fields = parse_ordering(ordering)
+        if len(values) != len(fields):
+            return None
+        return [model._meta.get_field(field).to_python(value) for (field, _), value in zip(fields, values)]
+    except (ValueError, TypeError, binascii.Error, ValidationError):
+        return None
+
+#rows that come after the given sort values in the ordering
+def keyset_filter(ordering, values):
+    fields = parse_ordering(ordering)
+
+    after = Q()
+    equal = {}
+    for (field, descending), value in zip(fields, values):
+        after |= Q(**equal, **{f"{field}__{'lt' if descending else 'gt'}": value})
+        equal[field] = value
+
+    #repeat the bound on the first field on its own so postgres can use it for an index range
+    field, descending = fields[0]
+    return Q(**{f"{field}__{'lte' if descending else 'gte'}": values[0]}) & after
+
+
+class KeysetPage:
+    #attributes mirror django's Page so results.html can display either one
+    keyset = True
+
+    def __init__(self, object_list, number, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.number = number
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.number > 1
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+
+class KeysetPaginator:
+
+    def __init__(self, queryset, ordering, per_page=20, wrap=None):
+        self.queryset = queryset
+        self.ordering = list(ordering)
+        self.per_page = per_page
+        #optional function applied to each row (e.g. to wrap it for the template)
+        self.wrap = wrap or (lambda obj: obj)
+        self._count = None
+
+    @property
+    def count(self):
+        if self._count is None:
+            self._count = self.queryset.count()
+        return self._count
+
+    @property
+    def num_pages(self):
+        return max(1, math.ceil(self.count / self.per_page))
+
+    def make_page(self, rows, number, has_next):
+        object_list = [self.wrap(row) for row in rows]
+        next_cursor = encode_cursor(rows[-1], self.ordering) if (rows and has_next) else None
+        previous_cursor = encode_cursor(rows[0], self.ordering) if (rows and number > 1) else None
+        return KeysetPage(object_list, number, self, next_cursor, previous_cursor)
+
+    #rows following a cursor (or the first rows without one) and the cursor of
+    #the next rows, None at the end. Nothing is counted, so any page costs the same
+    def rows_after(self, after=None):
+        rows = self.queryset
+        after_values = decode_cursor(after, rows.model, self.ordering)
+        if after_values is not None:
+            rows = rows.filter(keyset_filter(self.ordering, after_values))
+
+        rows = list(rows.order_by(*self.ordering)[:self.per_page + 1])
+        next_cursor = encode_cursor(rows[self.per_page - 1], self.ordering) if len(rows) > self.per_page else None
+        return [self.wrap(row) for row in rows[:self.per_page]], next_cursor
+
+    #page following/preceding a cursor, or the last page. The page number is only
+    #carried along for display, page numbers without a cursor fall back to an offset
+    def get_page(self, number=1, after=None, before=None, last=False):
+        model = self.queryset.model
+        try:
+            number = min(max(int(number), 1), self.num_pages)
+        except (TypeError, ValueError):
+            number = 1
+
+        after_values = decode_cursor(after, model, self.ordering)
+        before_values = decode_cursor(before, model, self.ordering)
+
+        if last:
+            number = self.num_pages
+            size = self.count - (number - 1) * self.per_page
+            rows = list(self.queryset.order_by(*reverse_ordering(self.ordering))[:size])[::-1]
+            return self.make_page(rows, number, has_next=False)
+
+        if after_values is not None:
+            rows = list(self.queryset.filter(keyset_filter(self.ordering, after_values)).order_by(*self.ordering)[:self.per_page + 1])
+            return self.make_page(rows[:self.per_page], max(number, 2), has_next=len(rows) > self.per_page)
+
+        if before_values is not None:
+            reverse = reverse_ordering(self.ordering)
+            rows = list(self.queryset.filter(keyset_filter(reverse, before_values)).order_by(*reverse)[:self.per_page + 1])
+            #reached the start, show it as the first page
+            if len(rows) <= self.per_page:
+                number = 1
+            return self.make_page(rows[:self.per_page][::-1], number, has_next=True)
+
+        start = (number - 1) * self.per_page
+        rows = list(self.queryset.order_by(*self.ordering)[start:start + self.per_page + 1])
+        return self.make_page(rows[:self.per_page], number, has_next=len(rows) > self.per_page)
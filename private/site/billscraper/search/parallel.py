@@ -0,0 +1,47 @@
+#bounded thread pool the async results view runs blocking work in (whoosh
+#searches, postgres queries, rendering), so the independent parts of a search
+#can run at the same time without every request starting its own threads
+
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+
+#threads per worker process when SEARCH_THREADS isn't set
+DEFAULT_THREADS = 8
+
+_executor = None
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'SEARCH_THREADS', DEFAULT_THREADS), thread_name_prefix='search')
+    return _executor
+
+#calls func in a pool thread with the caller's context (so the request's
+#timings are still recorded, see timing.py). The threads keep their database
+#connections between calls (at most SEARCH_THREADS per worker) instead of
+#reconnecting for every part of a search, and close one that broke
+def call(context, func, *args):
+    try:
+        return context.run(func, *args)
+    finally:
+        for connection in connections.all(initialized_only=True):
+            if connection.errors_occurred:
+                if connection.is_usable():
+                    connection.errors_occurred = False
+                else:
+                    connection.close()
+
+#awaits func(*args) run in the pool
+async def run(func, *args, **kwargs):
+    if kwargs:
+        func = functools.partial(func, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(executor(), call, contextvars.copy_context(), func, *args)
+
+#awaits several (func, *args) calls running in the pool at the same time, returns their results in order
+async def gather(*calls):
+    return await asyncio.gather(*(run(*item) for item in calls))
@@ -0,0 +1,133 @@
+#passage search for long documents: each bill's text is split into sections (or
+#fixed size windows where it has none) that are indexed separately in the
+#'passages' whoosh index. Matches are collapsed to their bill, which is ranked by
+#its best passage and shows it as the text sample (used when PASSAGE_SEARCH is on)
+
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from haystack import connections
+from whoosh.qparser import QueryParserError
+
+from search.models import BillPassage
+from search.highlighting import analyzer
+
+#haystack connection of the passage index
+USING = 'passages'
+
+#sections shorter than this are merged with the next one, and sections longer
+#than the max are split into windows
+PASSAGE_MIN_CHARS = 500
+PASSAGE_MAX_CHARS = 3000
+
+#lines that start a section (SEC. 2., Section 3, § 1.2, PART 5)
+SECTION_PATTERN = re.compile(r'^[ \t]*(?:SEC(?:TION)?\.?[ \t]+\d|Sec(?:tion)?\.?[ \t]+\d|§+[ \t]*\d|PART[ \t]+\d)', re.MULTILINE)
+
+#number of words a text fragment link searches for
+FRAGMENT_WORDS = 5
+
+#whether a search should be answered from the passage index
+def use_passages(searched, ordering):
+    return bool(searched) and ordering == 'relevance' and getattr(settings, 'PASSAGE_SEARCH', False)
+
+#(start, end) of the passages of a text
+def split_passages(text):
+    text = text or ''
+    bounds = sorted({0, len(text), *(match.start() for match in SECTION_PATTERN.finditer(text))})
+
+    passages = []
+    start = 0
+    for end in bounds[1:]:
+        if end - start < PASSAGE_MIN_CHARS and end < len(text):
+            continue
+
+        #long sections are split at the last space before the max
+        while end - start > PASSAGE_MAX_CHARS:
+            cut = text.rfind(' ', start + PASSAGE_MIN_CHARS, start + PASSAGE_MAX_CHARS)
+            if cut < 0:
+                cut = start + PASSAGE_MAX_CHARS
+            passages.append((start, cut))
+            start = cut
+
+        passages.append((start, end))
+        start = end
+
+    return passages
+
+#replaces the passages of the given bills and adds them to the passage index,
+#a batch of bills at a time. Returns the number of passages created
+def build_passages(bills, clear=False, batch_size=100):
+    backend = connections[USING].get_backend()
+    index = connections[USING].get_unified_index().get_index(BillPassage)
+
+    if clear:
+        BillPassage.objects.all().delete()
+        backend.clear(models=[BillPassage])
+
+    bills = bills.select_related('content').only('id', 'content__text').order_by('id')
+    total = 0
+    batch = []
+
+    def flush():
+        ids = [bill.id for bill in batch]
+        if not clear:
+            BillPassage.objects.filter(bill_id__in=ids).delete()
+            backend.remove_by('bill', ids)
+
+        passages = []
+        empty = []
+        for bill in batch:
+            text = bill.get_content().text
+            spans = split_passages(text)
+            for start, end in spans:
+                passage = BillPassage(bill=bill, start=start, end=end)
+                #indexed text (see BillPassageIndex.prepare_text)
+                passage.passage_text = text[start:end]
+                passages.append(passage)
+
+            #a text with no passages still records when it was built, with an
+            #empty passage that isn't indexed (so --missing doesn't pick it up again)
+            if not spans:
+                empty.append(BillPassage(bill=bill, start=0, end=0))
+
+        BillPassage.objects.bulk_create(passages + empty)
+        if passages:
+            backend.update(index, passages)
+        return len(passages)
+
+    for bill in bills.iterator(chunk_size=batch_size):
+        batch.append(bill)
+        if len(batch) >= batch_size:
+            total += flush()
+            batch = []
+    if batch:
+        total += flush()
+
+    return total
+
+#(bill id, passage id) of the bills matching a query, best first, and whether
+#the search was cut short by the index's limits (see backends.py)
+def search_passages(searched):
+    backend = connections[USING].get_backend()
+    try:
+        matches = backend.search_collapsed(searched, 'bill')
+    except QueryParserError:
+        return [], False
+    return [(bill_id, passage_id) for passage_id, bill_id in matches], backend.partial
+
+#link to a passage in the bill's source page with a text fragment (#:~:text=,
+#supported by most browsers) that starts at the passage's first matched word
+def text_fragment_url(url, text, terms):
+    for token in analyzer(text or '', chars=True):
+        if token.text in terms:
+            words = text[token.startchar:token.startchar + 50 * FRAGMENT_WORDS].split()[:FRAGMENT_WORDS]
+            #commas and dashes have a meaning in text fragments
+            fragment = quote(' '.join(words), safe='').replace('-', '%2D')
+            return f"{url.split('#')[0]}#:~:text={fragment}"
+    return None
+
+#removes the given bills' passages from the passage index (their rows are
+#deleted with the bills)
+def unindex_passages(bill_ids):
+    connections[USING].get_backend().remove_by('bill', bill_ids)
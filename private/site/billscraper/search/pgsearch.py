@@ -0,0 +1,65 @@
+#text search in postgres, used instead of whoosh when SEARCH_ENGINE is 'postgres'
+#(searches the search_vector column of BillContent, see models.py)
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+from django.db.models import F
+from django.db.models.functions import Left
+from django.utils.html import escape
+
+from search.models import BillContent
+from search.highlighting import SNIPPET_CHARS
+
+#text search configuration the vectors are built with (see migration 0024)
+CONFIG = 'english'
+
+#markers put around matches by postgres, replaced with <em> tags after the
+#rest of the snippet has been escaped
+START_MARK = '\x02'
+STOP_MARK = '\x03'
+
+#whether text queries are answered by postgres instead of whoosh
+def use_postgres():
+    return getattr(settings, 'SEARCH_ENGINE', 'whoosh') == 'postgres'
+
+#parses a query typed in the search bar (quotes, or and -word work like a
+#web search engine, and invalid syntax is never an error)
+def search_query(searched):
+    return SearchQuery(searched, search_type='websearch', config=CONFIG)
+
+#bills in a queryset whose title, sponsor, description or text match the query
+def search_bills(bills, searched):
+    return bills.filter(content__search_vector=search_query(searched))
+
+#bills in a queryset matching the query, best matches first (longer documents
+#are normalized so they don't win just by repeating terms)
+def rank_bills(bills, searched):
+    query = search_query(searched)
+    return bills.filter(content__search_vector=query).annotate(
+        rank=SearchRank(F('content__search_vector'), query, normalization=1)
+    ).order_by('-rank', '-id')
+
+#database ids of every bill matching the query
+def search_ids(searched):
+    return list(BillContent.objects.filter(search_vector=search_query(searched)).values_list('bill_id', flat=True))
+
+#text samples for the given bills, in the same format as whoosh highlighting
+#(empty when no match is found). Only computed for the bills on the page being
+#shown, and only from the start of each text like whoosh's highlighter
+def headlines(bill_ids, searched):
+    snippets = BillContent.objects.filter(bill_id__in=bill_ids).annotate(
+        headline=SearchHeadline(
+            Left('text', SNIPPET_CHARS),
+            search_query(searched),
+            config=CONFIG,
+            start_sel=START_MARK,
+            stop_sel=STOP_MARK,
+            max_fragments=3,
+            fragment_delimiter='...',
+        )
+    ).values_list('bill_id', 'headline')
+
+    return {
+        bill_id: escape(headline).replace(START_MARK, '<em>').replace(STOP_MARK, '</em>')
+        for bill_id, headline in snippets if START_MARK in headline
+    }
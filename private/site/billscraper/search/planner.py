@@ -0,0 +1,291 @@
+#decides where a search runs: requests that just filter and sort go straight to
+#postgres (see the indexes on Bill), text queries go to the engine selected by
+#SEARCH_ENGINE (the whoosh index or the search_vector column in postgres), or to
+#the passage index when PASSAGE_SEARCH is on
+
+import datetime
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from haystack import connections
+from haystack.inputs import Exact, Raw
+from haystack.query import SearchQuerySet
+from haystack.utils import get_identifier
+from whoosh.qparser import QueryParserError
+
+from search.models import Bill, BillContent, BillPassage
+from search.filters import filter_bills, filter_search
+from search.pagination import KeysetPaginator
+from search.pgsearch import use_postgres, search_bills, rank_bills, headlines
+from search.passages import use_passages, search_passages, text_fragment_url
+from search.highlighting import analyzer, fetch_passages, highlight
+from search.coalesce import search_key, single_flight
+from search.clusters import CLUSTER_FIELD, collapsing, first_in_cluster, first_matches
+from search.timing import phase
+from search import parallel
+
+#database ordering for each sort option (id breaks ties so pages are stable)
+ORDERINGS = {
+    'newest': ('-status_date', '-id'),
+    'relevance': ('-status_date', '-id'),
+    'newest_status': ('-status_date', '-id'),
+    'oldest_status': ('status_date', 'id'),
+    'newest_action': ('-last_action_date', '-id'),
+    'oldest_action': ('last_action_date', 'id'),
+    'keyword': ('-total_keywords', '-id'),
+}
+
+#whether a request should be answered from postgres instead of whoosh
+def use_database(searched):
+    if searched:
+        return use_postgres()
+    return getattr(settings, 'DATABASE_FILTER_QUERIES', True)
+
+
+class BillResult:
+    #gives a Bill the attributes results.html reads from haystack's SearchResult
+    def __init__(self, bill, highlighted=None, passage_url=None):
+        self.object = bill
+        self.pk = bill.pk
+        self.id = get_identifier(bill)
+        self.highlighted = highlighted
+        #link to the matching passage in the source document
+        self.passage_url = passage_url
+
+
+#filtered and sorted bills for a sort option
+def bill_queryset(filters, ordering):
+    bills = filter_bills(Bill.objects.all(), filters)
+
+    #sorting by action only applies to legislation
+    if ordering in ('oldest_action', 'newest_action'):
+        bills = bills.filter(content_collection='Legislation')
+    if ordering == 'newest_action':
+        bills = bills.filter(last_action_date__lte=datetime.date.today())
+
+    return bills
+
+#page of results from postgres, using the page/after/before/last parameters
+#from the url. Text queries sorted by relevance are paged by offset since every
+#match has to be ranked anyway, other orderings continue from a cursor
+def database_page(filters, ordering, params, per_page=20, searched=None):
+    bills = bill_queryset(filters, ordering)
+    if searched:
+        bills = search_bills(bills, searched)
+
+    #near-identical bills are shown once, as the first of their group in the
+    #sort order (the newest one when ranking by relevance)
+    if collapsing():
+        bills = first_in_cluster(bills, ORDERINGS.get(ordering, ORDERINGS['newest']))
+
+    if searched and ordering == 'relevance':
+        paginator = Paginator(rank_bills(bills, searched), per_page)
+        page = paginator.get_page(params.get('page'))
+    else:
+        paginator = KeysetPaginator(bills, ORDERINGS.get(ordering, ORDERINGS['newest']), per_page=per_page)
+        page = paginator.get_page(
+            params.get('page', 1),
+            after=params.get('after'),
+            before=params.get('before'),
+            last=bool(params.get('last')),
+        )
+
+    #text samples are only computed for the bills being shown
+    snippets = headlines([bill.pk for bill in page.object_list], searched) if searched else {}
+    page.object_list = [
+        BillResult(bill, {'text': [snippets[bill.pk]]} if bill.pk in snippets else None)
+        for bill in page.object_list
+    ]
+    return page
+
+#filtered and sorted SearchQuerySet for a search of the whoosh index
+#(highlighted=False leaves the highlights to be made separately, see index_page_async)
+def index_results(filters, ordering, searched=None, highlighted=True):
+    results = SearchQuerySet().all()
+
+    if searched:
+        try:
+            #uses raw search, ordering is by relevance by default
+            #highlights come from the best passages of each text (see highlighting.py)
+            #relevance also weighs how recent and ai focused each bill is (see scoring.py)
+            results = results.filter(content=Raw(searched))
+            if highlighted:
+                results = results.highlight(highlight_query=Exact(searched))
+
+        except QueryParserError:
+            # Handle invalid query
+            results = SearchQuerySet().none()
+
+    #the filters of a text search narrow its matches instead of being part of
+    #the query, so the search still sees every match of the text and the
+    #sidebar counts can reuse them (see facets.get_facet_counts)
+    if searched:
+        results = results.narrow(filter_search(SearchQuerySet().all(), filters).query.build_query())
+    else:
+        results = filter_search(results, filters)
+
+    #ordering is relevance by default so no need to order by it
+    if ordering == 'oldest_status':
+        results = results.order_by('status_date')
+    elif ordering == 'newest_status':
+        results = results.order_by('-status_date')
+    elif ordering == 'oldest_action':
+        results = results.filter(content_collection='Legislation')
+        results = results.order_by('last_action_date')
+    elif ordering == 'newest_action':
+        results = results.filter(content_collection='Legislation')
+        results = results.filter(last_action_date__lte=datetime.date.today())
+        results = results.order_by('-last_action_date')
+    elif ordering == 'keyword':
+        results = results.order_by('-total_keywords')
+
+    return results
+
+#(number of matches, page number, [(bill id, highlights)] of the page, whether
+#the search was cut short by the index's limits, ids of every match of the text
+#or None) of a search of the whoosh index. The ids are only read for text
+#searches, for the sidebar counts (see facets.get_facet_counts)
+def index_hits(filters, ordering, page_number, per_page=20, searched=None, highlighted=True):
+    results = index_results(filters, ordering, searched, highlighted)
+    results.query.collect_ids = bool(searched)
+    #one result per group of near-identical bills (see clusters.py)
+    results.query.collapse = CLUSTER_FIELD if collapsing() else None
+
+    #pages of 20 items
+    paginator = Paginator(results, per_page)
+    with phase('count'):
+        paginator.count
+    page = paginator.get_page(page_number)
+    return page.paginator.count, page.number, [(int(result.pk), result.highlighted) for result in page], results.query.partial, results.query.matching_ids
+
+#the page's bills in one query ({id: bill})
+def load_bills(bill_ids):
+    with phase('db'):
+        return Bill.objects.in_bulk(bill_ids)
+
+#loads the content (keywords in context, not the text) of the given bills in
+#one query. Only the result cards that aren't cached read it (see views.py)
+def load_contents(bills):
+    contents = BillContent.objects.defer('text', 'search_vector').in_bulk([bill.pk for bill in bills])
+    for bill in bills:
+        if bill.pk in contents:
+            bill.content = contents[bill.pk]
+
+#page of results from the whoosh index. Identical searches arriving at the same
+#time share one run of the search (see coalesce.py)
+def index_page(filters, ordering, params, per_page=20, searched=None):
+    page_number = params.get('page')
+    key = search_key('index', filters, ordering, page_number, per_page, searched)
+    count, number, hits, partial, matching_ids = single_flight(key, lambda: index_hits(filters, ordering, page_number, per_page, searched))
+
+    #loads the page's bills in one query
+    bills = load_bills([bill_id for bill_id, _ in hits])
+
+    page = Paginator(range(count), per_page).get_page(number)
+    page.object_list = [BillResult(bills[bill_id], highlighted) for bill_id, highlighted in hits if bill_id in bills]
+    #only shows the matches found before a time limit (see backends.py)
+    page.partial = partial
+    page.matching_ids = matching_ids
+    return page
+
+#{bill id: highlights} of the given bills for a search of the whoosh index
+def index_highlights(filters, ordering, searched, bill_ids):
+    if not searched:
+        return {}
+    try:
+        query_string = index_results(filters, ordering, searched, highlighted=False).query.build_query()
+        return connections['default'].get_backend().highlights(query_string, bill_ids)
+    except QueryParserError:
+        return {}
+
+#index_page for the async results view: the page is searched without
+#highlights, then its bills are loaded while their highlights are made (both
+#in the search threads, see parallel.py). The count comes from the same whoosh
+#search as the page's hits, searching for them separately would only run the
+#index twice in one process
+async def index_page_async(filters, ordering, params, per_page=20, searched=None):
+    page_number = params.get('page')
+    key = search_key('index_ids', filters, ordering, page_number, per_page, searched)
+    count, number, hits, partial, matching_ids = await parallel.run(single_flight, key,
+        lambda: index_hits(filters, ordering, page_number, per_page, searched, highlighted=False))
+
+    bill_ids = [bill_id for bill_id, _ in hits]
+    if searched:
+        bills, highlights = await parallel.gather((load_bills, bill_ids), (index_highlights, filters, ordering, searched, bill_ids))
+    else:
+        bills, highlights = await parallel.run(load_bills, bill_ids), {}
+
+    page = Paginator(range(count), per_page).get_page(number)
+    page.object_list = [BillResult(bills[bill_id], highlights.get(bill_id)) for bill_id in bill_ids if bill_id in bills]
+    page.partial = partial
+    page.matching_ids = matching_ids
+    return page
+
+#page of results from the passage index, one result per bill with its best
+#passage as the text sample (only used for relevance ordering)
+def passage_page(filters, ordering, params, per_page=20, searched=None):
+    matches, partial = single_flight(search_key('passages', searched), lambda: search_passages(searched))
+    text_ids = [bill_id for bill_id, _ in matches]
+
+    #sidebar filters are applied to the bills of the matching passages, and
+    #only the best of each group of near-identical bills is kept
+    with phase('db'):
+        allowed = dict(bill_queryset(filters, ordering).filter(id__in=text_ids).values_list('id', 'cluster_id'))
+    matches = [(bill_id, allowed[bill_id], passage_id) for bill_id, passage_id in matches if bill_id in allowed]
+    if collapsing():
+        matches = first_matches(matches)
+    matches = [(bill_id, passage_id) for bill_id, _, passage_id in matches]
+
+    page = Paginator(matches, per_page).get_page(params.get('page'))
+
+    with phase('db'):
+        bills = bill_queryset(filters, ordering).in_bulk([bill_id for bill_id, _ in page.object_list])
+        passages = BillPassage.objects.in_bulk([passage_id for _, passage_id in page.object_list])
+        texts = fetch_passages([(passage.bill_id, passage.start, passage.end - passage.start) for passage in passages.values()])
+    terms = [token.text for token in analyzer(searched)]
+
+    results = []
+    with phase('highlight'):
+        for bill_id, passage_id in page.object_list:
+            if bill_id not in bills:
+                continue
+            passage = passages.get(passage_id)
+            text = texts.get((bill_id, passage.start)) if passage else None
+            snippet = highlight(text, terms) if text else ''
+            results.append(BillResult(
+                bills[bill_id],
+                {'text': [snippet]} if snippet else None,
+                text_fragment_url(bills[bill_id].url, text, terms) if text else None,
+            ))
+    page.object_list = results
+    page.partial = partial
+    #the passages matched the text alone, the filters were applied afterwards
+    page.matching_ids = text_ids
+    return page
+
+#which engine answers a request: 'passages' (the passage index), 'database'
+#(postgres) or 'index' (the whoosh index)
+def get_engine(searched, ordering):
+    if use_passages(searched, ordering) and not use_postgres():
+        return 'passages'
+    if use_database(searched):
+        return 'database'
+    return 'index'
+
+#page of results for a request from whichever engine should answer it
+def get_page(filters, ordering, params, searched=None, per_page=20):
+    engine = get_engine(searched, ordering)
+    if engine == 'passages':
+        return passage_page(filters, ordering, params, per_page, searched)
+    if engine == 'database':
+        with phase('db'):
+            return database_page(filters, ordering, params, per_page, searched)
+    return index_page(filters, ordering, params, per_page, searched)
+
+#get_page for the async results view. Pages from the whoosh index are split into
+#parts that run at the same time (see index_page_async), the other engines
+#run as one piece in a search thread
+async def get_page_async(filters, ordering, params, searched=None, per_page=20):
+    if get_engine(searched, ordering) == 'index':
+        return await index_page_async(filters, ordering, params, per_page, searched)
+    return await parallel.run(get_page, filters, ordering, params, searched, per_page)
@@ -0,0 +1,112 @@
+#relevance for text searches: BM25F combined with signals kept in each bill's
+#index columns (how recent its status is, how dense its keywords are and its
+#highest llm category score). The signals scale each match's score while whoosh
+#scores it, so the best results are found without re-sorting the hits afterwards
+
+import datetime
+
+from django.conf import settings
+from whoosh.scoring import BaseScorer, BM25F, WeightingModel
+from whoosh.util.times import datetime_to_long
+
+from search.labels import CATEGORIES
+
+#weights used for anything missing from RELEVANCE_WEIGHTS in settings. A bill
+#with every signal at its best scores 1 + recency + keywords + category times
+#its BM25F score. Only the category boost is on, it's the one evaluate_ranking
+#showed ranks the labeled queries in fixtures/ranking_labels.csv better
+DEFAULT_WEIGHTS = {
+    #boost for a bill whose status changed today, halving every half life (days)
+    'recency': 0,
+    'recency_half_life': 365,
+    #boost for keyword dense text, half of it at KEYWORD_DENSITY_MIDPOINT
+    'keywords': 0,
+    #boost for a top category score of 5
+    'category': 1,
+}
+
+#keywords per 1000 words of text that get half of the keyword boost
+KEYWORD_DENSITY_MIDPOINT = 5
+
+#columns the signals are read from (see BillIndex)
+DATE_FIELD = 'status_date'
+KEYWORDS_FIELD = 'total_keywords'
+
+#status dates are kept in the index as microseconds
+USECS_PER_DAY = 86400 * 10**6
+
+#highest llm score
+MAX_CATEGORY_SCORE = 5
+
+def get_weights(overrides=None):
+    weights = dict(DEFAULT_WEIGHTS)
+    weights.update(getattr(settings, 'RELEVANCE_WEIGHTS', {}))
+    weights.update(overrides or {})
+    return weights
+
+
+class SignalWeighting(WeightingModel):
+    #base is the weighting model of the text itself (BM25F by default)
+    def __init__(self, base=None, weights=None, content_field='text'):
+        self.base = base or BM25F()
+        self.weights = get_weights(weights)
+        self.content_field = content_field
+
+    #most a score can be multiplied by
+    def max_boost(self):
+        return 1 + self.weights['recency'] + self.weights['keywords'] + self.weights['category']
+
+    def scorer(self, searcher, fieldname, text, qf=1):
+        scorer = self.base.scorer(searcher, fieldname, text, qf=qf)
+
+        #indexes without the signal columns (like the passage index) and plain
+        #BM25F weights are scored as usual
+        columns = (DATE_FIELD, KEYWORDS_FIELD, self.content_field, *CATEGORIES)
+        if self.max_boost() == 1 or not all(field in searcher.schema for field in columns):
+            return scorer
+        return SignalScorer(scorer, self, searcher)
+
+
+class SignalScorer(BaseScorer):
+    #scores are the base scorer's times the document's boost, so the boost can
+    #be applied term by term (searcher is the segment being searched)
+    def __init__(self, scorer, weighting, searcher):
+        self.scorer = scorer
+        self.weights = weighting.weights
+        self.max_boost = weighting.max_boost()
+        self.searcher = searcher
+        self.content_field = weighting.content_field
+
+        reader = searcher.reader()
+        self.dates = reader.column_reader(DATE_FIELD, translate=False)
+        self.keywords = reader.column_reader(KEYWORDS_FIELD)
+        self.categories = [reader.column_reader(field) for field in CATEGORIES]
+        self.today = datetime_to_long(datetime.datetime.combine(datetime.date.today(), datetime.time()))
+
+    def boost(self, docnum):
+        weights = self.weights
+
+        age = max(0, self.today - self.dates[docnum]) / USECS_PER_DAY
+        recency = 0.5 ** (age / weights['recency_half_life'])
+
+        length = self.searcher.doc_field_length(docnum, self.content_field, 0)
+        density = 1000 * self.keywords[docnum] / length if length else 0
+        keywords = density / (density + KEYWORD_DENSITY_MIDPOINT)
+
+        category = min(max(column[docnum] for column in self.categories), MAX_CATEGORY_SCORE) / MAX_CATEGORY_SCORE
+
+        return 1 + weights['recency'] * recency + weights['keywords'] * keywords + weights['category'] * category
+
+    def score(self, matcher):
+        return self.scorer.score(matcher) * self.boost(matcher.id())
+
+    #whoosh skips blocks that can't make the top results, so the quality limits
+    #allow for the largest boost
+    def supports_block_quality(self):
+        return self.scorer.supports_block_quality()
+
+    def max_quality(self):
+        return self.scorer.max_quality() * self.max_boost
+
+    def block_quality(self, matcher):
+        return self.scorer.block_quality(matcher) * self.max_boost
@@ -2,7 +2,13 @@
 
 import datetime
 from haystack import indexes
-from search.models import Bill
+from django.db.models import F
+from django.db.models.functions import Substr
+
+from search.models import Bill, BillPassage
+from search.labels import CATEGORIES, SECTORS, get_labels
+from search.highlighting import get_passages
+from search.clusters import cluster_key
 
 # fields that are stored in the index (fields must be stored here to be
 # filtered through the sidebar)
@@ -11,6 +17,10 @@ class BillIndex(indexes.SearchIndex, indexes.Indexable):
     #field configured in templates/search/indexes/search/bill_text.txt
     text = indexes.CharField(document=True, use_template=True)
 
+    #where each passage of the text starts, only stored for highlighting (the
+    #full text isn't stored, see highlighting.py)
+    passages = indexes.CharField(indexed=False)
+
     #add boost to make title matches show up more prominently
     title = indexes.CharField(model_attr='title', boost=10.0)
 
@@ -34,9 +44,62 @@ class BillIndex(indexes.SearchIndex, indexes.Indexable):
     nonprofits = indexes.IntegerField(model_attr='nonprofits')
     other_sector = indexes.IntegerField(model_attr='other_sector')
 
+    #group of near-identical bills, results show one bill per group (see
+    #clusters.py). Bills that aren't in one are a group of their own
+    cluster = indexes.IntegerField()
+
+    #categories/sectors whose score meets the threshold (see labels.py), lets
+    #the sidebar filter with a single term lookup instead of a range per score
+    categories = indexes.MultiValueField()
+    sectors = indexes.MultiValueField()
+
+    #passages are numbered from the document field, so they're added once the
+    #other fields are prepared
+    def prepare(self, obj):
+        data = super().prepare(obj)
+        data['passages'] = get_passages(data[self.get_content_field()], obj.get_content().text)
+        return data
+
+    def prepare_cluster(self, obj):
+        return cluster_key(obj.id, obj.cluster_id)
+
+    def prepare_categories(self, obj):
+        return get_labels(obj, CATEGORIES)
+
+    def prepare_sectors(self, obj):
+        return get_labels(obj, SECTORS)
 
     def get_model(self):
         return Bill
 
     def index_queryset(self, using=None):
-            return self.get_model().objects.all()
+            return self.get_model().objects.select_related('content').defer('content__search_vector')
+
+    #bills loaded for search results, with the keywords in context shown on the
+    #page but not the full text
+    def read_queryset(self, using=None):
+        return self.get_model().objects.select_related('content').defer('content__text', 'content__search_vector')
+
+
+#one document per passage of a bill's text, kept in its own whoosh index (the
+#'passages' connection) and only used when PASSAGE_SEARCH is on
+class BillPassageIndex(indexes.SearchIndex, indexes.Indexable):
+    text = indexes.CharField(document=True)
+
+    #parent bill, results are collapsed to one passage per bill
+    bill = indexes.IntegerField(model_attr='bill_id')
+    start = indexes.IntegerField(model_attr='start', indexed=False)
+    end = indexes.IntegerField(model_attr='end', indexed=False)
+
+    #the passage's text is cut out of the bill's text by the database
+    def prepare_text(self, obj):
+        return obj.passage_text
+
+    def get_model(self):
+        return BillPassage
+
+    #empty passages only record that a text with none was built (see build_passages)
+    def index_queryset(self, using=None):
+        return self.get_model().objects.filter(end__gt=F('start')).annotate(
+            passage_text=Substr('bill__content__text', F('start') + 1, F('end') - F('start'))
+        )
@@ -0,0 +1,62 @@
+#keeps the search index up to date when bills are saved or deleted
+#(configured as HAYSTACK_SIGNAL_PROCESSOR in the settings)
+
+import threading
+
+from django.db import models, transaction
+from haystack.signals import RealtimeSignalProcessor
+
+from search.models import Bill, BillContent
+from search.passages import unindex_passages
+
+
+class BillSignalProcessor(RealtimeSignalProcessor):
+
+    #only listens to the models that affect the index, so other models (like
+    #passages) can still be deleted in bulk without loading each row
+    def setup(self):
+        #bills saved in each thread that are waiting for their transaction to
+        #commit (see pending_bills)
+        self.pending = threading.local()
+        for model in (Bill, BillContent):
+            models.signals.post_save.connect(self.handle_save, sender=model)
+        models.signals.post_delete.connect(self.handle_delete, sender=Bill)
+
+    def teardown(self):
+        for model in (Bill, BillContent):
+            models.signals.post_save.disconnect(self.handle_save, sender=model)
+        models.signals.post_delete.disconnect(self.handle_delete, sender=Bill)
+
+    #a bill's text is indexed with the bill, so saving its content reindexes
+    #the bill (content is saved after the bill when it's first added). Inside a
+    #transaction the index is only updated once it commits, so a bill whose
+    #content fails to save isn't left in the index, and it's updated once even
+    #when both the bill and its content were saved
+    def handle_save(self, sender, instance, **kwargs):
+        if sender is BillContent:
+            instance = instance.bill
+        self.pending_bills()[instance.pk] = instance
+        transaction.on_commit(lambda: self.index_pending(instance.pk, **kwargs))
+
+    #{pk: last saved instance} of the bills saved in this thread whose index
+    #update hasn't run yet
+    def pending_bills(self):
+        if not hasattr(self.pending, 'bills'):
+            self.pending.bills = {}
+        return self.pending.bills
+
+    #a deleted bill also leaves the passage index once the deletion commits (its
+    #passages are deleted with it), and isn't indexed again by a save queued
+    #earlier in the transaction
+    def handle_delete(self, sender, instance, **kwargs):
+        pk = instance.pk
+        self.pending_bills().pop(pk, None)
+        super().handle_delete(sender, instance, **kwargs)
+        transaction.on_commit(lambda: unindex_passages([pk]))
+
+    #the first update queued for a bill indexes it, the others find it done.
+    #(an update dropped by a rollback leaves its bill here until it's saved again)
+    def index_pending(self, pk, **kwargs):
+        instance = self.pending_bills().pop(pk, None)
+        if instance is not None:
+            super().handle_save(Bill, instance, **kwargs)
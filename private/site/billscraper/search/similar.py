@@ -0,0 +1,261 @@
+#bills with similar text, for "which other states have a bill like this one?".
+#Every bill's words are hashed into a fixed number of features and weighted by
+#tf-idf (rebuilt after each ingestion with python manage.py build_similar, only
+#re-reading the bills that changed), then stored with an inverted index and
+#memory-mapped like the facet store, so finding the bills closest to one is a
+#few hundred array lookups with no database or index query
+
+import os
+import re
+import json
+import time
+import zlib
+import datetime
+from collections import Counter
+
+import numpy as np
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from whoosh.analysis import STOP_WORDS
+
+from search.models import Bill
+from search.facets import new_build, publish_build, current_build
+
+#bills read from the database at once
+READ_BATCH = 500
+
+#number of features words are hashed into
+FEATURES = 2 ** 20
+
+#characters of each text read (enough to tell what a bill is about, even for very long texts)
+MAX_TEXT_CHARS = 200000
+
+#most distinct words counted per bill, and features kept in its vector (the
+#ones with the highest weights)
+MAX_WORDS = 2000
+VECTOR_FEATURES = 150
+
+#bills kept in each feature's list in the inverted index (the ones it weighs
+#most in). Words found in most bills would otherwise make every lookup add up
+#scores for the whole corpus, for very little of each bill's score
+MAX_POSTINGS = 5000
+
+#most similar bills returned at once
+MAX_SIMILAR = 50
+
+#seconds between checks for a newly built store
+RELOAD_INTERVAL = 30
+
+#arrays of a build, read by the store (the counts are only used for the next build)
+ARRAYS = ['ids', 'states', 'count_ptr', 'count_features', 'counts', 'vector_ptr', 'vector_features', 'vector_weights',
+    'posting_ptr', 'posting_docs', 'posting_weights']
+
+def similar_path():
+    return settings.SIMILAR_PATH
+
+#(hashed features, counts) of the words of a bill, stop words and words shorter
+#than three letters left out
+def word_counts(title, description, text):
+    words = re.findall(r'[a-z]{3,}', ' '.join([title or '', description or '', (text or '')[:MAX_TEXT_CHARS]]).lower())
+    counts = Counter(word for word in words if word not in STOP_WORDS).most_common(MAX_WORDS)
+
+    features = Counter()
+    for word, count in counts:
+        features[zlib.crc32(word.encode()) % FEATURES] += count
+    return np.fromiter(features.keys(), dtype=np.int32, count=len(features)), np.fromiter(features.values(), dtype=np.int32, count=len(features))
+
+#(ptr, values...) of rows of a compressed sparse array in a new order: row i of
+#the result is row order[i]
+def take_rows(ptr, order, *values):
+    lengths = np.diff(ptr)[order]
+    new_ptr = np.zeros(len(order) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=new_ptr[1:])
+    positions = np.repeat(ptr[:-1][order] - new_ptr[:-1], lengths) + np.arange(new_ptr[-1], dtype=np.int64)
+    return (new_ptr, *(array[positions] for array in values))
+
+#(vector ptr, features, weights) from word counts: tf-idf weights, keeping the
+#VECTOR_FEATURES highest of each bill, scaled to unit length
+def weigh(count_ptr, count_features, counts):
+    num_bills = len(count_ptr) - 1
+    rows = np.repeat(np.arange(num_bills, dtype=np.int64), np.diff(count_ptr))
+
+    doc_frequency = np.bincount(count_features, minlength=FEATURES)
+    idf = np.log((1 + num_bills) / (1 + doc_frequency)) + 1
+    weights = (1 + np.log(counts)) * idf[count_features]
+
+    #highest weights first within each bill, then keep the first VECTOR_FEATURES
+    order = np.lexsort((-weights, rows))
+    rank = np.arange(len(order), dtype=np.int64) - count_ptr[rows[order]]
+    kept = order[rank < VECTOR_FEATURES]
+    rows, features, weights = rows[kept], count_features[kept], weights[kept]
+
+    norms = np.sqrt(np.bincount(rows, weights=weights ** 2, minlength=num_bills))
+    weights = (weights / norms[rows]).astype(np.float32)
+
+    vector_ptr = np.zeros(num_bills + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=num_bills), out=vector_ptr[1:])
+    return vector_ptr, features, weights
+
+#(ptr, bill positions, weights) of the bills having each feature, at most
+#MAX_POSTINGS of them (the highest weights)
+def invert(vector_ptr, vector_features, vector_weights):
+    rows = np.repeat(np.arange(len(vector_ptr) - 1, dtype=np.int32), np.diff(vector_ptr))
+
+    #grouped by feature, highest weights first
+    order = np.lexsort((-vector_weights, vector_features))
+    full_ptr = np.zeros(FEATURES + 1, dtype=np.int64)
+    np.cumsum(np.bincount(vector_features, minlength=FEATURES), out=full_ptr[1:])
+    rank = np.arange(len(order), dtype=np.int64) - full_ptr[vector_features[order]]
+    kept = order[rank < MAX_POSTINGS]
+
+    posting_ptr = np.zeros(FEATURES + 1, dtype=np.int64)
+    np.cumsum(np.bincount(vector_features[kept], minlength=FEATURES), out=posting_ptr[1:])
+    return posting_ptr, rows[kept], vector_weights[kept]
+
+#writes a new build of the store and makes it the current one. Only the bills
+#added or changed since the last build are read again unless full is set.
+#Returns (bills in the store, bills read)
+def build_similar(path=None, full=False):
+    path = path or similar_path()
+    built_at = timezone.now()
+
+    previous = None
+    build = None if full else current_build(path)
+    if build is not None:
+        previous = SimilarStore(os.path.join(path, build))
+
+    states = dict(Bill.objects.values_list('id', 'state'))
+    ids = np.array(sorted(states), dtype=np.int64)
+
+    #word counts of the previous build for the bills that haven't changed
+    kept = np.zeros(0, dtype=np.int64)
+    kept_counts = (np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32))
+    if previous is not None:
+        changed = Bill.objects.filter(Q(updated_at__gt=previous.built_at) | Q(content__updated_at__gt=previous.built_at)).values_list('id', flat=True)
+        positions = np.flatnonzero(np.isin(previous.ids, ids) & ~np.isin(previous.ids, list(changed)))
+        kept = np.asarray(previous.ids[positions])
+        kept_counts = take_rows(previous.count_ptr, positions, previous.count_features, previous.counts)
+
+    #word counts of every other bill
+    to_read = ids[~np.isin(ids, kept)].tolist()
+    read_ids, read_features, read_counts = [], [], []
+    for batch in range(0, len(to_read), READ_BATCH):
+        rows = Bill.objects.filter(id__in=to_read[batch:batch + READ_BATCH]).values_list('id', 'title', 'description', 'content__text')
+        for bill_id, title, description, text in rows:
+            features, counts = word_counts(title, description, text)
+            read_ids.append(bill_id)
+            read_features.append(features)
+            read_counts.append(counts)
+
+    read_ptr = np.zeros(len(read_ids) + 1, dtype=np.int64)
+    np.cumsum([len(features) for features in read_features], out=read_ptr[1:])
+
+    #both sets of rows in order of id
+    all_ids = np.concatenate([kept, np.array(read_ids, dtype=np.int64)])
+    count_ptr = np.concatenate([kept_counts[0], kept_counts[0][-1] + read_ptr[1:]])
+    count_features = np.concatenate([kept_counts[1], *read_features]).astype(np.int32)
+    counts = np.concatenate([kept_counts[2], *read_counts]).astype(np.int32)
+    order = np.argsort(all_ids, kind='stable')
+    count_ptr, count_features, counts = take_rows(count_ptr, order, count_features, counts)
+    all_ids = all_ids[order]
+
+    vector_ptr, vector_features, vector_weights = weigh(count_ptr, count_features, counts)
+    posting_ptr, posting_docs, posting_weights = invert(vector_ptr, vector_features, vector_weights)
+
+    #jurisdictions coded as integers, like the facet store
+    vocab = sorted(set(states.values()))
+    codes = {state: code for code, state in enumerate(vocab)}
+
+    arrays = {
+        'ids': all_ids,
+        'states': np.array([codes[states[bill_id]] for bill_id in all_ids.tolist()], dtype=np.int16),
+        'count_ptr': count_ptr,
+        'count_features': count_features,
+        'counts': counts,
+        'vector_ptr': vector_ptr,
+        'vector_features': vector_features,
+        'vector_weights': vector_weights,
+        'posting_ptr': posting_ptr,
+        'posting_docs': posting_docs,
+        'posting_weights': posting_weights,
+    }
+
+    build, build_path = new_build(path)
+    for name, array in arrays.items():
+        np.save(os.path.join(build_path, name + '.npy'), array)
+    with open(os.path.join(build_path, 'meta.json'), 'w') as file:
+        json.dump({'built_at': built_at.isoformat(), 'states': vocab}, file)
+    publish_build(path, build)
+
+    return len(all_ids), len(read_ids)
+
+
+class SimilarStore:
+
+    def __init__(self, path):
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, name + '.npy'), mmap_mode='r'))
+
+        with open(os.path.join(path, 'meta.json'), 'r') as file:
+            meta = json.load(file)
+        self.built_at = datetime.datetime.fromisoformat(meta['built_at'])
+        self.vocab = meta['states']
+
+    def __len__(self):
+        return len(self.ids)
+
+    #position of a bill in the store, None if it isn't there
+    def position(self, bill_id):
+        position = int(np.searchsorted(self.ids, bill_id))
+        if position < len(self.ids) and self.ids[position] == bill_id:
+            return position
+        return None
+
+    #[(bill id, cosine similarity)] of the bills closest to a bill, most similar
+    #first (None if the bill isn't in the store). other_states leaves out bills
+    #from the same jurisdiction
+    def similar(self, bill_id, limit=10, other_states=False):
+        position = self.position(bill_id)
+        if position is None:
+            return None
+
+        scores = np.zeros(len(self), dtype=np.float32)
+        start, end = self.vector_ptr[position], self.vector_ptr[position + 1]
+        for feature, weight in zip(self.vector_features[start:end].tolist(), self.vector_weights[start:end].tolist()):
+            first, last = self.posting_ptr[feature], self.posting_ptr[feature + 1]
+            scores[self.posting_docs[first:last]] += weight * self.posting_weights[first:last]
+
+        scores[position] = 0
+        if other_states:
+            scores[self.states == self.states[position]] = 0
+
+        limit = min(limit, len(self) - 1)
+        if limit <= 0:
+            return []
+        best = np.argpartition(-scores, limit - 1)[:limit]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return [(int(self.ids[best_position]), float(scores[best_position])) for best_position in best.tolist() if scores[best_position] > 0]
+
+
+_store = None
+_store_build = None
+_checked_at = None
+
+#returns the current store (None if it hasn't been built), checking for a new
+#build at most every RELOAD_INTERVAL seconds
+def get_similar_store():
+    global _store, _store_build, _checked_at
+
+    now = time.monotonic()
+    if _checked_at is not None and now - _checked_at < RELOAD_INTERVAL:
+        return _store
+    _checked_at = now
+
+    build = current_build(similar_path())
+    if build is not None and build != _store_build:
+        _store = SimilarStore(os.path.join(similar_path(), build))
+        _store_build = build
+
+    return _store
@@ -0,0 +1,182 @@
+#read-only sqlite copy of the database for people who want to query it offline
+#(built nightly with python manage.py build_snapshot). It has every bill's
+#metadata, scores and keyword counts, its text (zlib compressed when that makes
+#it smaller) and an fts5 index over title, description and text. Each build
+#starts from the previous snapshot and only copies the bills saved since then
+
+import os
+import json
+import zlib
+import shutil
+import sqlite3
+import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from search.models import Bill
+
+#changes when the layout of the file changes (older snapshots are rebuilt)
+SCHEMA_VERSION = '3'
+
+#bills written at a time
+BATCH_SIZE = 500
+
+#bills saved up to this long before the last build are copied again, so a bill
+#saved while the last build was reading isn't missed
+SAFETY_MARGIN = datetime.timedelta(minutes=10)
+
+#bill columns copied as they are
+COLUMNS = [field.column for field in Bill._meta.concrete_fields]
+
+def snapshot_path():
+    return settings.SNAPSHOT_PATH
+
+def create_tables(db):
+    db.execute(f"CREATE TABLE bills ({', '.join(f'{column} {sql_type(column)}' for column in COLUMNS)}, text BLOB, text_zlib INTEGER, keyword_instances TEXT)")
+
+    #the fts index keeps no copy of the text (rowid is the bill id)
+    db.execute("CREATE VIRTUAL TABLE bills_fts USING fts5(title, description, text, content='', tokenize='porter unicode61')")
+    db.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+
+def sql_type(column):
+    field = Bill._meta.get_field(column)
+    if column == 'id':
+        return 'INTEGER PRIMARY KEY'
+    if field.get_internal_type() in ('IntegerField', 'BigIntegerField', 'AutoField', 'BigAutoField'):
+        return 'INTEGER'
+    return 'TEXT'
+
+def get_meta(db, key):
+    try:
+        row = db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    except sqlite3.DatabaseError:
+        return None
+    return row[0] if row else None
+
+def set_meta(db, key, value):
+    db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+#(stored text, whether it's compressed)
+def pack_text(text):
+    encoded = (text or '').encode()
+    compressed = zlib.compress(encoded, 6)
+    if len(compressed) < len(encoded):
+        return compressed, 1
+    return encoded, 0
+
+def unpack_text(blob, compressed):
+    return (zlib.decompress(blob) if compressed else blob).decode() if blob is not None else ''
+
+def sql_value(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, list):
+        return json.dumps(value)
+    return value
+
+#removes bills from the fts index, which needs the values they were indexed with
+def remove_from_index(db, ids):
+    for start in range(0, len(ids), BATCH_SIZE):
+        batch = ids[start:start + BATCH_SIZE]
+        rows = db.execute(
+            f"SELECT id, title, description, text, text_zlib FROM bills WHERE id IN ({', '.join('?' * len(batch))})", batch
+        ).fetchall()
+        db.executemany(
+            "INSERT INTO bills_fts (bills_fts, rowid, title, description, text) VALUES ('delete', ?, ?, ?, ?)",
+            [(bill_id, title, description, unpack_text(text, text_zlib)) for bill_id, title, description, text, text_zlib in rows],
+        )
+        db.execute(f"DELETE FROM bills WHERE id IN ({', '.join('?' * len(batch))})", batch)
+
+#copies bills (a queryset) into the snapshot, replacing older copies
+def write_bills(db, bills):
+    written = 0
+    batch = []
+
+    def flush():
+        remove_from_index(db, [row[0] for row in batch])
+        db.executemany(f"INSERT INTO bills VALUES ({', '.join('?' * (len(COLUMNS) + 3))})", [row[:-1] for row in batch])
+        db.executemany(
+            "INSERT INTO bills_fts (rowid, title, description, text) VALUES (?, ?, ?, ?)",
+            [(row[0], row[COLUMNS.index('title')], row[COLUMNS.index('description')], row[-1]) for row in batch],
+        )
+
+    for bill in bills.select_related('content').defer('content__search_vector').order_by('id').iterator(chunk_size=BATCH_SIZE):
+        content = bill.get_content()
+        text, text_zlib = pack_text(content.text)
+        batch.append((
+            *(sql_value(getattr(bill, column)) for column in COLUMNS),
+            text, text_zlib, json.dumps(content.keyword_instances),
+            #plain text for the fts index (not stored)
+            content.text or '',
+        ))
+        if len(batch) >= BATCH_SIZE:
+            flush()
+            written += len(batch)
+            batch = []
+
+    if batch:
+        flush()
+        written += len(batch)
+    return written
+
+#builds a new snapshot next to the current one and swaps it in. Returns
+#(bills copied, bills removed, whether it was built from scratch)
+def build_snapshot(path=None, full=False):
+    path = path or snapshot_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    #anything saved from here on is copied by the next build
+    started = timezone.now()
+
+    since = None
+    if not full and os.path.exists(path):
+        shutil.copyfile(path, tmp_path)
+        db = sqlite3.connect(tmp_path)
+        since = get_meta(db, 'updated_through') if get_meta(db, 'schema_version') == SCHEMA_VERSION else None
+        if since is None:
+            db.close()
+            os.remove(tmp_path)
+
+    if since is None:
+        db = sqlite3.connect(tmp_path)
+        create_tables(db)
+
+    try:
+        with db:
+            bills = Bill.objects.all()
+            removed = []
+            if since is not None:
+                since = datetime.datetime.fromisoformat(since) - SAFETY_MARGIN
+                bills = bills.filter(Q(updated_at__gt=since) | Q(content__updated_at__gt=since))
+
+                #bills deleted from the database since the last build
+                current = set(Bill.objects.values_list('id', flat=True).iterator(chunk_size=10000))
+                removed = [bill_id for (bill_id,) in db.execute("SELECT id FROM bills") if bill_id not in current]
+                remove_from_index(db, removed)
+
+            written = write_bills(db, bills)
+
+            set_meta(db, 'schema_version', SCHEMA_VERSION)
+            set_meta(db, 'updated_through', started.isoformat())
+            set_meta(db, 'built_at', timezone.now().isoformat())
+            set_meta(db, 'bills', str(db.execute("SELECT count(*) FROM bills").fetchone()[0]))
+
+        #merges the fts index and drops free pages so the file is as small as it can be
+        db.execute("INSERT INTO bills_fts (bills_fts) VALUES ('optimize')")
+        db.commit()
+        db.execute("VACUUM")
+    finally:
+        db.close()
+
+    #readers either see the old file or the new one
+    with open(tmp_path, 'rb') as file:
+        os.fsync(file.fileno())
+    os.chmod(tmp_path, 0o444)
+    os.replace(tmp_path, path)
+
+    return written, len(removed), since is None
@@ -0,0 +1,40 @@
+// fills in suggestions under search boxes with a data-suggest attribute (the url
+// of the suggest view) as the user types
+document.addEventListener('DOMContentLoaded', function () {
+    document.querySelectorAll('input[data-suggest]').forEach(function (input, index) {
+        var list = document.createElement('datalist');
+        list.id = 'search-suggestions-' + index;
+        input.setAttribute('list', list.id);
+        input.setAttribute('autocomplete', 'off');
+        input.after(list);
+
+        var timer = null;
+        input.addEventListener('input', function () {
+            clearTimeout(timer);
+            var typed = input.value.trim();
+            if (typed.length < 2) {
+                list.innerHTML = '';
+                return;
+            }
+
+            // waits for a pause in typing before asking
+            timer = setTimeout(function () {
+                fetch(input.dataset.suggest + '?' + new URLSearchParams({q: typed}))
+                    .then(function (response) { return response.json(); })
+                    .then(function (data) {
+                        if (input.value.trim() !== typed) {
+                            return;
+                        }
+                        list.innerHTML = '';
+                        data.suggestions.forEach(function (suggestion) {
+                            var option = document.createElement('option');
+                            option.value = suggestion.query;
+                            option.label = suggestion.text;
+                            list.appendChild(option);
+                        });
+                    })
+                    .catch(function () {});
+            }, 100);
+        });
+    });
+});
@@ -0,0 +1,92 @@
+#counts of bills by jurisdiction, collection, status, month, category and
+#sector, computed after each ingestion into the CorpusStat table (python manage.py
+#refresh_stats) and cached in each worker, so pages showing them never count bills
+
+import time
+
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.functions import TruncMonth
+
+from search.models import Bill, CorpusStat
+from search.labels import CATEGORIES, SECTORS, get_thresholds
+
+#bill fields counted by value for each dimension
+FIELD_DIMENSIONS = {
+    'jurisdiction': 'state',
+    'collection': 'content_collection',
+    'status': 'status',
+}
+
+#seconds a worker keeps the stats before reading the table again
+STATS_TTL = 300
+
+#{dimension: {key: count}} computed from the bills
+def compute_stats():
+    stats = {'total': {'': Bill.objects.count()}}
+
+    for dimension, field in FIELD_DIMENSIONS.items():
+        rows = Bill.objects.order_by().values_list(field).annotate(count=Count('id'))
+        stats[dimension] = {key: count for key, count in rows}
+
+    rows = Bill.objects.order_by().annotate(month=TruncMonth('status_date')).values_list('month').annotate(count=Count('id'))
+    stats['month'] = {month.strftime('%Y-%m'): count for month, count in rows if month}
+
+    #bills labeled with each category/sector (see labels.py), counted in one query
+    thresholds = get_thresholds()
+    for dimension, fields in (('category', CATEGORIES), ('sector', SECTORS)):
+        counts = Bill.objects.aggregate(**{field: Count('id', filter=Q(**{f'{field}__gte': thresholds[field]})) for field in fields})
+        stats[dimension] = counts
+
+    return stats
+
+#replaces the stored stats with freshly computed ones, returns the number of rows
+def refresh_stats():
+    global _checked_at
+
+    stats = compute_stats()
+    rows = [CorpusStat(dimension=dimension, key=key, count=count) for dimension, counts in stats.items() for key, count in counts.items()]
+
+    #readers see either the old stats or the new ones
+    with transaction.atomic():
+        CorpusStat.objects.all().delete()
+        CorpusStat.objects.bulk_create(rows)
+
+    #read again on the next request in this process
+    _checked_at = None
+    return len(rows)
+
+_stats = None
+_refreshed_at = None
+_checked_at = None
+
+#{dimension: {key: count}} from the table, read at most every STATS_TTL seconds
+#({} if the stats have never been refreshed)
+def get_stats():
+    global _stats, _refreshed_at, _checked_at
+
+    now = time.monotonic()
+    if _checked_at is not None and now - _checked_at < STATS_TTL:
+        return _stats
+    _checked_at = now
+
+    stats = {}
+    refreshed = None
+    for dimension, key, count, row_refreshed in CorpusStat.objects.order_by('dimension', 'key').values_list('dimension', 'key', 'count', 'refreshed_at'):
+        stats.setdefault(dimension, {})[key] = count
+        refreshed = max(refreshed, row_refreshed) if refreshed else row_refreshed
+    _stats, _refreshed_at = stats, refreshed
+    return _stats
+
+#when the cached stats were refreshed (None if they never were)
+def stats_refreshed_at():
+    get_stats()
+    return _refreshed_at
+
+#number of bills in the database (counted directly if the stats have never
+#been refreshed)
+def total_bills():
+    stats = get_stats()
+    if 'total' in stats:
+        return stats['total']['']
+    return Bill.objects.count()
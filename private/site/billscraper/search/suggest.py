@@ -0,0 +1,213 @@
+#prefix index behind the search box's suggestions (titles, bill numbers, sponsors
+#and words from the index), rebuilt after each ingestion with python manage.py
+#build_suggestions and memory-mapped like the facet store, so a suggestion is a
+#binary search over a sorted array with no database or index query
+
+import os
+import re
+import time
+
+import numpy as np
+
+from django.conf import settings
+from haystack import connections
+
+from search.models import Bill
+from search.facets import new_build, publish_build, current_build
+
+#bytes of each key kept (longer keys are cut, so are longer prefixes)
+KEY_BYTES = 48
+
+#suggestions are found from the start of each of the first TITLE_WORDS words
+#of a title, so the middle of a title can be typed too
+TITLE_WORDS = 10
+
+#words from the index are kept if they're in at least MIN_TERM_DOCS documents,
+#the MAX_TERMS most common of them
+MIN_TERM_DOCS = 2
+MAX_TERMS = 50000
+
+#kinds of suggestion in the order they're coded
+KINDS = ['title', 'bill_number', 'sponsor', 'term']
+
+#longest label shown for a suggestion
+MAX_LABEL_CHARS = 100
+
+#ranking bonus for a key that's exactly what was typed (like a full bill number)
+EXACT_BONUS = 1e9
+
+#seconds between checks for a newly built index
+RELOAD_INTERVAL = 30
+
+def suggest_path():
+    return settings.SUGGEST_PATH
+
+#lowercase words separated by single spaces, how keys and prefixes are compared
+def normalize(text):
+    return ' '.join(re.findall(r'[^\W_]+', (text or '').lower()))
+
+def to_key(text):
+    return normalize(text).encode()[:KEY_BYTES]
+
+#a phrase search for text that can't break the query parser
+def phrase(text):
+    return '"' + text.replace('"', ' ') + '"'
+
+#(uint8 array, offsets) of a list of strings, string i is blob[offsets[i]:offsets[i + 1]]
+def pack(strings):
+    encoded = [string.encode() for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(string) for string in encoded], dtype=np.int64)
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+#(text, doc frequency) of the most common words in the whoosh index
+def index_terms():
+    backend = connections['default'].get_backend()
+    backend.setup()
+    field = backend.index.schema[backend.content_field_name]
+
+    #the content field is stemmed, its unstemmed words are kept for spelling
+    fieldname = field.spelling_fieldname(backend.content_field_name) if field.separate_spelling() else backend.content_field_name
+
+    with backend.index.reader() as reader:
+        terms = [(text.decode(), info.doc_frequency()) for text, info in reader.iter_field(fieldname) if info.doc_frequency() >= MIN_TERM_DOCS]
+    terms.sort(key=lambda term: term[1], reverse=True)
+    return terms[:MAX_TERMS]
+
+#writes a new build of the prefix index and makes it the current one
+def build_suggestions(path=None):
+    path = path or suggest_path()
+
+    #suggestions (label, search query, kind, weight) and the keys they're found by.
+    #Sponsors and words are weighted by how many bills they're in, single bills
+    #by their share of the most keywords
+    values = []
+    entries = []
+
+    def add(label, query, kind, weight, keys):
+        value = len(values)
+        values.append((label[:MAX_LABEL_CHARS], query, KINDS.index(kind), weight))
+        entries.extend((key, value) for key in keys if key)
+
+    bills = Bill.objects.order_by('id').values_list('title', 'bill_number', 'primary_sponsor', 'total_keywords')
+    most_keywords = max(Bill.objects.order_by('-total_keywords').values_list('total_keywords', flat=True)[:1], default=0) or 1
+    sponsors = {}
+
+    for title, bill_number, sponsor, total_keywords in bills.iterator(chunk_size=5000):
+        weight = 1 + total_keywords / most_keywords
+
+        if sponsor and sponsor != 'N/A':
+            sponsors[sponsor] = sponsors.get(sponsor, 0) + 1
+
+        if not title or title == 'N/A':
+            continue
+
+        words = normalize(title).split(' ')
+        add(title, phrase(title), 'title', weight, {' '.join(words[i:]).encode()[:KEY_BYTES] for i in range(min(len(words), TITLE_WORDS))})
+
+        #bill numbers match with or without spaces (hb 123 or hb123), they're
+        #searched by title since numbers aren't in the index
+        if bill_number and bill_number != 'N/A':
+            add(f'{bill_number}: {title}', phrase(title), 'bill_number', weight, {to_key(bill_number), to_key(bill_number).replace(b' ', b'')})
+
+    #sponsors match by any of their names
+    for sponsor, count in sponsors.items():
+        words = normalize(sponsor).split(' ')
+        add(sponsor, phrase(sponsor), 'sponsor', count, {' '.join(words[i:]).encode()[:KEY_BYTES] for i in range(len(words))})
+
+    for term, count in index_terms():
+        add(term, term, 'term', count, {to_key(term)})
+
+    entries.sort()
+    labels, labels_offsets = pack([value[0] for value in values])
+    queries, queries_offsets = pack([value[1] for value in values])
+    arrays = {
+        'keys': np.array([key for key, _ in entries], dtype=f'S{KEY_BYTES}'),
+        'entries': np.array([value for _, value in entries], dtype=np.int32),
+        'kinds': np.array([value[2] for value in values], dtype=np.int8),
+        'weights': np.array([value[3] for value in values], dtype=np.float32),
+        'labels': labels,
+        'labels_offsets': labels_offsets,
+        'queries': queries,
+        'queries_offsets': queries_offsets,
+    }
+
+    build, build_path = new_build(path)
+    for name, array in arrays.items():
+        np.save(os.path.join(build_path, name + '.npy'), array)
+    publish_build(path, build)
+
+    return len(values), len(entries)
+
+
+class Suggester:
+
+    def __init__(self, path):
+        self.arrays = {
+            name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+            for name in ('keys', 'entries', 'kinds', 'weights', 'labels', 'labels_offsets', 'queries', 'queries_offsets')
+        }
+        self.keys = self.arrays['keys']
+
+    def string(self, name, value):
+        offsets = self.arrays[name + '_offsets']
+        return self.arrays[name][offsets[value]:offsets[value + 1]].tobytes().decode()
+
+    #best suggestions for what's been typed so far, exact matches first then
+    #by weight
+    def suggest(self, prefix, limit=8):
+        key = to_key(prefix)[:KEY_BYTES - 1]
+        if not key:
+            return []
+
+        start = np.searchsorted(self.keys, key, side='left')
+        end = np.searchsorted(self.keys, key + b'\xff', side='left')
+        if start == end:
+            return []
+
+        values = np.asarray(self.arrays['entries'][start:end])
+        scores = self.arrays['weights'][values].astype(np.float64)
+        scores += EXACT_BONUS * (self.keys[start:end] == key)
+
+        #a value can be found by several keys, so more candidates than needed
+        #are ranked before removing duplicates
+        candidates = min(len(values), limit * TITLE_WORDS)
+        best = np.argpartition(-scores, candidates - 1)[:candidates]
+        best = best[np.argsort(-scores[best], kind='stable')]
+
+        suggestions = []
+        seen = set()
+        for value in values[best].tolist():
+            if value in seen:
+                continue
+            seen.add(value)
+            suggestions.append({
+                'text': self.string('labels', value),
+                'query': self.string('queries', value),
+                'kind': KINDS[self.arrays['kinds'][value]],
+            })
+            if len(suggestions) >= limit:
+                break
+        return suggestions
+
+
+_suggester = None
+_suggester_build = None
+_checked_at = None
+
+#returns the current prefix index (None if it hasn't been built), checking for
+#a new build at most every RELOAD_INTERVAL seconds
+def get_suggester():
+    global _suggester, _suggester_build, _checked_at
+
+    now = time.monotonic()
+    if _checked_at is not None and now - _checked_at < RELOAD_INTERVAL:
+        return _suggester
+    _checked_at = now
+
+    build = current_build(suggest_path())
+    if build is not None and build != _suggester_build:
+        _suggester = Suggester(os.path.join(suggest_path(), build))
+        _suggester_build = build
+
+    return _suggester
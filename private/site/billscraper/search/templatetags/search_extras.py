@@ -0,0 +1,15 @@
+#template tags used by the search pages
+
+from django import template
+
+register = template.Library()
+
+#number of results for a sidebar option, e.g. {% facet_count 'jurisdiction' 'Alabama' %}
+#(shows nothing if counts aren't available)
+@register.simple_tag(takes_context=True)
+def facet_count(context, facet, value):
+    counts = context.get('facet_counts') or {}
+    count = counts.get(facet, {}).get(value)
+    if count is None:
+        return ''
+    return f'({count})'
@@ -1,3 +1,144 @@
-from django.test import TestCase
+import os
+import json
+import time
+import datetime
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.core.management import call_command
+from haystack import connections, connection_router
+from haystack.signals import RealtimeSignalProcessor, BaseSignalProcessor
+
+from search.models import Bill, BillContent
+from search.signals import BillSignalProcessor
+from search import coalesce
+
+#labeled queries for the bills in fixtures/ranking_bills.json
+RANKING_LABELS = os.path.join(os.path.dirname(__file__), 'fixtures', 'ranking_labels.csv')
 
 # Create your tests here.
+class ExportBillsTests(TestCase):
+
+    def setUp(self):
+        #bulk_create skips the signals, so nothing is written to the search index
+        Bill.objects.bulk_create([
+            Bill(title=f'Bill {number}', bill_number=f'HB {number}', content_collection=collection,
+                status_date=datetime.date(2024, 1, number + 1), last_action_date=datetime.date(2024, 1, number + 1))
+            for number, collection in enumerate(['Legislation', 'Legislation', 'Code of Federal Regulations'])
+        ])
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'bills.ndjson')
+
+    def read_export(self):
+        with open(self.path, 'r') as file:
+            return [json.loads(line) for line in file]
+
+    def test_exports_matching_bills_newest_first(self):
+        out = StringIO()
+        call_command('export_bills', self.path, '--query', 'collection=Legislation', '--fields', 'id,title', stdout=out)
+
+        self.assertEqual([row['title'] for row in self.read_export()], ['Bill 1', 'Bill 0'])
+        self.assertIn('Export written successfully', out.getvalue())
+
+    def test_warns_when_the_text_query_was_cut_short(self):
+        err = StringIO()
+        with mock.patch('search.management.commands.export_bills.api_queryset', return_value=(Bill.objects.all(), True)):
+            call_command('export_bills', self.path, '--fields', 'id', stdout=StringIO(), stderr=err)
+
+        self.assertEqual(len(self.read_export()), 3)
+        self.assertIn('took too long', err.getvalue())
+
+
+class CoalesceTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.settings = override_settings(COALESCE_PATH=directory.name)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+
+    def test_runs_the_search_when_nothing_else_is_running(self):
+        key = coalesce.search_key('test', 'alone')
+        self.assertEqual(coalesce.single_flight(key, lambda: [1, 2]), [1, 2])
+
+    def test_handed_off_results_are_only_read_by_earlier_arrivals(self):
+        key = coalesce.search_key('test', 'handoff')
+        _, _, result_path = coalesce.slot_paths(key)
+        arrived = time.time()
+        coalesce.write_result(result_path, key, [3])
+
+        self.assertEqual(coalesce.read_result(result_path, key, arrived), ([3],))
+        self.assertIsNone(coalesce.read_result(result_path, key, time.time() + 1))
+        self.assertIsNone(coalesce.read_result(result_path, coalesce.search_key('test', 'other'), arrived))
+
+
+class RankingEvaluationTests(TestCase):
+    fixtures = ['ranking_bills']
+
+    def setUp(self):
+        #the fixture's bills are indexed on their own, in a temporary index
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.addCleanup(connections.reload, 'default')
+        patcher = mock.patch.dict(connections.connections_info, {'default': dict(connections.connections_info['default'], PATH=directory.name)})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        connections.reload('default')
+
+        index = connections['default'].get_unified_index().get_index(Bill)
+        connections['default'].get_backend().update(index, index.index_queryset())
+
+    #nDCG and MRR of each line of evaluate_ranking's output ({name: (ndcg, mrr)})
+    def evaluate(self, *args):
+        out = StringIO()
+        call_command('evaluate_ranking', RANKING_LABELS, *args, stdout=out)
+        scores = {}
+        for line in out.getvalue().splitlines():
+            if ': nDCG@' in line:
+                name, rest = line.split(': nDCG@', 1)
+                scores[name] = (float(rest.split()[1].rstrip(',')), float(rest.split()[3]))
+        return scores
+
+    def test_settings_weights_rank_the_labeled_queries_at_least_as_well_as_bm25f(self):
+        scores = self.evaluate()
+        self.assertGreaterEqual(scores['settings'][0], scores['bm25f'][0])
+        self.assertGreaterEqual(scores['settings'][1], scores['bm25f'][1])
+
+
+class BillSignalProcessorTests(TestCase):
+
+    def setUp(self):
+        processor = BillSignalProcessor(connections, connection_router)
+        self.addCleanup(processor.teardown)
+
+        patcher = mock.patch.object(RealtimeSignalProcessor, 'handle_save')
+        self.index_update = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_a_new_bill_is_indexed_once_when_its_transaction_commits(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            bill = Bill.objects.create(title='Bill 0')
+            BillContent.objects.create(bill=bill, text='text of bill 0')
+            self.index_update.assert_not_called()
+
+        self.assertEqual(self.index_update.call_count, 1)
+        self.assertEqual(self.index_update.call_args.args[1].pk, bill.pk)
+
+    @mock.patch.object(BaseSignalProcessor, 'handle_delete')
+    @mock.patch('search.signals.unindex_passages')
+    def test_a_deleted_bill_leaves_the_passage_index_and_isnt_reindexed(self, unindex_passages, index_delete):
+        bill = Bill.objects.create(title='Bill 0')
+        pk = bill.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            bill.title = 'Bill 0 renamed'
+            bill.save()
+            bill.delete()
+            unindex_passages.assert_not_called()
+
+        unindex_passages.assert_called_once_with([pk])
+        self.index_update.assert_not_called()
@@ -0,0 +1,142 @@
+#timings of search requests by phase, so slow searches can be found and
+#replayed: requests slower than SLOW_SEARCH_MS are written to a slow log with
+#how long each phase took, and a sample of every search goes to a replay log
+#for python manage.py load_test (both in SEARCH_LOG_PATH, rotated by
+#private/cron_scripts/rotate_search_logs.sh). With
+#SERVER_TIMING on, the phases are also sent to the browser in a Server-Timing header
+
+import os
+import json
+import time
+import random
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from logging.handlers import WatchedFileHandler
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils import timezone
+
+#phases timed during a search (phases can run inside others, like whoosh inside
+#count, and a phase that runs several times is added up, including parts of a
+#search running at the same time in the async results view):
+#parse: parsing the text query
+#whoosh: collecting matches from the index
+#count: counting the matches
+#highlight: picking and marking up the text samples
+#db: loading the page's bills from postgres (or the whole page for filter-only searches)
+#facets: the sidebar's counts
+#render: the html template
+#cache: cache lookups (http validators, result cards, results shared between workers)
+PHASES = ['parse', 'whoosh', 'count', 'highlight', 'db', 'facets', 'render', 'cache']
+
+_timings = contextvars.ContextVar('search_timings', default=None)
+
+
+class Timings:
+    #seconds spent in each phase of the current request, and counts recorded
+    #along the way (like the number of results)
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self.lock:
+            self.phases[name] = self.phases.get(name, 0) + seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    #{phase: milliseconds} in the order of PHASES
+    def milliseconds(self):
+        return {name: round(seconds * 1000, 2) for name, seconds in sorted(self.phases.items(), key=lambda item: PHASES.index(item[0]) if item[0] in PHASES else len(PHASES))}
+
+    #value of a Server-Timing header, e.g. "whoosh;dur=12.5, render;dur=8.1, total;dur=25.0"
+    def server_timing(self):
+        entries = [f'{name};dur={ms}' for name, ms in self.milliseconds().items()]
+        entries.append(f'total;dur={round(self.elapsed() * 1000, 2)}')
+        return ', '.join(entries)
+
+
+#starts timing the current request, returns the timings and a token for stop()
+def start():
+    timings = Timings()
+    return timings, _timings.set(timings)
+
+def stop(token):
+    _timings.reset(token)
+
+#timings of the current request (None if it isn't being timed)
+def current():
+    return _timings.get()
+
+#times a block as part of the current request (does nothing if it isn't being timed)
+@contextmanager
+def phase(name):
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started)
+
+#records a count for the current request, like the number of results
+def record(name, value):
+    timings = _timings.get()
+    if timings is not None:
+        timings.counts[name] = value
+
+
+class TimedLocMemCache(LocMemCache):
+    #LocMemCache whose lookups are counted as the cache phase (used for the
+    #result cards, see CACHES in settings)
+    def get(self, *args, **kwargs):
+        with phase('cache'):
+            return super().get(*args, **kwargs)
+
+    def set(self, *args, **kwargs):
+        with phase('cache'):
+            return super().set(*args, **kwargs)
+
+
+_loggers = {}
+_loggers_lock = threading.Lock()
+
+#logger writing to a file in SEARCH_LOG_PATH, one json object per line. Every
+#worker appends to the same file, so it's rotated from outside (by moving it
+#away, see private/cron_scripts/rotate_search_logs.sh) and each worker reopens
+#it when it's gone instead of rotating it itself. Created once per process even
+#when threads ask at the same time
+def get_logger(name):
+    if name not in _loggers:
+        with _loggers_lock:
+            if name not in _loggers:
+                os.makedirs(settings.SEARCH_LOG_PATH, exist_ok=True)
+                handler = WatchedFileHandler(os.path.join(settings.SEARCH_LOG_PATH, f'{name}.log'))
+                logger = logging.getLogger(f'search.{name}')
+                logger.addHandler(handler)
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+                _loggers[name] = logger
+    return _loggers[name]
+
+#writes a finished request to the slow log if it took too long, and to the
+#replay log if it's sampled
+def log_request(path, query, status, timings):
+    total = timings.elapsed() * 1000
+    entry = {'time': timezone.now().isoformat(), 'path': path, 'query': query}
+
+    if random.random() < getattr(settings, 'SEARCH_REPLAY_SAMPLE', 0):
+        get_logger('replay').info(json.dumps(entry))
+
+    if total >= getattr(settings, 'SLOW_SEARCH_MS', 1000):
+        entry.update(status=status, total_ms=round(total, 2), phases=timings.milliseconds(), **timings.counts)
+        get_logger('slow').info(json.dumps(entry))
@@ -1,10 +1,13 @@
+from django.conf import settings
 from django.urls import path
 
 from . import views
 
 #urls used in the site (aipolicydatabase/search/url)
 urlpatterns = [
-    path("results", views.results, name="results"),
+    path("results", views.results_async if settings.ASYNC_RESULTS else views.results, name="results"),
     path("home", views.home, name="home"),
     path("about", views.about, name="about"),
+    path("suggest", views.suggest, name="suggest"),
+    path("similar/<int:bill_id>", views.similar, name="similar"),
 ]
@@ -2,144 +2,111 @@
 
 from django.shortcuts import render
 
-from django.http import HttpResponse
-
+from django.core.cache import caches
+from django.core.cache.utils import make_template_fragment_key
+from django.http import JsonResponse
+from django.utils.cache import patch_cache_control
+
+from .filters import get_filters
+from .facets import get_facet_counts
+from .planner import get_engine, get_page, get_page_async, load_contents
+from .suggest import get_suggester
+from .similar import MAX_SIMILAR, get_similar_store
+from .clusters import add_cluster_members
 from .models import Bill
+from .stats import total_bills
+from .conditional import conditional_page, async_conditional_page
+from .timing import phase, record
+from .explain import wants_explain, explain_response
+from . import parallel
 
-from django.urls import reverse
-from urllib.parse import urlencode
-
-from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, SearchHeadline
-
-from django.utils.safestring import SafeString
-from django.core.paginator import Paginator
-from django.template import Context
-from django.db.models import Q
-
-from haystack.query import SearchQuerySet
-from haystack.utils.highlighting import Highlighter
-from haystack.inputs import Exact
-from haystack.query import SQ
-from haystack.inputs import Raw
-from haystack.inputs import AutoQuery
-
-import datetime
-
-from whoosh.qparser import QueryParserError
-from whoosh.qparser import QueryParser
-from whoosh.fields import Schema, TEXT
-
-from haystack.backends.whoosh_backend import WhooshSearchBackend
-from haystack import connections
-
-from whoosh.highlight import ContextFragmenter
-
-from haystack.utils import Highlighter
-
-import re
+import asyncio
 
 # Create your views here.
 
 #loads the about page
+@conditional_page
 def about(request):
     return render(request, 'search/about.html', {})
 
-#homepage
+#completions for the search box as json (see suggest.py), the same answer is
+#cached by browsers for a few minutes since people retype the same prefixes
+def suggest(request):
+    prefix = request.GET.get('q', '')
+    try:
+        limit = min(max(int(request.GET.get('limit', 8)), 1), 20)
+    except ValueError:
+        limit = 8
+
+    suggester = get_suggester()
+    suggestions = suggester.suggest(prefix, limit) if suggester else []
+
+    response = JsonResponse({'query': prefix, 'suggestions': suggestions})
+    patch_cache_control(response, public=True, max_age=300)
+    return response
+
+#bills whose text is closest to a bill's as json, most similar first (see
+#similar.py). other_states=1 leaves out bills from the same jurisdiction
+def similar(request, bill_id):
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), MAX_SIMILAR)
+    except ValueError:
+        limit = 10
+    other_states = request.GET.get('other_states') == '1'
+
+    store = get_similar_store()
+    matches = store.similar(bill_id, limit, other_states) if store else None
+    if matches is None:
+        return JsonResponse({'error': 'no such bill'}, status=404)
+
+    bills = Bill.objects.only('id', 'title', 'bill_number', 'state', 'url').in_bulk([match_id for match_id, _ in matches])
+    similar_bills = [{'id': match_id, 'title': bills[match_id].title, 'bill_number': bills[match_id].bill_number,
+        'state': bills[match_id].state, 'url': bills[match_id].url, 'score': round(score, 4)}
+        for match_id, score in matches if match_id in bills]
+
+    response = JsonResponse({'id': bill_id, 'similar': similar_bills})
+    patch_cache_control(response, public=True, max_age=300)
+    return response
+
+#homepage (not conditional, the search form has a csrf token)
 def home(request):
-    return render(request, 'search/home.html', 
-    {'num_bills': Bill.objects.count() + 1})
+    with phase('db'):
+        num_bills = total_bills() + 1
+    with phase('render'):
+        return render(request, 'search/home.html', {'num_bills': num_bills})
 
-#show results from search filters
-def results(request):
+#text query, url parameters kept in the page's links, filters and sort option
+#of a results request (filters is None when nothing was searched or filtered)
+def search_request(request):
 
     if request.method == "POST":
         searched = request.POST.get('searched', '')  
     else:
         searched = request.GET.get('q', '')
 
-    #get url based on query
-    base_url = reverse('results') 
+    #parameters kept in the page's links
     query_params = request.GET.copy()
 
     #handles search through POST instead of GET
     if searched:
         query_params['q'] = searched
     
-    #removes the page number (leaves it to the pagination operation)
-    if 'page' in query_params:
-        del query_params['page']
+    #removes the page number and cursors (leaves them to the pagination operation)
+    for pagination_param in ('page', 'after', 'before', 'last'):
+        if pagination_param in query_params:
+            del query_params[pagination_param]
 
     #removes csrf token from url
     if 'csrfmiddlewaretoken' in query_params:
         del query_params['csrfmiddlewaretoken']
 
     #check to see if any search filters have been applied, if not
-    #return a message to search
+    #the page shows a message to search
     if ((not searched) and (not request.GET.copy()) or (query_params.urlencode()=='q=&start_date=&end_date=')):
-        return render(request, 'search/results.html', {'no_search': True})
-    else:
-        no_search = False
-
-    sqs = SearchQuerySet()
+        return searched, query_params, None, None
 
-    results = sqs.all()
-
-    if searched:
-        try:    
-            #uses raw search, ordering is by relevance by default
-            #whoosh only gets highlights from the first 100000 chars
-            #could experiment with haystack bsoost to incorporate some
-            #relevance or make title count more
-            results = results.filter(content=Raw(searched)).highlight(highlight_query=Exact(searched))
-
-        except QueryParserError:
-            # Handle invalid query
-            results = SearchQuerySet().none()
-            error_message = "Invalid search query. Please check your syntax."
-
-    #filter start and end dates based on input
-    start_date = request.GET.get('start_date')
-    if start_date:
-        results = results.filter(status_date__gte=start_date)
-
-    end_date = request.GET.get('end_date')
-    if end_date:
-        results = results.filter(status_date__lte=end_date)
-    else:
-        #this makes queries with sort but no filters 10x faster for some reason
-        results = results.filter(status_date__lte=datetime.date.today())
-
-    #filter jurisdiction if selected
-    selected_states = request.GET.getlist('jurisdiction')
-    if selected_states:
-        results = results.filter(state__exact__in=selected_states)
-        #selecting virginia was also displaying west virginia
-        if (not 'West Virginia' in selected_states):
-            results = results.exclude(state='West Virginia')
-
-    #filter status if selected
-    selected_status = request.GET.getlist('status')
-    if selected_status:
-        results = results.filter(status__in=selected_status)
-
-    #filter collections if selected
-    selected_collections = request.GET.getlist('collection')
-    if selected_collections:
-        results = results.filter(content_collection__in=selected_collections)
-
-    selected_categories = request.GET.getlist('category')
-    if selected_categories:
-        filters = Q()
-        for category in selected_categories:
-            filters |= Q(**{f"{category}__gte": 3})
-        results = results.filter(filters)
-
-    selected_sectors = request.GET.getlist('sector')
-    if selected_sectors:
-        filters = Q()
-        for sector in selected_sectors:
-            filters |= Q(**{f"{sector}__gte": 3})
-        results = results.filter(filters)
+    #narrow down results with the sidebar filters
+    filters = get_filters(request.GET)
 
     #make relevance the default if a search term has been entered,
     #recency otherwise
@@ -150,59 +117,124 @@ def results(request):
         else:
             ordering = 'newest'
 
-    #ordering is relevance by default so no need to order by it
-    if ordering == 'oldest_status':
-        results = results.order_by('status_date')
-    elif ordering == 'newest_status':
-        results = results.order_by('-status_date')
-    elif ordering == 'oldest_action':
-        results = results.filter(content_collection='Legislation')
-        results = results.order_by('last_action_date')
-    elif ordering == 'newest_action':
-        results = results.filter(content_collection='Legislation')
-        results = results.filter(last_action_date__lte=datetime.date.today())
-        results = results.order_by('-last_action_date')
-    elif ordering == 'keyword':
-        results = results.order_by('-total_keywords')
-
-    num_results = results.count()
-
-    #pages of 20 items
-    p = Paginator(results, 20)
-    page = request.GET.get('page')
-    shown_bills = p.get_page(page)
-
-    #relevant information for the displaying html page
-    context = {
+    return searched, query_params, filters, ordering
+
+#relevant information for the displaying html page
+def results_context(searched, query_params, filters, ordering, shown_bills, num_results, facet_counts):
+    return {
         'searched': searched,
         'shown_bills': shown_bills,
         'num_results': num_results,
         'sort': ordering,
         'sidebar_search': searched,
-        'selected_status': selected_status,
-        'selected_collections': selected_collections,
-        'jurisdiction': selected_states,
-        'start_date': start_date,
-        'end_date': end_date,
-        'no_search': no_search,
-        'selected_categories': selected_categories,
-        'selected_sectors': selected_sectors
+        'selected_status': filters['status'],
+        'selected_collections': filters['collection'],
+        'jurisdiction': filters['jurisdiction'],
+        'start_date': filters['start_date'],
+        'end_date': filters['end_date'],
+        'no_search': False,
+        'selected_categories': filters['category'],
+        'selected_sectors': filters['sector'],
+        'facet_counts': facet_counts,
+        #encode the query in the url
+        'query_string': query_params.urlencode(),
     }
 
-    #information encoded in the url
-    params = {
-        'searched': searched,
-        'selected_states[]': [selected_states],
-        'sort': ordering,
-        'selected_status[]': [selected_status],
-        'jurisdiction[]': selected_states,
-        'start_date': start_date,
-        'end_date': end_date
-    }
+#counts shown next to each option in the sidebar, from the ids the page's
+#search matched when it kept them
+def timed_facet_counts(filters, ordering, searched, shown_bills=None):
+    with phase('facets'):
+        return get_facet_counts(filters, ordering, searched, getattr(shown_bills, 'matching_ids', None))
+
+#lists the others of each near-identical group under the bill shown for it
+#(the search already kept one bill per group, see clusters.py)
+def timed_cluster_members(shown_bills):
+    with phase('db'):
+        return add_cluster_members(shown_bills)
+
+#loads the content of the shown bills whose result cards aren't cached (the
+#cards are keyed on the bill's updated_at, so cached ones never read it)
+def timed_card_contents(shown_bills):
+    cards = caches['result_cards']
+    bills = [result.object for result in shown_bills.object_list]
+    with phase('cache'):
+        uncached = [bill for bill in bills if not cards.has_key(make_template_fragment_key('result_card', [bill.pk, bill.updated_at]))]
+    if uncached:
+        with phase('db'):
+            load_contents(uncached)
+
+def render_results(request, context):
+    with phase('render'):
+        return render(request, 'search/results.html', context)
+
+#a search cut short by the index's limits shouldn't be kept and revalidated
+#as if it were complete
+def finish_results(response, shown_bills):
+    if getattr(shown_bills, 'partial', False):
+        patch_cache_control(response, no_store=True)
+    return response
+
+#show results from search filters (repeated GETs for the same url get a 304
+#until the index changes, see conditional.py)
+@conditional_page
+def results(request):
+    searched, query_params, filters, ordering = search_request(request)
+    if filters is None:
+        return render(request, 'search/results.html', {'no_search': True,
+            'facet_counts': get_facet_counts(get_filters(request.GET))})
+
+    #pages of 20 items, from postgres or the whoosh index (see planner.py)
+    shown_bills = get_page(filters, ordering, request.GET, searched)
+    with phase('count'):
+        num_results = shown_bills.paginator.count
+    record('results', num_results)
 
-    #encode the query in the url
-    context['query_string'] = query_params.urlencode()
+    #json breakdown of the search for staff instead of the page (see explain.py)
+    if wants_explain(request):
+        return explain_response(request, filters, ordering, searched, shown_bills)
+
+    timed_cluster_members(shown_bills)
+    timed_card_contents(shown_bills)
+
+    #counts shown next to each option in the sidebar
+    facet_counts = timed_facet_counts(filters, ordering, searched, shown_bills)
 
     #load the results page with the relevant information
-    return render(request, 'search/results.html', context)
+    response = render_results(request, results_context(searched, query_params, filters, ordering, shown_bills, num_results, facet_counts))
+    return finish_results(response, shown_bills)
+
+#the results view for ASGI (used when ASYNC_RESULTS is on, see urls.py): the
+#page and the sidebar counts are computed at the same time in the search
+#threads, and a page from the whoosh index is split further (see
+#planner.get_page_async)
+@async_conditional_page
+async def results_async(request):
+    searched, query_params, filters, ordering = search_request(request)
+    if filters is None:
+        facet_counts = await parallel.run(get_facet_counts, get_filters(request.GET))
+        return await parallel.run(render, request, 'search/results.html', {'no_search': True, 'facet_counts': facet_counts})
+
+    #text searches of the indexes count the sidebar from the ids their page
+    #matched (see facets.get_facet_counts), otherwise both run at the same time
+    if searched and get_engine(searched, ordering) != 'database':
+        shown_bills = await get_page_async(filters, ordering, request.GET, searched)
+        facet_counts = await parallel.run(timed_facet_counts, filters, ordering, searched, shown_bills)
+    else:
+        shown_bills, facet_counts = await asyncio.gather(
+            get_page_async(filters, ordering, request.GET, searched),
+            parallel.run(timed_facet_counts, filters, ordering, searched),
+        )
+    num_results = shown_bills.paginator.count
+    record('results', num_results)
+
+    #json breakdown of the search for staff instead of the page (see explain.py),
+    #the user is only looked up for requests asking for one
+    if '_explain' in request.GET and await parallel.run(wants_explain, request):
+        return await parallel.run(explain_response, request, filters, ordering, searched, shown_bills)
+
+    await parallel.run(timed_cluster_members, shown_bills)
+    await parallel.run(timed_card_contents, shown_bills)
+    response = await parallel.run(render_results, request,
+        results_context(searched, query_params, filters, ordering, shown_bills, num_results, facet_counts))
+    return finish_results(response, shown_bills)
 
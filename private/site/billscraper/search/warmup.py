@@ -0,0 +1,56 @@
+#loads everything a search needs before the first request: the whoosh indexes,
+#the facet store, the suggestions, the similar bills, the corpus stats and the compiled templates.
+#Called by gunicorn in the master process when the app is preloaded (see
+#gunicorn.conf.py), so every forked worker starts with them in memory, shared
+#copy-on-write, instead of loading them on its first request
+
+import time
+
+from django.db import connections as db_connections
+from django.template.loader import get_template
+from haystack import connections
+
+from search.facets import get_store
+from search.suggest import get_suggester
+from search.similar import get_similar_store
+from search.stats import get_stats
+
+#templates rendered by the site's pages
+TEMPLATES = ['search/home.html', 'search/results.html', 'search/about.html']
+
+#sets up the backend of a haystack connection and reads its index once, so the
+#index files are in the page cache
+def open_index(alias):
+    backend = connections[alias].get_backend()
+    if not backend.setup_complete:
+        backend.setup()
+    if backend.index.doc_count():
+        with backend.index.searcher() as searcher:
+            searcher.reader().doc_count()
+
+def load_templates():
+    for name in TEMPLATES:
+        get_template(name)
+
+#runs each step and returns how long it took ({step: milliseconds}). Database
+#connections are closed at the end so forked workers don't share them
+def warm_up():
+    steps = {
+        'index': lambda: open_index('default'),
+        'passages': lambda: open_index('passages'),
+        'facets': get_store,
+        'suggestions': get_suggester,
+        'similar': get_similar_store,
+        'stats': get_stats,
+        'templates': load_templates,
+    }
+
+    timings = {}
+    try:
+        for name, step in steps.items():
+            started = time.perf_counter()
+            step()
+            timings[name] = round((time.perf_counter() - started) * 1000, 2)
+    finally:
+        db_connections.close_all()
+    return timings